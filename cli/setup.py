@@ -49,6 +49,10 @@ setup(
         'urllib3 >= 1.23',
     ],
     extras_require={
+        # Faster decoding of large responses, such as the history
+        'msgpack': ['msgpack >= 0.5.6'],
+        # `AsyncControllerProxy`, to drive many executions from one process
+        'async': ['aiohttp >= 3.4'],
         'test': [
             'flake8==3.5.0',
             'nose==1.3.7',
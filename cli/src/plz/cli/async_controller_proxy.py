@@ -0,0 +1,417 @@
+import asyncio
+import json
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Tuple
+
+import requests
+
+from plz.cli.async_server import AsyncServer, read_for_exception
+from plz.cli.controller_proxy import STRUCTURED_HEADERS, is_json, \
+    is_msgpack
+from plz.cli.exceptions import CLIException, \
+    NotSupportedByControllerException, RequestException
+from plz.controller.api import Controller
+from plz.controller.api.exceptions import ResponseHandledException
+from plz.controller.api.framing import Frame, FrameDecoder
+from plz.controller.api.server_sent_events import EventDecoder
+from plz.controller.api.types import InputMetadata, JSONString
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class AsyncControllerProxy(Controller):
+    """Same as `ControllerProxy`, but every method is a coroutine, so that
+       one process can drive many executions at the same time:
+
+           async with AsyncControllerProxy(AsyncServer(...)) as controller:
+               statuses = await asyncio.gather(
+                   *(controller.get_status(i) for i in execution_ids))
+
+       Methods that stream return once the response starts, with an
+       asynchronous iterator over the rest. Iterate it to the end (or close
+       it) to give the connection back."""
+
+    def __init__(self, server: AsyncServer):
+        self.server = server
+
+    async def __aenter__(self) -> 'AsyncControllerProxy':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.server.close()
+
+    @classmethod
+    def handle_exception(cls, exception: ResponseHandledException):
+        pass
+
+    async def ping(self, ping_timeout: int,
+                   build_timestamp: Optional[int] = None) -> dict:
+        response = await self.server.get(
+            'ping', timeout=aiohttp.ClientTimeout(total=ping_timeout))
+        async with response:
+            if response.status == requests.codes.ok:
+                return await response.json()
+            return {}
+
+    async def run_execution(
+            self, command: [str], snapshot_id: str, parameters: dict,
+            instance_market_spec: dict, execution_spec: dict,
+            start_metadata: dict) -> AsyncIterator[dict]:
+        response = await self.server.post(
+            'executions',
+            json={
+                'command': command,
+                'snapshot_id': snapshot_id,
+                'parameters': parameters,
+                'execution_spec': execution_spec,
+                'instance_market_spec': instance_market_spec,
+                'start_metadata': start_metadata
+            })
+        await _check_status(response, requests.codes.accepted)
+        return _json_lines(response)
+
+    async def rerun_execution(
+            self, user: str, project: str,
+            instance_max_uptime_in_minutes: Optional[int],
+            previous_execution_id: str,
+            instance_market_spec: dict) -> AsyncIterator[dict]:
+        response = await self.server.post(
+            'executions', 'rerun',
+            json={'user': user,
+                  'project': project,
+                  'execution_id': previous_execution_id,
+                  'instance_market_spec': instance_market_spec})
+        await _check_status(response, requests.codes.accepted)
+        return _json_lines(response)
+
+    async def list_executions(self) -> [dict]:
+        response = await self.server.get(
+            'executions', 'list', headers=STRUCTURED_HEADERS)
+        await _check_status(response, requests.codes.ok)
+        return (await _decode_structured(response))['executions']
+
+    async def get_status(self, execution_id: str) -> dict:
+        response = await self.server.get(
+            'executions', execution_id, 'status')
+        await _check_status(response, requests.codes.ok)
+        return await _json(response)
+
+    async def get_statuses(self, execution_ids: List[str]) \
+            -> Dict[str, dict]:
+        response = await self.server.post(
+            'executions', 'status',
+            json={'execution_ids': execution_ids})
+        await _check_status(response, requests.codes.ok)
+        return (await _json(response))['statuses']
+
+    async def get_logs(self, execution_id: str, since: Optional[int]) \
+            -> AsyncIterator[bytes]:
+        response = await self.server.get(
+            'executions', execution_id, 'logs',
+            params={'since': since})
+        await _check_status(response, requests.codes.ok)
+        return _chunks(response)
+
+    async def get_multiplexed_logs(
+            self, execution_ids: List[str], since: Optional[int],
+            offsets: Optional[Dict[str, int]] = None) \
+            -> AsyncIterator[Frame]:
+        response = await self.server.post(
+            'executions', 'logs',
+            json={'execution_ids': execution_ids,
+                  'since': since,
+                  'offsets': offsets})
+        await _check_status(response, requests.codes.ok)
+        return _frames(response)
+
+    async def get_execution_events(
+            self, last_event_id: Optional[str] = None,
+            execution_ids: Optional[List[str]] = None) \
+            -> AsyncIterator[dict]:
+        response = await self.server.get(
+            'executions', 'events',
+            params={'execution_id': execution_ids or [],
+                    'last_event_id': last_event_id})
+        await _check_status(response, requests.codes.ok)
+        return _events(response)
+
+    async def get_output_files(self, execution_id: str,
+                               paths: Optional[List[str]] = None,
+                               globs: Optional[List[str]] = None) \
+            -> AsyncIterator[bytes]:
+        response = await self.server.get(
+            'executions', execution_id, 'output', 'files',
+            params={'path': paths or [], 'glob': globs or []})
+        await _check_status(response, requests.codes.ok)
+        return _chunks(response)
+
+    async def get_measures(
+            self, execution_id: str, summary: bool) \
+            -> AsyncIterator[JSONString]:
+        response = await self.server.get(
+            'executions', execution_id, 'measures',
+            params={'summary': summary},
+            codes_with_exceptions={requests.codes.conflict})
+        await _check_status(response, requests.codes.ok)
+        return _text_lines(response)
+
+    async def delete_execution(self, execution_id: str, fail_if_running: bool,
+                               fail_if_deleted: bool) -> None:
+        response = await self.server.delete(
+            'executions', execution_id,
+            params={
+                'fail_if_deleted': fail_if_deleted,
+                'fail_if_running': fail_if_running,
+            },
+            codes_with_exceptions={
+                requests.codes.expectation_failed, requests.codes.conflict})
+        await _check_status(response, requests.codes.no_content)
+        response.release()
+
+    async def finalize_execution(self, execution_id: str) \
+            -> AsyncIterator[Frame]:
+        """:raises NotSupportedByControllerException:"""
+        response = await self.server.post(
+            'executions', execution_id, 'finalize',
+            codes_with_exceptions={
+                requests.codes.conflict, requests.codes.gone})
+        if response.status == requests.codes.not_found and \
+                not is_json(response):
+            response.release()
+            raise NotSupportedByControllerException()
+        await _check_status(response, requests.codes.ok)
+        return _frames(response)
+
+    async def get_history(self, user: str, project: str,
+                          limit: Optional[int] = None,
+                          before: Optional[int] = None,
+                          after: Optional[int] = None,
+                          before_execution_id: Optional[str] = None,
+                          after_execution_id: Optional[str] = None) \
+            -> AsyncIterator[JSONString]:
+        response = await self.server.get(
+            'executions', user, project, 'history',
+            params={'limit': limit, 'before': before, 'after': after,
+                    'before_execution_id': before_execution_id,
+                    'after_execution_id': after_execution_id})
+        await _check_status(response, requests.codes.ok)
+        return _text_lines(response)
+
+    async def get_history_entries(
+            self, user: str, project: str, limit: Optional[int] = None,
+            before: Optional[int] = None, after: Optional[int] = None,
+            before_execution_id: Optional[str] = None,
+            after_execution_id: Optional[str] = None) \
+            -> AsyncIterator[Tuple[str, dict]]:
+        response = await self.server.get(
+            'executions', user, project, 'history',
+            params={'limit': limit, 'before': before, 'after': after,
+                    'before_execution_id': before_execution_id,
+                    'after_execution_id': after_execution_id},
+            headers=STRUCTURED_HEADERS)
+        await _check_status(response, requests.codes.ok)
+        return _history_entries(response)
+
+    async def create_snapshot(self, image_metadata: dict,
+                              context: BinaryIO) \
+            -> AsyncIterator[JSONString]:
+        metadata_bytes = json.dumps(image_metadata).encode('utf-8')
+        response = await self.server.post(
+            'snapshots',
+            data=_upload(metadata_bytes + b'\n', context))
+        await _check_status(response, requests.codes.ok)
+
+        async def fragments() -> AsyncIterator[JSONString]:
+            async for chunk in _chunks(response):
+                yield chunk.decode('utf-8')
+        return fragments()
+
+    async def put_input(self, input_id: str, input_metadata: InputMetadata,
+                        input_data_stream: BinaryIO) -> None:
+        response = await self.server.put(
+            'data', 'input', input_id,
+            data=_upload(b'', input_data_stream),
+            params={'user': input_metadata.user,
+                    'project': input_metadata.project,
+                    'path': input_metadata.path,
+                    'timestamp_millis': input_metadata.timestamp_millis})
+        await _check_status(response, requests.codes.ok)
+        if input_id != (await _json(response))['id']:
+            raise CLIException('Got wrong input id back from the server')
+
+    async def check_input_data(self, input_id: str,
+                               metadata: InputMetadata) -> bool:
+        response = await self.server.head(
+            'data', 'input', input_id,
+            codes_with_exceptions={requests.codes.bad_request},
+            params={
+                'user': metadata.user,
+                'project': metadata.project,
+                'path': metadata.path,
+                'timestamp_millis': metadata.timestamp_millis
+            })
+        if response.status == requests.codes.ok:
+            response.release()
+            return True
+        elif response.status == requests.codes.not_found:
+            response.release()
+            return False
+        else:
+            raise RequestException(await read_for_exception(response))
+
+    async def get_input_id_or_none(self, metadata: InputMetadata) \
+            -> Optional[str]:
+        response = await self.server.get(
+            'data', 'input', 'id',
+            params={'user': metadata.user,
+                    'project': metadata.project,
+                    'path': metadata.path,
+                    'timestamp_millis': metadata.timestamp_millis})
+        await _check_status(response, requests.codes.ok)
+        return (await _json(response))['id']
+
+    async def delete_input_data(self, input_id: str):
+        response = await self.server.delete('data', 'input', input_id)
+        await _check_status(response, requests.codes.ok)
+        response.release()
+
+    async def get_user_last_execution_id(self, user: str) -> Optional[str]:
+        response = await self.server.get(
+            'users', user, 'last_execution_id')
+        await _check_status(response, requests.codes.ok)
+        response_object = await _json(response)
+        if 'execution_id' in response_object:
+            return response_object['execution_id']
+        else:
+            raise ValueError('Expected an execution ID')
+
+    async def kill_instances(
+            self, instance_ids: Optional[List[str]], force_if_not_idle: bool) \
+            -> bool:
+        instance_ids = instance_ids if instance_ids is not None else []
+        response = await self.server.post(
+            'instances', 'kill',
+            json={
+                'all_of_them_plz': instance_ids == [],
+                'instance_ids': instance_ids,
+                'force_if_not_idle': force_if_not_idle
+            },
+            codes_with_exceptions={requests.codes.conflict})
+        await _check_status(response, requests.codes.ok)
+        return (await _json(response))['were_there_instances_to_kill']
+
+    async def describe_execution_entrypoint(self, execution_id: str) -> dict:
+        response = await self.server.get(
+            'executions', 'describe', execution_id,
+            headers=STRUCTURED_HEADERS)
+        await _check_status(response, requests.codes.ok)
+        return await _decode_structured(response)
+
+
+async def _check_status(response: 'aiohttp.ClientResponse',
+                        expected_status: int):
+    if response.status != expected_status:
+        raise RequestException(await read_for_exception(response))
+
+
+async def _json(response: 'aiohttp.ClientResponse'):
+    # Don't insist on the content type, as `requests` doesn't
+    async with response:
+        return await response.json(content_type=None)
+
+
+async def _decode_structured(response: 'aiohttp.ClientResponse'):
+    async with response:
+        if is_msgpack(response):
+            return msgpack.unpackb(await response.read(), raw=False)
+        return await response.json(content_type=None)
+
+
+async def _chunks(response: 'aiohttp.ClientResponse') \
+        -> AsyncIterator[bytes]:
+    """Chunks of the body as they arrive"""
+    async with response:
+        async for chunk in response.content.iter_any():
+            yield chunk
+
+
+async def _lines(response: 'aiohttp.ClientResponse') -> AsyncIterator[bytes]:
+    # Not `async for line in response.content`, which fails for lines longer
+    # than its buffer
+    pending = b''
+    async for chunk in _chunks(response):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if pending:
+        yield pending
+
+
+async def _text_lines(response: 'aiohttp.ClientResponse') \
+        -> AsyncIterator[str]:
+    async for line in _lines(response):
+        yield line.decode('utf-8')
+
+
+async def _json_lines(response: 'aiohttp.ClientResponse') \
+        -> AsyncIterator[dict]:
+    async for line in _lines(response):
+        if line.strip():
+            yield json.loads(line)
+
+
+async def _frames(response: 'aiohttp.ClientResponse') \
+        -> AsyncIterator[Frame]:
+    decoder = FrameDecoder()
+    async for chunk in _chunks(response):
+        for frame in decoder.feed(chunk):
+            yield frame
+    decoder.finish()
+
+
+async def _events(response: 'aiohttp.ClientResponse') \
+        -> AsyncIterator[dict]:
+    decoder = EventDecoder()
+    async for line in _text_lines(response):
+        event = decoder.feed_line(line.rstrip('\r\n'))
+        if event is not None:
+            yield event
+
+
+async def _history_entries(response: 'aiohttp.ClientResponse') \
+        -> AsyncIterator[Tuple[str, dict]]:
+    if is_msgpack(response):
+        unpacker = msgpack.Unpacker(raw=False)
+        async for chunk in _chunks(response):
+            unpacker.feed(chunk)
+            for execution_id, metadata in unpacker:
+                yield execution_id, metadata
+    else:
+        for entry in (await _json(response)).items():
+            yield entry
+
+
+async def _upload(prefix: bytes, stream: BinaryIO) -> AsyncIterator[bytes]:
+    # Reading files blocks, so do it out of the event loop
+    loop = asyncio.get_event_loop()
+    if prefix:
+        yield prefix
+    while True:
+        chunk = await loop.run_in_executor(
+            None, stream.read, _UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
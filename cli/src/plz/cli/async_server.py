@@ -0,0 +1,156 @@
+import asyncio
+import functools
+import json
+from typing import Any, Optional, Set
+
+from plz.cli.configuration import Configuration
+from plz.cli.exceptions import CLIException, RequestException
+from plz.cli.ssh_session import PLZ_SSH_SCHEMA, SSHTunnel
+from plz.controller.api.types import ACCEPT_COMPRESSED_HEADER
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+DEFAULT_MAX_CONNECTIONS = 100
+
+
+class AsyncServer:
+    """Same as `Server`, but for asyncio.
+
+       All requests share a pool of at most `max_connections` connections,
+       so the server must be closed once done with it (or used in an
+       `async with`)."""
+
+    @staticmethod
+    def from_configuration(
+            configuration: Configuration, exception_names_to_classes: dict,
+            max_connections: int = DEFAULT_MAX_CONNECTIONS):
+        return AsyncServer(
+            host=configuration.host,
+            port=configuration.port,
+            connection_info=configuration.connection_info,
+            exception_names_to_classes=exception_names_to_classes,
+            max_connections=max_connections)
+
+    def __init__(self, host: str, port: int,
+                 exception_names_to_classes: Optional[dict] = None,
+                 connection_info: Optional[dict] = None,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS):
+        if aiohttp is None:
+            raise CLIException(
+                'The asynchronous proxy needs aiohttp. You can install it '
+                'with `pip install plz-cli[async]`')
+        self.exceptions_names_to_classes = exception_names_to_classes or {}
+        connection_info = connection_info or {}
+        self.tunnel: Optional[SSHTunnel] = None
+        if connection_info.get('schema', 'http') == PLZ_SSH_SCHEMA:
+            # aiohttp can't send requests through SSH channels, so we give it
+            # a local socket that forwards to the controller
+            self.tunnel = SSHTunnel(host, port, connection_info)
+        self.prefix = f'http://{host}:{port}'
+        self.max_connections = max_connections
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> 'AsyncServer':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.tunnel is not None:
+            self.tunnel.close()
+
+    async def request(self, method: str, *path_segments: str,
+                      codes_with_exceptions: Optional[Set[int]] = None,
+                      params: Optional[dict] = None, **kwargs) \
+            -> 'aiohttp.ClientResponse':
+        """Sends the request and returns once the headers arrive. The caller
+           must read the body or release the response, so that the
+           connection goes back to the pool"""
+        codes_with_exceptions = codes_with_exceptions or set()
+        url = self.prefix + '/' + '/'.join(path_segments)
+        try:
+            response = await self._get_session().request(
+                method, url, params=_query(params or {}), **kwargs)
+        except aiohttp.ClientConnectionError as e:
+            raise CLIException(
+                'We couldn\'t establish a connection to the server.') from e
+        except asyncio.TimeoutError as e:
+            raise CLIException(
+                'Our connection to the server timed out.') from e
+        await self._maybe_raise_exception(response, codes_with_exceptions)
+        return response
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        # Created lazily, as sessions belong to the running event loop
+        if self.session is None:
+            if self.tunnel is not None:
+                connector = aiohttp.UnixConnector(
+                    self.tunnel.socket_path, limit=self.max_connections)
+            else:
+                connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                # aiohttp decodes every response
+                headers={ACCEPT_COMPRESSED_HEADER: 'true'},
+                # Logs and events stream for as long as executions run
+                timeout=aiohttp.ClientTimeout(total=None))
+        return self.session
+
+    async def _maybe_raise_exception(
+            self, response: 'aiohttp.ClientResponse',
+            codes_with_exceptions: Set[int]):
+        if response.status not in codes_with_exceptions:
+            return
+        read_response = await read_for_exception(response)
+        try:
+            response_json = read_response.json()
+            assert isinstance(response_json, dict)
+            exception_class = self.exceptions_names_to_classes[
+                response_json['exception_type']]
+            del response_json['exception_type']
+        except Exception as e:
+            raise RequestException(read_response) from e
+        raise exception_class(**response_json)
+
+    delete = functools.partialmethod(request, 'DELETE')
+    get = functools.partialmethod(request, 'GET')
+    head = functools.partialmethod(request, 'HEAD')
+    post = functools.partialmethod(request, 'POST')
+    put = functools.partialmethod(request, 'PUT')
+
+
+class ReadResponse:
+    """What `RequestException` needs from a `requests.Response`, for an
+       aiohttp response that we've read already"""
+
+    def __init__(self, status_code: int, text: str):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+
+async def read_for_exception(response: 'aiohttp.ClientResponse') \
+        -> ReadResponse:
+    try:
+        return ReadResponse(response.status, await response.text())
+    finally:
+        response.release()
+
+
+def _query(params: dict) -> [tuple]:
+    # Unlike requests, aiohttp takes only strings and numbers, and doesn't
+    # drop `None`
+    query = []
+    for key, value in params.items():
+        values = value if isinstance(value, list) else [value]
+        query.extend((key, str(v)) for v in values if v is not None)
+    return query
@@ -1,15 +1,33 @@
 import io
 import itertools
 import json
-from typing import BinaryIO, Iterator, List, Optional
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
 
 import requests
 
-from plz.cli.exceptions import CLIException, RequestException
+from plz.cli.exceptions import CLIException, \
+    NotSupportedByControllerException, RequestException
+from plz.cli.resumable_download import ACCEPT_ENCODING_HEADERS, \
+    download_to_file, is_resumable, iter_lines, iter_resuming
 from plz.cli.server import Server
 from plz.controller.api import Controller
 from plz.controller.api.exceptions import ResponseHandledException
-from plz.controller.api.types import InputMetadata, JSONString
+from plz.controller.api.framing import Frame, decode_frames
+from plz.controller.api.server_sent_events import decode_events
+from plz.controller.api.types import InputMetadata, JSONString, \
+    MSGPACK_MIMETYPE
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Ask for msgpack in structured responses, if we can decode it
+if msgpack is not None:
+    STRUCTURED_HEADERS = {
+        'Accept': f'{MSGPACK_MIMETYPE}, application/json;q=0.9'}
+else:
+    STRUCTURED_HEADERS = {'Accept': 'application/json'}
 
 
 class ControllerProxy(Controller):
@@ -60,9 +78,10 @@ class ControllerProxy(Controller):
         return (json.loads(line) for line in response.iter_lines())
 
     def list_executions(self) -> [dict]:
-        response = self.server.get('executions', 'list')
+        response = self.server.get(
+            'executions', 'list', headers=STRUCTURED_HEADERS)
         _check_status(response, requests.codes.ok)
-        return json.loads(response.content)['executions']
+        return _decode_structured(response)['executions']
 
     def get_status(self, execution_id: str) -> dict:
         response = self.server.get(
@@ -70,21 +89,82 @@ class ControllerProxy(Controller):
         _check_status(response, requests.codes.ok)
         return response.json()
 
+    def get_statuses(self, execution_ids: List[str]) -> Dict[str, dict]:
+        response = self.server.post(
+            'executions', 'status',
+            json={'execution_ids': execution_ids})
+        _check_status(response, requests.codes.ok)
+        return response.json()['statuses']
+
     def get_logs(self, execution_id: str, since: Optional[int]) \
             -> Iterator[bytes]:
-        response = self.server.get(
-            'executions', execution_id, 'logs',
-            params={'since': since} if since is not None else {},
+        def request(headers: Dict[str, str]) -> requests.Response:
+            return self.server.get(
+                'executions', execution_id, 'logs',
+                params={'since': since} if since is not None else {},
+                headers={**ACCEPT_ENCODING_HEADERS, **headers},
+                stream=True)
+
+        response = request({})
+        _check_status(response, requests.codes.ok)
+        if is_resumable(response):
+            # Logs of finished executions, which we can resume if the
+            # connection breaks
+            return iter_lines(iter_resuming(request, response))
+        return _decoded_raw(response)
+
+    def get_multiplexed_logs(
+            self, execution_ids: List[str], since: Optional[int],
+            offsets: Optional[Dict[str, int]] = None) -> Iterator[Frame]:
+        response = self.server.post(
+            'executions', 'logs',
+            json={'execution_ids': execution_ids,
+                  'since': since,
+                  'offsets': offsets},
             stream=True)
         _check_status(response, requests.codes.ok)
-        return response.raw
+        return decode_frames(response.iter_content(chunk_size=None))
 
-    def get_output_files(self, execution_id: str) -> Iterator[bytes]:
+    def get_execution_events(
+            self, last_event_id: Optional[str] = None,
+            execution_ids: Optional[List[str]] = None) -> Iterator[dict]:
+        params = {'execution_id': execution_ids or []}
+        if last_event_id is not None:
+            params['last_event_id'] = last_event_id
+        response = self.server.get(
+            'executions', 'events', params=params, stream=True)
+        _check_status(response, requests.codes.ok)
+        return decode_events(
+            line.decode('utf-8') for line in response.iter_lines())
+
+    def get_output_files(self, execution_id: str,
+                         paths: Optional[List[str]] = None,
+                         globs: Optional[List[str]] = None) \
+            -> Iterator[bytes]:
         response = self.server.get(
             'executions', execution_id, 'output', 'files',
+            params={'path': paths or [], 'glob': globs or []},
             stream=True)
         _check_status(response, requests.codes.ok)
-        return response.raw
+        return _decoded_raw(response)
+
+    def download_output_files(self, execution_id: str, part_path: str) \
+            -> None:
+        """Downloads the output tarball into `part_path`, resuming a
+           previous download if possible. See `download_to_file`"""
+        def request(headers: Dict[str, str]) -> requests.Response:
+            response = self.server.get(
+                'executions', execution_id, 'output', 'files',
+                headers={**ACCEPT_ENCODING_HEADERS, **headers},
+                stream=True)
+            # Ranges aren't satisfiable when the part is complete already
+            if response.status_code not in (
+                    requests.codes.partial_content,
+                    requests.codes.requested_range_not_satisfiable):
+                _check_status(response, requests.codes.ok)
+            return response
+
+        download_to_file(request, part_path)
 
     def get_measures(
             self, execution_id: str, summary: bool) -> Iterator[JSONString]:
@@ -94,7 +174,7 @@ class ControllerProxy(Controller):
             stream=True,
             codes_with_exceptions={requests.codes.conflict})
         _check_status(response, requests.codes.ok)
-        return (line.decode('utf-8') for line in response.raw)
+        return (line.decode('utf-8') for line in _decoded_raw(response))
 
     def delete_execution(self, execution_id: str, fail_if_running: bool,
                          fail_if_deleted: bool) -> None:
@@ -108,11 +188,61 @@ class ControllerProxy(Controller):
                 requests.codes.expectation_failed, requests.codes.conflict})
         _check_status(response, requests.codes.no_content)
 
-    def get_history(self, user: str, project: str) -> Iterator[JSONString]:
+    def finalize_execution(self, execution_id: str) -> Iterator[Frame]:
+        """:raises NotSupportedByControllerException:"""
+        response = self.server.post(
+            'executions', execution_id, 'finalize',
+            stream=True,
+            codes_with_exceptions={
+                requests.codes.conflict, requests.codes.gone})
+        if response.status_code == requests.codes.not_found and \
+                not is_json(response):
+            # Not an exception about the execution, but the default response
+            # for a missing entrypoint
+            raise NotSupportedByControllerException()
+        _check_status(response, requests.codes.ok)
+        return decode_frames(response.iter_content(chunk_size=None))
+
+    def get_history(self, user: str, project: str,
+                    limit: Optional[int] = None,
+                    before: Optional[int] = None,
+                    after: Optional[int] = None,
+                    before_execution_id: Optional[str] = None,
+                    after_execution_id: Optional[str] = None) \
+            -> Iterator[JSONString]:
+        params = {'limit': limit, 'before': before, 'after': after,
+                  'before_execution_id': before_execution_id,
+                  'after_execution_id': after_execution_id}
         response = self.server.get(
-            'executions', user, project, 'history', stream=True)
+            'executions', user, project, 'history',
+            params={k: v for k, v in params.items() if v is not None},
+            stream=True)
         _check_status(response, requests.codes.ok)
-        return (line.decode('utf-8') for line in response.raw)
+        return (line.decode('utf-8') for line in _decoded_raw(response))
+
+    def get_history_entries(
+            self, user: str, project: str, limit: Optional[int] = None,
+            before: Optional[int] = None, after: Optional[int] = None,
+            before_execution_id: Optional[str] = None,
+            after_execution_id: Optional[str] = None) \
+            -> Iterator[Tuple[str, dict]]:
+        params = {'limit': limit, 'before': before, 'after': after,
+                  'before_execution_id': before_execution_id,
+                  'after_execution_id': after_execution_id}
+        response = self.server.get(
+            'executions', user, project, 'history',
+            params={k: v for k, v in params.items() if v is not None},
+            headers=STRUCTURED_HEADERS,
+            stream=True)
+        _check_status(response, requests.codes.ok)
+        if is_msgpack(response):
+            unpacker = msgpack.Unpacker(raw=False)
+            for chunk in response.iter_content(chunk_size=None):
+                unpacker.feed(chunk)
+                for execution_id, metadata in unpacker:
+                    yield execution_id, metadata
+        else:
+            yield from json.loads(response.content).items()
 
     def create_snapshot(self, image_metadata: dict, context: BinaryIO) -> \
             Iterator[JSONString]:
@@ -126,7 +256,7 @@ class ControllerProxy(Controller):
             data=request_data,
             stream=True)
         _check_status(response, requests.codes.ok)
-        return (frag.decode('utf-8') for frag in response.raw)
+        return (frag.decode('utf-8') for frag in _decoded_raw(response))
 
     def put_input(self, input_id: str, input_metadata: InputMetadata,
                   input_data_stream: BinaryIO) -> None:
@@ -206,11 +336,35 @@ class ControllerProxy(Controller):
 
     def describe_execution_entrypoint(self, execution_id: str) -> dict:
         response = self.server.get(
-            'executions', 'describe', execution_id, stream=True)
+            'executions', 'describe', execution_id,
+            headers=STRUCTURED_HEADERS)
         _check_status(response, requests.codes.ok)
-        return response.json()
+        return _decode_structured(response)
 
 
 def _check_status(response: requests.Response, expected_status: int):
     if response.status_code != expected_status:
         raise RequestException(response)
+
+
+def _decoded_raw(response: requests.Response) -> BinaryIO:
+    # Unlike the rest of the response API, the raw stream isn't decoded
+    # according to the `Content-Encoding` unless we ask for it
+    response.raw.decode_content = True
+    return response.raw
+
+
+def is_json(response: requests.Response) -> bool:
+    return response.headers.get('Content-Type', '') \
+        .startswith('application/json')
+
+
+def is_msgpack(response: requests.Response) -> bool:
+    return response.headers.get('Content-Type', '') \
+        .startswith(MSGPACK_MIMETYPE)
+
+
+def _decode_structured(response: requests.Response):
+    if is_msgpack(response):
+        return msgpack.unpackb(response.content, raw=False)
+    return response.json()
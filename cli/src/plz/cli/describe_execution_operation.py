@@ -1,12 +1,14 @@
 import json
-from typing import Optional
+from typing import List, Optional
+
+from prettytable import PrettyTable
 
 from plz.cli.configuration import Configuration
 from plz.cli.operation import Operation
 
 
 class DescribeExecutionOperation(Operation):
-    """Print metadata about an execution"""
+    """Print metadata about an execution, and where it spent its time"""
 
     @classmethod
     def name(cls):
@@ -26,3 +28,27 @@ class DescribeExecutionOperation(Operation):
             self.get_execution_id()
         )
         print(json.dumps(description['start_metadata'], indent=2))
+        # Older controllers don't record spans
+        spans = description.get('snapshot_spans', []) + \
+            description.get('spans', [])
+        if len(spans) > 0:
+            print(phases_table(spans))
+
+
+def phases_table(spans: List[dict]) -> PrettyTable:
+    """A row per span, in the order they started, with the spans inside
+       others indented under them"""
+    spans_by_id = {s['id']: s for s in spans}
+
+    def depth(span: dict) -> int:
+        parent = spans_by_id.get(span['parent_id'])
+        return 0 if parent is None else depth(parent) + 1
+
+    table = PrettyTable(['Phase', 'Seconds', 'Error'])
+    table.align['Phase'] = 'l'
+    table.align['Seconds'] = 'r'
+    for span in sorted(spans, key=lambda s: s['start']):
+        table.add_row(['  ' * depth(span) + span['name'],
+                       f'{span["duration"]:.2f}',
+                       span.get('error', '')])
+    return table
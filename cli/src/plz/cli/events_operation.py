@@ -0,0 +1,44 @@
+import json
+from typing import List, Optional
+
+from plz.cli.configuration import Configuration
+from plz.cli.log import log_info
+from plz.cli.operation import Operation, on_exception_reraise
+
+
+class EventsOperation(Operation):
+    """Output events of executions (created, exited, published...) as they
+       happen"""
+
+    @classmethod
+    def name(cls):
+        return 'events'
+
+    @classmethod
+    def prepare_argument_parser(cls, parser, args):
+        parser.add_argument(
+            '-e', '--execution-ids', nargs='+', metavar='EXECUTION_ID',
+            help='Show only the events of these executions')
+        parser.add_argument(
+            '--last-event-id', default=None,
+            help='Start after the event with this ID, instead of with the '
+                 'events from now on')
+
+    def __init__(self, configuration: Configuration,
+                 execution_ids: Optional[List[str]] = None,
+                 last_event_id: Optional[str] = None):
+        super().__init__(configuration)
+        self.execution_ids = execution_ids
+        self.last_event_id = last_event_id
+
+    @on_exception_reraise('Following the events failed.')
+    def follow_events(self):
+        events = self.controller.get_execution_events(
+            last_event_id=self.last_event_id,
+            execution_ids=self.execution_ids)
+        for event in events:
+            print(json.dumps(event), flush=True)
+
+    def run(self):
+        log_info('Following events...')
+        self.follow_events()
@@ -37,3 +37,8 @@ class RequestException(Exception):
             f'Request failed with status code {response.status_code}.\n' +
             f'Response:\n{body}'
         )
+
+
+class NotSupportedByControllerException(Exception):
+    """The controller is older than the CLI and can't do what we asked"""
+    pass
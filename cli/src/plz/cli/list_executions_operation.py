@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Optional
 
 from prettytable import PrettyTable
 
@@ -18,7 +19,8 @@ class ListExecutionsOperation(Operation):
 
     def run(self):
         table = PrettyTable(['Execution Id', 'Instance Id', 'Running',
-                             'Status', 'Type', 'Idle since', 'Disposal time'])
+                             'Status', 'Type', 'Idle since', 'Disposal time',
+                             'Publication'])
         executions = self.controller.list_executions()
         for execution in executions:
             execution_id = execution['execution_id']
@@ -34,10 +36,25 @@ class ListExecutionsOperation(Operation):
             else:
                 idle_since = ''
                 disposal_time = ''
+            # Not sent by older controllers
+            publication = format_publication(execution.get('publication'))
             table.add_row([execution_id, instance_id, running, status,
-                           instance_type, idle_since, disposal_time])
+                           instance_type, idle_since, disposal_time,
+                           publication])
         print(table)
 
 
+def format_publication(publication: Optional[dict]) -> str:
+    """How far publishing the results is, as in `Publications`"""
+    if publication is None:
+        return ''
+    text = publication['state']
+    if publication['state'] == 'publishing':
+        text += f' ({publication["bytes"] / 2 ** 20:.0f} MB)'
+    if 'error' in publication:
+        text += f', retrying after {publication["error"]}'
+    return text
+
+
 def _timestamp_to_string(timestamp: int) -> str:
     return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
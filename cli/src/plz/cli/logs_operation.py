@@ -1,11 +1,13 @@
+import json
 import time
-from typing import Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import dateutil.parser
 
 from plz.cli.configuration import Configuration
-from plz.cli.log import log_info
+from plz.cli.log import log_error, log_info
 from plz.cli.operation import Operation, on_exception_reraise
+from plz.controller.api.framing import Frame
 
 
 class LogsOperation(Operation):
@@ -23,18 +25,55 @@ class LogsOperation(Operation):
             help='Specify a start time for the log output. Unfilled fields are'
                  'assumed to be same as of current time: `10:30` is today\'s '
                  '10:30. Use `start` to print all logs')
+        parser.add_argument(
+            '-m', '--multiple', dest='execution_ids', nargs='+',
+            metavar='EXECUTION_ID',
+            help='Follow the logs of several executions at the same time. '
+                 'Each line is prefixed with its execution ID')
 
     def __init__(self,
                  configuration: Configuration,
                  since: Optional[str],
-                 execution_id: Optional[str] = None):
+                 execution_id: Optional[str] = None,
+                 execution_ids: Optional[List[str]] = None):
         super().__init__(configuration)
         self.execution_id = execution_id
+        self.execution_ids = execution_ids
         self.since = since
 
     @on_exception_reraise("Displaying the logs failed.")
     def display_logs(self, execution_id: str, print_interrupt_message=False):
         log_info('Streaming logs...')
+        since_timestamp = self._get_since_timestamp()
+        byte_lines = self.controller.get_logs(
+            self.get_execution_id(), since=since_timestamp)
+        try:
+            for byte_line in byte_lines:
+                print(byte_line.decode('utf-8'), end='', flush=True)
+        except KeyboardInterrupt:
+            print()
+            if print_interrupt_message:
+                log_info('Your program is still running. '
+                         'To stream the logs, type:\n\n'
+                         f'        plz logs {execution_id}\n')
+            raise
+        print()
+
+    @on_exception_reraise("Displaying the logs failed.")
+    def display_multiplexed_logs(self, execution_ids: List[str]):
+        log_info('Streaming logs...')
+        since_timestamp = self._get_since_timestamp()
+        frames = self.controller.get_multiplexed_logs(
+            execution_ids,
+            since=int(since_timestamp) if since_timestamp else None)
+        for execution_id, stream, text in demultiplex_lines(frames):
+            if stream == 'error':
+                log_error(f'Couldn\'t follow the logs of {execution_id}: '
+                          f'{text}')
+            else:
+                print(f'{execution_id}: {text}', end='', flush=True)
+
+    def _get_since_timestamp(self) -> Optional[str]:
         # For the since argument, pass an integer to the backend. Or nothing
         # in case we want to log from the start (so the default is different
         # in the cli --current time-- and the backend --start time--). That's
@@ -55,22 +94,42 @@ class LogsOperation(Operation):
             except ValueError:
                 since_timestamp = str(int(time.mktime(
                     dateutil.parser.parse(self.since).timetuple())))
-        byte_lines = self.controller.get_logs(
-            self.get_execution_id(), since=since_timestamp)
-        try:
-            for byte_line in byte_lines:
-                print(byte_line.decode('utf-8'), end='', flush=True)
-        except KeyboardInterrupt:
-            print()
-            if print_interrupt_message:
-                log_info('Your program is still running. '
-                         'To stream the logs, type:\n\n'
-                         f'        plz logs {execution_id}\n')
-            raise
-        print()
+        return since_timestamp
 
     def run(self):
         try:
-            self.display_logs(self.get_execution_id())
+            if self.execution_ids:
+                self.display_multiplexed_logs(self.execution_ids)
+            else:
+                self.display_logs(self.get_execution_id())
         except KeyboardInterrupt:
             pass
+
+
+def demultiplex_lines(frames: Iterator[Frame]) \
+        -> Iterator[Tuple[str, str, str]]:
+    """Splits multiplexed logs into lines, so that lines of different
+       executions aren't mixed.
+
+       :returns: tuples of execution ID, stream (`logs` or `error`) and text
+    """
+    partial_lines: Dict[str, bytes] = {}
+    for header, payload in frames:
+        execution_id = header['execution_id']
+        stream = header['stream']
+        if stream == 'logs':
+            lines = (partial_lines.pop(execution_id, b'') + payload) \
+                .splitlines(keepends=True)
+            if lines and not lines[-1].endswith(b'\n'):
+                partial_lines[execution_id] = lines.pop()
+            for line in lines:
+                yield execution_id, 'logs', line.decode('utf-8')
+            continue
+        # The execution won't send anything else, so print what's left
+        partial_line = partial_lines.pop(execution_id, b'')
+        if partial_line:
+            yield execution_id, 'logs', partial_line.decode('utf-8') + '\n'
+        if stream == 'error':
+            error = json.loads(payload.decode('utf-8'))
+            yield execution_id, 'error', \
+                error.get('exception_type', error.get('error'))
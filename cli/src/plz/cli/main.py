@@ -7,6 +7,7 @@ import pkg_resources
 
 from plz.cli.configuration import Configuration, ValidationException
 from plz.cli.describe_execution_operation import DescribeExecutionOperation
+from plz.cli.events_operation import EventsOperation
 from plz.cli.exceptions import CLIException, ExitWithStatusCodeException
 from plz.cli.kill_instances_operation import KillInstancesOperation
 from plz.cli.last_execution_id_operation import LastExecutionIDOperation
@@ -38,7 +39,8 @@ OPERATIONS: [Type[Operation]] = [
     ListContextOperation,
     KillInstancesOperation,
     DescribeExecutionOperation,
-    LastExecutionIDOperation
+    LastExecutionIDOperation,
+    EventsOperation
 ]
 
 
@@ -0,0 +1,148 @@
+import os
+import zlib
+from typing import Callable, Dict, Iterator
+
+import requests
+import urllib3
+
+# Files of finished executions are served with an ETag and accept ranges. If
+# a download breaks, we can ask for the rest, as long as the ETag (that is,
+# the file) is the same.
+#
+# Files stored compressed are sent as they are, when we accept the encoding.
+# Ranges are then of the compressed bytes, so we keep track of those, and
+# decompress them ourselves.
+
+Request = Callable[[Dict[str, str]], requests.Response]
+
+CHUNK_SIZE = 1024 * 1024
+MAX_RESUMES = 5
+# Headers for requests of files that can be resumed
+ACCEPT_ENCODING_HEADERS = {'Accept-Encoding': 'gzip'}
+
+_BROKEN_DOWNLOAD_ERRORS = (
+    requests.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    urllib3.exceptions.ProtocolError)
+
+
+class ResumeFailedException(Exception):
+    pass
+
+
+def is_resumable(response: requests.Response) -> bool:
+    return response.headers.get('Accept-Ranges') == 'bytes' \
+        and 'ETag' in response.headers
+
+
+def range_headers(start: int, etag: str) -> Dict[str, str]:
+    # With `If-Range`, servers send the whole file (instead of the range) if
+    # the file changed
+    return {'Range': f'bytes={start}-', 'If-Range': etag}
+
+
+def iter_resuming(request: Request, response: requests.Response) \
+        -> Iterator[bytes]:
+    """Chunks of the response. If the download breaks, requests the rest
+       with `request`, which receives the headers to send"""
+    if not is_resumable(response):
+        yield from response.iter_content(chunk_size=CHUNK_SIZE)
+        return
+    etag = response.headers['ETag']
+    encoding = response.headers.get('Content-Encoding')
+    decompressor = _decompressor_for(encoding)
+    offset = 0
+    resumes = 0
+    while True:
+        try:
+            for chunk in _chunks_as_sent(response):
+                offset += len(chunk)
+                if decompressor is not None:
+                    chunk = decompressor.decompress(chunk)
+                yield chunk
+            if decompressor is not None:
+                yield decompressor.flush()
+            return
+        except _BROKEN_DOWNLOAD_ERRORS:
+            if resumes == MAX_RESUMES:
+                raise
+            resumes += 1
+        response = request(range_headers(offset, etag))
+        if response.status_code != requests.codes.partial_content:
+            raise ResumeFailedException(
+                'The file changed while downloading it')
+
+
+def download_to_file(request: Request, part_path: str) -> None:
+    """Downloads into `part_path`. If it has the start of the same file
+       from a previous attempt, downloads only the rest.
+
+       The file is written as it's sent, so it's gzipped if the response is.
+       The ETag of the file is kept in `<part_path>.etag`. Remove both files
+       once the download is used."""
+    etag_path = etag_path_for(part_path)
+    headers = {}
+    if os.path.exists(part_path) and os.path.exists(etag_path):
+        with open(etag_path) as f:
+            headers = range_headers(os.path.getsize(part_path), f.read())
+    response = request(headers)
+    if response.status_code == \
+            requests.codes.requested_range_not_satisfiable:
+        if _is_complete(response, part_path, headers['If-Range']):
+            # Downloaded completely before, but not used
+            return
+        # The part is longer than the file, so start again
+        response = request({})
+    if response.status_code == requests.codes.partial_content:
+        mode = 'ab'
+    else:
+        # Either a new download, or the file changed
+        mode = 'wb'
+        if is_resumable(response):
+            with open(etag_path, 'w') as f:
+                f.write(response.headers['ETag'])
+        elif os.path.exists(etag_path):
+            os.remove(etag_path)
+    with open(part_path, mode) as f:
+        for chunk in _chunks_as_sent(response):
+            f.write(chunk)
+
+
+def _is_complete(response: requests.Response, part_path: str,
+                 etag: str) -> bool:
+    # A range past the end of the file gets its size in `Content-Range`.
+    # With `If-Range`, it's past the end of the same file
+    return response.headers.get('ETag', etag) == etag and \
+        response.headers.get('Content-Range') == \
+        f'bytes */{os.path.getsize(part_path)}'
+
+
+def _chunks_as_sent(response: requests.Response) -> Iterator[bytes]:
+    # `iter_content` decompresses the response
+    if 'Content-Encoding' not in response.headers:
+        return response.iter_content(chunk_size=CHUNK_SIZE)
+    return response.raw.stream(CHUNK_SIZE, decode_content=False)
+
+
+def _decompressor_for(encoding: str):
+    if encoding is None:
+        return None
+    if encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    raise ValueError(f'Unexpected content encoding: {encoding}')
+
+
+def etag_path_for(part_path: str) -> str:
+    return part_path + '.etag'
+
+
+def iter_lines(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Lines (with the line terminator) of the bytes in the chunks"""
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if pending:
+        yield pending
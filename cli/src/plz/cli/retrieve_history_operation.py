@@ -1,3 +1,5 @@
+from typing import Optional
+
 from plz.cli.configuration import Configuration
 from plz.cli.operation import Operation, on_exception_reraise
 
@@ -11,16 +13,53 @@ class RetrieveHistoryOperation(Operation):
 
     @classmethod
     def prepare_argument_parser(cls, parser, args):
-        pass
+        parser.add_argument(
+            '-n', '--limit', type=int, default=None,
+            help='Maximum number of executions to show (newest first)')
+        parser.add_argument(
+            '--before', type=int, default=None,
+            help='Show only executions finished before this timestamp. Use '
+                 'the `finish_timestamp` of the last execution shown, with '
+                 '--before-execution-id, to get the next page')
+        parser.add_argument(
+            '--before-execution-id', default=None,
+            help='With --before, also show the executions finished at that '
+                 'timestamp that come after this one, so that executions '
+                 'finished on the same second aren\'t skipped')
+        parser.add_argument(
+            '--after', type=int, default=None,
+            help='Show only executions finished after this timestamp. With '
+                 '--limit, the ones next to it. Use the `finish_timestamp` '
+                 'of the first execution shown, with --after-execution-id, '
+                 'to get the previous page')
+        parser.add_argument(
+            '--after-execution-id', default=None,
+            help='With --after, also show the executions finished at that '
+                 'timestamp that come before this one')
 
-    def __init__(self, configuration: Configuration):
+    def __init__(self, configuration: Configuration,
+                 limit: Optional[int] = None,
+                 before: Optional[int] = None,
+                 after: Optional[int] = None,
+                 before_execution_id: Optional[str] = None,
+                 after_execution_id: Optional[str] = None):
         super().__init__(configuration)
+        self.limit = limit
+        self.before = before
+        self.after = after
+        self.before_execution_id = before_execution_id
+        self.after_execution_id = after_execution_id
 
     @on_exception_reraise('Retrieving the history failed.')
     def retrieve_history(self):
         json_strings = self.controller.get_history(
             user=self.configuration.user,
-            project=self.configuration.project)
+            project=self.configuration.project,
+            limit=self.limit,
+            before=self.before,
+            after=self.after,
+            before_execution_id=self.before_execution_id,
+            after_execution_id=self.after_execution_id)
         for s in json_strings:
             print(s, end='')
 
@@ -1,15 +1,18 @@
 import os
 import shutil
 import tarfile
-import tempfile
-from typing import IO, Iterator, Optional
+from typing import BinaryIO, Iterator, List, Optional, Tuple
 
 from plz.cli.configuration import Configuration
 from plz.cli.exceptions import CLIException
 from plz.cli.log import log_info
 from plz.cli.operation import Operation, add_output_dir_arg, \
     on_exception_reraise
+from plz.cli.resumable_download import etag_path_for
 from plz.controller.api.exceptions import InstanceStillRunningException
+from plz.controller.api.iterator_reader import IteratorReader
+from plz.controller.api.tarball_paths import link_target_name, \
+    path_in_tarball
 
 
 class RetrieveOutputOperation(Operation):
@@ -29,15 +32,28 @@ class RetrieveOutputOperation(Operation):
                  'Discouraged as the output might be in an inconsistent '
                  'state. If the output directory is present it\'ll be '
                  'overwritten')
+        parser.add_argument(
+            '--path', dest='paths', nargs='+', metavar='PATH',
+            help='Only download these files or directories of the output, '
+                 'relative to the output directory')
+        parser.add_argument(
+            '--glob', dest='globs', nargs='+', metavar='PATTERN',
+            help='Only download the files of the output matching these '
+                 'patterns, like "checkpoints/*.pt" (quote them so that the '
+                 'shell doesn\'t expand them)')
 
     def __init__(self, configuration: Configuration,
                  output_dir: str,
                  force_if_running: bool,
-                 execution_id: Optional[str] = None):
+                 execution_id: Optional[str] = None,
+                 paths: Optional[List[str]] = None,
+                 globs: Optional[List[str]] = None):
         super().__init__(configuration)
         self.output_dir = output_dir
         self.force_if_running = force_if_running
         self.execution_id = execution_id
+        self.paths = paths
+        self.globs = globs
 
     def harvest(self):
         try:
@@ -55,23 +71,43 @@ class RetrieveOutputOperation(Operation):
                     'terminate it, \nor use --force-if-running (discouraged)')
 
     @on_exception_reraise('Retrieving the output failed.')
-    def retrieve_output(self):
+    def retrieve_output(
+            self, output_tarball_bytes: Optional[Iterator[bytes]] = None):
+        """:param output_tarball_bytes: the output, if we got it already"""
         execution_id = self.get_execution_id()
-        output_tarball_bytes = self.controller.get_output_files(
-            self.get_execution_id())
         formatted_output_dir = self.output_dir.replace('%e', execution_id)
-        try:
-            os.makedirs(formatted_output_dir)
-        except FileExistsError:
-            if self.force_if_running:
-                log_info('Removing existing output directory')
-                shutil.rmtree(formatted_output_dir)
-                os.makedirs(formatted_output_dir)
-            else:
-                raise CLIException(
-                    f'The output directory "{formatted_output_dir}" '
-                    'already exists.')
-        for path in untar(output_tarball_bytes, formatted_output_dir):
+        if os.path.exists(formatted_output_dir) and \
+                not self.force_if_running:
+            raise CLIException(
+                f'The output directory "{formatted_output_dir}" '
+                'already exists.')
+        if self.paths is not None or self.globs is not None:
+            # The server picks the files, and there's nothing to resume
+            output_tarball_bytes = self.controller.get_output_files(
+                execution_id, self.paths, self.globs)
+        if output_tarball_bytes is not None:
+            self._extract(
+                IteratorReader(output_tarball_bytes), formatted_output_dir)
+            return
+
+        # Download next to the output directory, so that if the download
+        # breaks we can resume it next time
+        part_path = os.path.normpath(formatted_output_dir) + '.tar.part'
+        # With an output directory like `out`, there's no directory to make
+        os.makedirs(os.path.dirname(part_path) or os.curdir, exist_ok=True)
+        self.controller.download_output_files(execution_id, part_path)
+        with open(part_path, 'rb') as tarball:
+            self._extract(tarball, formatted_output_dir)
+        os.remove(part_path)
+        if os.path.exists(etag_path_for(part_path)):
+            os.remove(etag_path_for(part_path))
+
+    def _extract(self, tarball: BinaryIO, formatted_output_dir: str):
+        if os.path.exists(formatted_output_dir):
+            log_info('Removing existing output directory')
+            shutil.rmtree(formatted_output_dir)
+        os.makedirs(formatted_output_dir)
+        for path in untar(tarball, formatted_output_dir):
             print(path)
 
     def run(self):
@@ -81,32 +117,41 @@ class RetrieveOutputOperation(Operation):
         self.retrieve_output()
 
 
-def untar(tarball_bytes: Iterator[bytes], formatted_output_dir: str) \
-        -> Iterator[str]:
+def untar(tarball: BinaryIO, formatted_output_dir: str) -> Iterator[str]:
     # The first parameter is a tarball we need to extract into `output_dir`.
-    with tempfile.TemporaryFile() as tarball:
-        # `tarfile.open` needs to read from a real file, so we copy to one.
-        for bs in tarball_bytes:
-            tarball.write(bs)
-        # And rewind to the start.
-        tarball.seek(0)
-        tar = tarfile.open(fileobj=tarball)
-        for tarinfo in tar.getmembers():
-            # Drop the first segment, because it's just the name of the
-            # directory that was tarred up, and we don't care.
-            path_segments = tarinfo.name.split(os.sep)[1:]
-            if path_segments:
-                # Unfortunately we can't just pass `*path_segments`
-                # because `os.path.join` explicitly expects an argument
-                # for the first parameter.
-                path = os.path.join(path_segments[0], *path_segments[1:])
-                # Just because it's nice, yield the file to be extracted.
-                yield path
-                source: IO = tar.extractfile(tarinfo.name)
-                if source:
-                    # Finally, write the file.
-                    absolute_path = os.path.join(formatted_output_dir, path)
-                    os.makedirs(os.path.dirname(absolute_path),
-                                exist_ok=True)
-                    with open(absolute_path, 'wb') as dest:
-                        shutil.copyfileobj(source, dest)
+    # It's read as a stream, so that each file is written as soon as it
+    # arrives, and the tarball doesn't need to be a real file.
+    tar = tarfile.open(fileobj=tarball, mode='r|*')
+    # Links are written once everything else is, as their targets might
+    # come later in the stream, and we can't go back to earlier ones
+    links: List[Tuple[str, str]] = []
+    for tarinfo in tar:
+        path = path_in_tarball(tarinfo.name)
+        if path is None:
+            continue
+        # Just because it's nice, yield the file to be extracted.
+        yield path
+        if tarinfo.isfile():
+            # Finally, write the file.
+            with _open_for_writing(formatted_output_dir, path) as dest:
+                shutil.copyfileobj(tar.extractfile(tarinfo), dest)
+        elif tarinfo.islnk() or tarinfo.issym():
+            target_name = link_target_name(tarinfo)
+            if target_name is not None:
+                links.append((path, target_name))
+    for path, target_name in links:
+        target_path = path_in_tarball(target_name)
+        if target_path is None:
+            continue
+        absolute_target_path = os.path.join(formatted_output_dir, target_path)
+        if not os.path.isfile(absolute_target_path):
+            continue
+        with open(absolute_target_path, 'rb') as source, \
+                _open_for_writing(formatted_output_dir, path) as dest:
+            shutil.copyfileobj(source, dest)
+
+
+def _open_for_writing(formatted_output_dir: str, path: str) -> BinaryIO:
+    absolute_path = os.path.join(formatted_output_dir, path)
+    os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+    return open(absolute_path, 'wb')
@@ -6,7 +6,8 @@ import time
 
 from plz.cli import parameters
 from plz.cli.configuration import Configuration
-from plz.cli.exceptions import CLIException, ExitWithStatusCodeException
+from plz.cli.exceptions import CLIException, ExitWithStatusCodeException, \
+    NotSupportedByControllerException
 from plz.cli.git import get_head_commit_or_none
 from plz.cli.input_data import InputData
 from plz.cli.log import log_debug, log_error, log_info, log_warning
@@ -17,6 +18,8 @@ from plz.cli.retrieve_measures_operation import RetrieveMeasuresOperation
 from plz.cli.retrieve_output_operation import RetrieveOutputOperation
 from plz.cli.show_status_operation import ShowStatusOperation
 from plz.cli.snapshot import capture_build_context
+from plz.controller.api.exceptions import InstanceStillRunningException
+from plz.controller.api.framing import Frame
 
 
 class RunExecutionOperation(Operation):
@@ -121,6 +124,7 @@ class RunExecutionOperation(Operation):
             force_if_running=False)
 
         cancelled = False
+        finished = False
         try:
             if not was_start_ok:
                 raise CLIException('The command failed.')
@@ -128,13 +132,15 @@ class RunExecutionOperation(Operation):
                                  execution_id=self.execution_id,
                                  since='start')
             logs.display_logs(self.execution_id, print_interrupt_message=True)
+            finished = True
         except CLIException as e:
             e.print(self.configuration)
             raise ExitWithStatusCodeException(e.exit_code)
         except KeyboardInterrupt:
             cancelled = True
         finally:
-            if not cancelled:
+            # When finished, we harvest when finalizing
+            if not cancelled and not finished:
                 self.suboperation(
                         'Harvesting the output...',
                         retrieve_output_operation.harvest)
@@ -142,6 +148,42 @@ class RunExecutionOperation(Operation):
         if cancelled:
             return
 
+        try:
+            frames = self.suboperation(
+                'Harvesting the output...',
+                lambda: self.controller.finalize_execution(self.execution_id))
+        except NotSupportedByControllerException:
+            self.suboperation(
+                'Harvesting the output...',
+                retrieve_output_operation.harvest)
+            return self.finalize_in_several_requests(
+                retrieve_output_operation)
+        except InstanceStillRunningException as e:
+            raise CLIException(
+                'Execution has not finished. This should not happen.'
+                ' Please report it.') from e
+
+        status, summary_measures, output_tarball_bytes = \
+            split_finalization_frames(frames)
+        log_info('Retrieving summary of measures (if present)...')
+        print(summary_measures, end='')
+        if status['success']:
+            log_info('Execution succeeded.')
+            self.suboperation(
+                    'Retrieving the output...',
+                    lambda: retrieve_output_operation.retrieve_output(
+                        output_tarball_bytes))
+            log_info('Done and dusted.')
+            return status['exit_status']
+        else:
+            raise CLIException(
+                'Execution failed with an exit status of '
+                f'{status["exit_status"]}.',
+                exit_code=status['exit_status'])
+
+    def finalize_in_several_requests(
+            self, retrieve_output_operation: RetrieveOutputOperation):
+        # For controllers without the finalize entrypoint
         retrieve_measures_operation = RetrieveMeasuresOperation(
             self.configuration, execution_id=self.execution_id, summary=True)
         self.suboperation(
@@ -290,3 +332,29 @@ class RunExecutionOperation(Operation):
 
 class PullAccessDeniedException(Exception):
     pass
+
+
+def split_finalization_frames(frames: Iterator[Frame]) \
+        -> Tuple[dict, str, Iterator[bytes]]:
+    """Status, summary measures and output tarball from the response to
+       `finalize_execution`. The output is read as it's consumed."""
+    frames = iter(frames)
+    status = json.loads(_next_payload(frames, 'status'))
+    summary_measures = _next_payload(frames, 'measures').decode('utf-8')
+
+    def output_tarball_bytes():
+        for header, payload in frames:
+            if header['stream'] == 'end':
+                return
+            yield payload
+        raise CLIException('The output was cut short')
+
+    return status, summary_measures, output_tarball_bytes()
+
+
+def _next_payload(frames: Iterator[Frame], stream: str) -> bytes:
+    header, payload = next(frames)
+    if header['stream'] != stream:
+        raise CLIException(
+            f'Expected {stream} when finalizing, got {header["stream"]}')
+    return payload
@@ -9,6 +9,7 @@ from plz.cli import ssh_session
 from plz.cli.configuration import Configuration
 from plz.cli.exceptions import CLIException, RequestException
 from plz.cli.ssh_session import add_ssh_channel_adapter
+from plz.controller.api.types import ACCEPT_COMPRESSED_HEADER
 
 
 class Server:
@@ -38,6 +39,9 @@ class Server:
         try:
             url = self.prefix + '/' + '/'.join(path_segments)
             session = requests.session()
+            # Every response is decoded, including those read raw (see
+            # `_decoded_raw` in the proxy)
+            session.headers[ACCEPT_COMPRESSED_HEADER] = 'true'
             if self.schema == ssh_session.PLZ_SSH_SCHEMA:
                 add_ssh_channel_adapter(session, self.connection_info)
             response = session.request(method, url, **kwargs)
@@ -2,12 +2,13 @@ import collections
 from typing import Optional
 
 from plz.cli.configuration import Configuration
+from plz.cli.list_executions_operation import format_publication
 from plz.cli.log import log_info
 from plz.cli.operation import Operation, on_exception_reraise
 
 ExecutionStatus = collections.namedtuple(
     'ExecutionStatus',
-    ['running', 'success', 'code'])
+    ['running', 'success', 'code', 'publication'])
 
 
 class ShowStatusOperation(Operation):
@@ -32,7 +33,9 @@ class ShowStatusOperation(Operation):
         return ExecutionStatus(
             running=status['running'],
             success=status['success'],
-            code=status['exit_status'])
+            code=status['exit_status'],
+            # Not sent by older controllers
+            publication=status.get('publication'))
 
     def run(self):
         status = self.get_status()
@@ -40,3 +43,5 @@ class ShowStatusOperation(Operation):
         print('Running:', status.running)
         print('Success:', status.success)
         print('Exit Status:', status.code)
+        if status.publication is not None:
+            print('Publication:', format_publication(status.publication))
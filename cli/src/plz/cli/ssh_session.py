@@ -1,5 +1,7 @@
 import os
+import shutil
 import socket
+import tempfile
 import threading
 
 from paramiko import Channel, ChannelFile, HostKeys, PKey, RSAKey, Transport
@@ -9,11 +11,14 @@ from urllib3 import HTTPConnectionPool
 from urllib3.connection import HTTPConnection
 
 from plz.cli.exceptions import CLIException
+from plz.cli.log import log_error
 
 # Must start with http, otherwise parameters for GET requests are not included
 # in the URL
 PLZ_SSH_SCHEMA = 'http-ssh'
 
+_TUNNEL_BUFFER_SIZE = 64 * 1024
+
 
 def add_ssh_channel_adapter(session: Session, connection_info: dict):
     """For sessions in ssh channels, use the same adapter as for http. We
@@ -48,19 +53,10 @@ class SSHChannelHTTPConnection(HTTPConnection):
         super().__init__(*args, **kwargs)
 
     def connect(self):
-        username = self.connection_info.get('username', 'plz-user')
-        path_to_private_key = self.connection_info['path_to_private_key']
-        try:
-            transport = _get_transport(
-                hostname=self.host, username=username,
-                path_to_private_key=path_to_private_key)
-            ch = transport.open_channel(
-                'direct-tcpip', ('0.0.0.0', self.port), ('0.0.0.0', 0))
-            _override_makefile(ch)
-            _override_channel_close(ch)
-            self._prepare_conn(ch)
-        except Exception as e:
-            raise SSHAuthenticationError('Creating SSH channel: ') from e
+        ch = _open_channel(self.host, self.port, self.connection_info)
+        _override_makefile(ch)
+        _override_channel_close(ch)
+        self._prepare_conn(ch)
 
 
 class SSHChannelHTTPConnectionPool(HTTPConnectionPool):
@@ -76,6 +72,92 @@ class SSHChannelHTTPConnectionPool(HTTPConnectionPool):
             {'connection_info': connection_info})
 
 
+class SSHTunnel:
+    """Forwards the connections to a local Unix socket through SSH channels,
+       for HTTP clients we can't plug channels into (such as the asynchronous
+       proxy). Connect to `socket_path` instead of the controller.
+
+       Whoever connects gets to the controller with the key of the user, so
+       the socket is only accessible to the user (unlike a local port)"""
+
+    def __init__(self, host: str, port: int, connection_info: dict):
+        self.host = host
+        self.port = port
+        self.connection_info = connection_info
+        # Only accessible to the user, from before the socket is there
+        self.directory = tempfile.mkdtemp(prefix='plz-ssh-')
+        self.socket_path = os.path.join(self.directory, 'controller.sock')
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self.listener.listen(socket.SOMAXCONN)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        self.listener.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                # Closed
+                return
+            threading.Thread(
+                target=self._forward, args=(client,), daemon=True).start()
+
+    def _forward(self, client: socket.socket):
+        try:
+            channel = _open_channel(
+                self.host, self.port, self.connection_info)
+        except SSHAuthenticationError as e:
+            # The client only sees the connection closing, so say why
+            log_error(f'{e.message}{e.__cause__}')
+            client.close()
+            return
+        responses = threading.Thread(
+            target=_pump, args=(channel.recv, client.sendall,
+                                lambda: client.shutdown(socket.SHUT_WR)),
+            daemon=True)
+        responses.start()
+        _pump(client.recv, channel.sendall, channel.shutdown_write)
+        responses.join()
+        channel.close()
+        client.close()
+
+
+def _pump(recv, sendall, shutdown_write):
+    try:
+        while True:
+            data = recv(_TUNNEL_BUFFER_SIZE)
+            if not data:
+                break
+            sendall(data)
+    except OSError:
+        pass
+    finally:
+        # Let the other side know that there's nothing else coming, without
+        # closing the connection in the other direction
+        try:
+            shutdown_write()
+        except OSError:
+            pass
+
+
+def _open_channel(host: str, port: int, connection_info: dict) -> Channel:
+    username = connection_info.get('username', 'plz-user')
+    path_to_private_key = connection_info['path_to_private_key']
+    try:
+        transport = _get_transport(
+            hostname=host, username=username,
+            path_to_private_key=path_to_private_key)
+        return transport.open_channel(
+            'direct-tcpip', ('0.0.0.0', port), ('0.0.0.0', 0))
+    except Exception as e:
+        raise SSHAuthenticationError('Creating SSH channel: ') from e
+
+
 def _get_transport(hostname: str, username: str, path_to_private_key: str):
     global _transport, _transport_lock
     with _transport_lock:
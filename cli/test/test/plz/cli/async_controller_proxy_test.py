@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import unittest
+
+# noinspection PyPackageRequirements
+import flask
+from werkzeug.serving import make_server
+
+from plz.cli.async_controller_proxy import AsyncControllerProxy
+from plz.cli.async_server import AsyncServer
+from plz.controller.api.exceptions import EXCEPTION_NAMES_TO_CLASSES, \
+    InstanceStillRunningException
+from plz.controller.api.framing import encode_frame
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class AsyncControllerProxyTest(unittest.TestCase):
+    http_server = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.http_server = make_server(
+            'localhost', 0, create_app(), threaded=True)
+        threading.Thread(
+            target=cls.http_server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.http_server.shutdown()
+
+    def run_with_controller(self, act):
+        async def run():
+            server = AsyncServer(
+                host='localhost', port=self.http_server.server_port,
+                exception_names_to_classes=EXCEPTION_NAMES_TO_CLASSES)
+            async with AsyncControllerProxy(server) as controller:
+                return await act(controller)
+        return asyncio.new_event_loop().run_until_complete(run())
+
+    def test_gets_many_statuses_concurrently(self):
+        async def act(controller: AsyncControllerProxy):
+            return await asyncio.gather(
+                *(controller.get_status(str(i)) for i in range(50)))
+
+        statuses = self.run_with_controller(act)
+        self.assertEqual([s['execution_id'] for s in statuses],
+                         [str(i) for i in range(50)])
+
+    def test_streams_logs(self):
+        async def act(controller: AsyncControllerProxy):
+            logs = await controller.get_logs('some-id', since=None)
+            return b''.join([chunk async for chunk in logs])
+
+        self.assertEqual(self.run_with_controller(act), b'one\ntwo\n')
+
+    def test_decodes_frames(self):
+        async def act(controller: AsyncControllerProxy):
+            frames = await controller.finalize_execution('some-id')
+            return [frame async for frame in frames]
+
+        self.assertEqual(self.run_with_controller(act), [
+            ({'stream': 'status', 'length': 2}, b'{}'),
+            ({'stream': 'end', 'length': 0}, b''),
+        ])
+
+    def test_raises_controller_exceptions(self):
+        async def act(controller: AsyncControllerProxy):
+            await controller.finalize_execution('running-id')
+
+        with self.assertRaises(InstanceStillRunningException):
+            self.run_with_controller(act)
+
+
+def create_app():
+    app = flask.Flask(__name__)
+
+    @app.route('/executions/<execution_id>/status')
+    def get_status(execution_id):
+        return flask.jsonify({'execution_id': execution_id})
+
+    @app.route('/executions/<execution_id>/logs')
+    def get_logs(execution_id):
+        return flask.Response(iter([b'one\n', b'two\n']))
+
+    @app.route('/executions/<execution_id>/finalize', methods=['POST'])
+    def finalize_execution(execution_id):
+        if execution_id == 'running-id':
+            response = flask.jsonify({
+                'exception_type': 'InstanceStillRunningException',
+                'execution_id': execution_id})
+            response.status_code = 409
+            return response
+        return flask.Response(iter([
+            encode_frame({'stream': 'status'}, b'{}'),
+            encode_frame({'stream': 'end'})]))
+
+    return app
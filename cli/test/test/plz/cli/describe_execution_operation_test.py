@@ -0,0 +1,21 @@
+import unittest
+
+from plz.cli.describe_execution_operation import phases_table
+
+
+class DescribeExecutionOperationTest(unittest.TestCase):
+    def test_phases_are_in_order_and_nested(self):
+        spans = [
+            {'id': 'b', 'parent_id': 'a', 'name': 'images.pull',
+             'start': 2, 'duration': 3.5, 'attributes': {}},
+            {'id': 'a', 'parent_id': None, 'name': 'instance.start',
+             'start': 1, 'duration': 10, 'attributes': {}},
+            {'id': 'c', 'parent_id': None, 'name': 'instance.release',
+             'start': 20, 'duration': 1, 'attributes': {},
+             'error': 'OSError: no space'},
+        ]
+        self.assertEqual(phases_table(spans)._rows, [
+            ['instance.start', '10.00', ''],
+            ['  images.pull', '3.50', ''],
+            ['instance.release', '1.00', 'OSError: no space'],
+        ])
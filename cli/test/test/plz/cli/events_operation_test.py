@@ -0,0 +1,24 @@
+import unittest
+
+from plz.controller.api.server_sent_events import KEEP_ALIVE, \
+    decode_events, encode_event
+
+
+class EventsOperationTest(unittest.TestCase):
+    def test_events_survive_encoding(self):
+        events = [
+            {'id': '1540000000000-0', 'execution_id': 'a',
+             'type': 'created', 'timestamp': 1540000000},
+            {'id': '1540000000000-1', 'execution_id': 'a',
+             'type': 'published', 'timestamp': 1540000000,
+             'exit_status': 0, 'finish_timestamp': 1540000000},
+        ]
+        stream = encode_event(events[0]) + KEEP_ALIVE + \
+            encode_event(events[1])
+        self.assertEqual(
+            list(decode_events(iter(stream.split('\n')))), events)
+
+    def test_events_are_ids_and_types_for_event_source(self):
+        encoded = encode_event(
+            {'id': '1-0', 'execution_id': 'a', 'type': 'exited'})
+        self.assertEqual(encoded.split('\n')[:2], ['id: 1-0', 'event: exited'])
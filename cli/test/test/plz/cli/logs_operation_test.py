@@ -0,0 +1,45 @@
+import unittest
+
+from plz.cli.logs_operation import demultiplex_lines
+from plz.controller.api.framing import decode_frames, encode_frame
+
+
+class LogsOperationTest(unittest.TestCase):
+    def test_demultiplexes_lines_split_across_frames(self):
+        frames = [
+            ({'execution_id': 'a', 'stream': 'logs', 'offset': 0}, b'one\ntw'),
+            ({'execution_id': 'b', 'stream': 'logs', 'offset': 0}, b'uno\n'),
+            ({'execution_id': 'a', 'stream': 'logs', 'offset': 6}, b'o\nthr'),
+            ({'execution_id': 'a', 'stream': 'end', 'offset': 11}, b''),
+            ({'execution_id': 'b', 'stream': 'error', 'offset': 4},
+             b'{"exception_type": "WorkerUnreachableException"}'),
+        ]
+        self.assertEqual(list(demultiplex_lines(iter(frames))), [
+            ('a', 'logs', 'one\n'),
+            ('b', 'logs', 'uno\n'),
+            ('a', 'logs', 'two\n'),
+            ('a', 'logs', 'thr\n'),
+            ('b', 'error', 'WorkerUnreachableException'),
+        ])
+
+    def test_frames_survive_arbitrary_chunking(self):
+        frames = [
+            ({'execution_id': 'a', 'stream': 'logs', 'offset': 0}, b'x\ny\n'),
+            ({'execution_id': 'b', 'stream': 'end', 'offset': 0}, b''),
+            ({'execution_id': 'a', 'stream': 'logs', 'offset': 4}, b'\n' * 9),
+        ]
+        encoded = b''.join(encode_frame(h, p) for h, p in frames)
+        for chunk_size in (1, 2, 7, len(encoded)):
+            chunks = (encoded[i:i + chunk_size]
+                      for i in range(0, len(encoded), chunk_size))
+            decoded = list(decode_frames(chunks))
+            self.assertEqual(
+                [(h['execution_id'], h['stream'], h['length'], p)
+                 for h, p in decoded],
+                [(h['execution_id'], h['stream'], len(p), p)
+                 for h, p in frames])
+
+    def test_truncated_frames_are_an_error(self):
+        encoded = encode_frame({'execution_id': 'a'}, b'payload')
+        with self.assertRaises(ValueError):
+            list(decode_frames(iter([encoded[:-1]])))
@@ -0,0 +1,164 @@
+import gzip
+import os
+import tempfile
+import unittest
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+from plz.cli.resumable_download import ResumeFailedException, \
+    download_to_file, etag_path_for, iter_lines, iter_resuming
+
+_CONTENT = b'first line\nsecond line\nthird line\n'
+_ETAG = '"some-etag"'
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, content: bytes,
+                 etag: Optional[str] = _ETAG, break_after: int = None,
+                 encoding: Optional[str] = None):
+        self.status_code = status_code
+        self.headers = {'Accept-Ranges': 'bytes'}
+        if etag is not None:
+            self.headers['ETag'] = etag
+        if encoding is not None:
+            self.headers['Content-Encoding'] = encoding
+        self.content = content
+        self.break_after = break_after
+        self.raw = self
+
+    def stream(self, chunk_size: int, decode_content: bool) \
+            -> Iterator[bytes]:
+        # Only used for compressed responses, which we don't decode here
+        assert not decode_content
+        return self.iter_content(chunk_size)
+
+    def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+        for i in range(0, len(self.content), 4):
+            if self.break_after is not None and i >= self.break_after:
+                raise requests.ConnectionError('Broken')
+            yield self.content[i:i + 4]
+
+
+class FakeServer:
+    """Serves `_CONTENT`, breaking the first response after some bytes"""
+
+    def __init__(self, break_after: Optional[int] = None,
+                 etag: str = _ETAG, encoding: Optional[str] = None):
+        self.break_after = break_after
+        self.etag = etag
+        self.encoding = encoding
+        self.content = _CONTENT
+        if encoding == 'gzip':
+            self.content = gzip.compress(_CONTENT)
+        self.requests: List[Dict[str, str]] = []
+
+    def request(self, headers: Dict[str, str]) -> FakeResponse:
+        self.requests.append(headers)
+        break_after, self.break_after = self.break_after, None
+        if 'Range' in headers and headers['If-Range'] == self.etag:
+            start = int(headers['Range'][len('bytes='):-1])
+            if start >= len(self.content):
+                response = FakeResponse(
+                    requests.codes.requested_range_not_satisfiable, b'',
+                    etag=None)
+                response.headers['Content-Range'] = \
+                    f'bytes */{len(self.content)}'
+                return response
+            return FakeResponse(
+                requests.codes.partial_content, self.content[start:],
+                self.etag, encoding=self.encoding)
+        return FakeResponse(
+            requests.codes.ok, self.content, self.etag,
+            break_after=break_after, encoding=self.encoding)
+
+
+class ResumableDownloadTest(unittest.TestCase):
+    def test_resumes_broken_stream(self):
+        server = FakeServer(break_after=8)
+        chunks = iter_resuming(server.request, server.request({}))
+        self.assertEqual(b''.join(chunks), _CONTENT)
+        self.assertEqual(server.requests[1],
+                         {'Range': 'bytes=8-', 'If-Range': _ETAG})
+
+    def test_resumes_broken_compressed_stream(self):
+        server = FakeServer(break_after=8, encoding='gzip')
+        chunks = iter_resuming(server.request, server.request({}))
+        self.assertEqual(b''.join(chunks), _CONTENT)
+        self.assertEqual(server.requests[1]['Range'], 'bytes=8-')
+
+    def test_fails_if_file_changes_while_resuming(self):
+        server = FakeServer(break_after=8)
+        response = server.request({})
+        server.etag = '"another-etag"'
+        with self.assertRaises(ResumeFailedException):
+            b''.join(iter_resuming(server.request, response))
+
+    def test_splits_lines_across_chunks(self):
+        self.assertEqual(
+            list(iter_lines(iter([b'fir', b'st\nsec', b'ond\n', b'end']))),
+            [b'first\n', b'second\n', b'end'])
+
+    def test_download_continues_part_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            part_path = os.path.join(directory, 'output.tar.part')
+            with open(part_path, 'wb') as f:
+                f.write(_CONTENT[:10])
+            with open(etag_path_for(part_path), 'w') as f:
+                f.write(_ETAG)
+            server = FakeServer()
+            download_to_file(server.request, part_path)
+            with open(part_path, 'rb') as f:
+                self.assertEqual(f.read(), _CONTENT)
+            self.assertEqual(server.requests[0]['Range'], 'bytes=10-')
+
+    def test_download_keeps_compressed_file_as_sent(self):
+        with tempfile.TemporaryDirectory() as directory:
+            part_path = os.path.join(directory, 'output.tar.part')
+            server = FakeServer(encoding='gzip')
+            with open(part_path, 'wb') as f:
+                f.write(server.content[:10])
+            with open(etag_path_for(part_path), 'w') as f:
+                f.write(_ETAG)
+            download_to_file(server.request, part_path)
+            with gzip.open(part_path, 'rb') as f:
+                self.assertEqual(f.read(), _CONTENT)
+
+    def test_download_restarts_if_file_changed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            part_path = os.path.join(directory, 'output.tar.part')
+            with open(part_path, 'wb') as f:
+                f.write(b'something else')
+            with open(etag_path_for(part_path), 'w') as f:
+                f.write('"old-etag"')
+            download_to_file(FakeServer().request, part_path)
+            with open(part_path, 'rb') as f:
+                self.assertEqual(f.read(), _CONTENT)
+            with open(etag_path_for(part_path)) as f:
+                self.assertEqual(f.read(), _ETAG)
+
+    def test_download_leaves_complete_part_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            part_path = os.path.join(directory, 'output.tar.part')
+            with open(part_path, 'wb') as f:
+                f.write(_CONTENT)
+            with open(etag_path_for(part_path), 'w') as f:
+                f.write(_ETAG)
+            server = FakeServer()
+            download_to_file(server.request, part_path)
+            with open(part_path, 'rb') as f:
+                self.assertEqual(f.read(), _CONTENT)
+            self.assertEqual(len(server.requests), 1)
+
+    def test_download_restarts_if_part_file_is_longer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            part_path = os.path.join(directory, 'output.tar.part')
+            with open(part_path, 'wb') as f:
+                f.write(_CONTENT + b'more')
+            with open(etag_path_for(part_path), 'w') as f:
+                f.write(_ETAG)
+            server = FakeServer()
+            download_to_file(server.request, part_path)
+            with open(part_path, 'rb') as f:
+                self.assertEqual(f.read(), _CONTENT)
+            self.assertEqual(server.requests[1], {})
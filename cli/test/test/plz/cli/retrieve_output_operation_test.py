@@ -0,0 +1,121 @@
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+from typing import Iterator
+from unittest import mock
+
+from plz.cli import operation
+from plz.cli.retrieve_output_operation import RetrieveOutputOperation, untar
+from plz.controller.api.iterator_reader import IteratorReader
+
+
+class UntarTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_extracts_from_chunks_as_they_arrive(self):
+        tarball = io.BytesIO()
+        with tarfile.open(fileobj=tarball, mode='w') as tar:
+            _add_file(tar, 'output/first', b'first file')
+            _add_file(tar, 'output/nested/second', bytes(100000))
+        content = tarball.getvalue()
+        read_until = []
+
+        def chunks() -> Iterator[bytes]:
+            for i in range(0, len(content), 1000):
+                read_until.append(i + 1000)
+                yield content[i:i + 1000]
+
+        paths = untar(IteratorReader(chunks()), self.directory.name)
+
+        self.assertEqual(next(paths), 'first')
+        self.assertEqual(next(paths), 'nested/second')
+        self.assertEqual(self._read('first'), b'first file')
+        self.assertLess(read_until[-1], 10000)
+        self.assertEqual(list(paths), [])
+        self.assertEqual(self._read('nested/second'), bytes(100000))
+
+    def test_extracts_links_as_copies_of_their_targets(self):
+        tarball = io.BytesIO()
+        with tarfile.open(fileobj=tarball, mode='w') as tar:
+            _add_link(tarfile.SYMTYPE, tar, 'output/a/symbolic', '../target')
+            _add_file(tar, 'output/target', b'some content')
+            _add_link(tarfile.LNKTYPE, tar, 'output/hard', 'output/target')
+
+        list(untar(IteratorReader(iter([tarball.getvalue()])),
+                   self.directory.name))
+
+        self.assertEqual(self._read('a/symbolic'), b'some content')
+        self.assertEqual(self._read('hard'), b'some content')
+
+    def test_skips_links_to_files_outside_of_the_tarball(self):
+        output_directory = os.path.join(self.directory.name, 'output')
+        os.makedirs(output_directory)
+        secret_path = os.path.join(self.directory.name, 'secret')
+        with open(secret_path, 'wb') as f:
+            f.write(b'secret')
+        tarball = io.BytesIO()
+        with tarfile.open(fileobj=tarball, mode='w') as tar:
+            _add_link(tarfile.SYMTYPE, tar, 'output/relative',
+                      '../../../secret')
+            _add_link(tarfile.SYMTYPE, tar, 'output/absolute', secret_path)
+            _add_link(tarfile.LNKTYPE, tar, 'output/hard', '../../secret')
+
+        list(untar(IteratorReader(iter([tarball.getvalue()])),
+                   output_directory))
+
+        self.assertEqual(os.listdir(output_directory), [])
+
+    def _read(self, path: str) -> bytes:
+        with open(os.path.join(self.directory.name, path), 'rb') as f:
+            return f.read()
+
+
+class RetrieveOutputOperationTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+        with mock.patch.object(operation, 'Server'):
+            self.operation = RetrieveOutputOperation(
+                mock.Mock(), output_dir='out', force_if_running=False,
+                execution_id='some-id')
+        self.operation.controller = mock.Mock()
+        self.operation.controller.download_output_files.side_effect = \
+            self.download
+
+    def download(self, execution_id: str, part_path: str):
+        tarball = io.BytesIO()
+        with tarfile.open(fileobj=tarball, mode='w') as tar:
+            _add_file(tar, 'output/file', b'some content')
+        with open(part_path, 'wb') as f:
+            f.write(tarball.getvalue())
+
+    def test_retrieves_into_a_relative_directory(self):
+        self.operation.retrieve_output()
+
+        download = self.operation.controller.download_output_files
+        download.assert_called_once_with('some-id', 'out.tar.part')
+        with open(os.path.join('out', 'file'), 'rb') as f:
+            self.assertEqual(f.read(), b'some content')
+        self.assertEqual(sorted(os.listdir(os.curdir)), ['out'])
+
+
+def _add_file(tar: tarfile.TarFile, name: str, content: bytes):
+    tarinfo = tarfile.TarInfo(name)
+    tarinfo.size = len(content)
+    tar.addfile(tarinfo, io.BytesIO(content))
+
+
+def _add_link(link_type: bytes, tar: tarfile.TarFile, name: str,
+              target: str):
+    tarinfo = tarfile.TarInfo(name)
+    tarinfo.type = link_type
+    tarinfo.linkname = target
+    tar.addfile(tarinfo)
@@ -0,0 +1,32 @@
+import json
+import unittest
+
+from plz.cli.exceptions import CLIException
+from plz.cli.run_execution_operation import split_finalization_frames
+
+
+class RunExecutionOperationTest(unittest.TestCase):
+    def test_splits_finalization_frames(self):
+        status = {'running': False, 'success': True, 'exit_status': 0}
+        frames = [
+            ({'stream': 'status'}, json.dumps(status).encode('utf-8')),
+            ({'stream': 'measures'}, b'{\n  "loss": 0.1\n}\n'),
+            ({'stream': 'output'}, b'tar'),
+            ({'stream': 'output'}, b'ball'),
+            ({'stream': 'end'}, b''),
+        ]
+        actual_status, summary_measures, output_tarball_bytes = \
+            split_finalization_frames(iter(frames))
+        self.assertEqual(actual_status, status)
+        self.assertEqual(summary_measures, '{\n  "loss": 0.1\n}\n')
+        self.assertEqual(b''.join(output_tarball_bytes), b'tarball')
+
+    def test_output_cut_short_is_an_error(self):
+        frames = [
+            ({'stream': 'status'}, b'{"success": true}'),
+            ({'stream': 'measures'}, b''),
+            ({'stream': 'output'}, b'tar'),
+        ]
+        _, _, output_tarball_bytes = split_finalization_frames(iter(frames))
+        with self.assertRaises(CLIException):
+            b''.join(output_tarball_bytes)
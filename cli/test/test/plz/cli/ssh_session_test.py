@@ -0,0 +1,60 @@
+import os
+import socket
+import stat
+import threading
+import unittest
+from unittest import mock
+
+from plz.cli import ssh_session
+from plz.cli.ssh_session import SSHTunnel
+
+
+class StandInChannel:
+    """A connection to an echo server, instead of an SSH channel"""
+
+    def __init__(self):
+        self.socket, server = socket.socketpair()
+        threading.Thread(
+            target=_echo, args=(server,), daemon=True).start()
+        self.recv = self.socket.recv
+        self.sendall = self.socket.sendall
+        self.close = self.socket.close
+
+    def shutdown_write(self):
+        self.socket.shutdown(socket.SHUT_WR)
+
+
+class SSHTunnelTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(
+            ssh_session, '_open_channel',
+            side_effect=lambda *args: StandInChannel())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tunnel = SSHTunnel('some-host', 5000, {})
+        self.addCleanup(self.tunnel.close)
+
+    def test_forwards_connections_to_the_socket(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(self.tunnel.socket_path)
+            client.sendall(b'some request')
+            client.shutdown(socket.SHUT_WR)
+            self.assertEqual(client.makefile('rb').read(), b'some request')
+
+    def test_only_the_user_can_connect(self):
+        for path in [self.tunnel.directory, self.tunnel.socket_path]:
+            self.assertEqual(
+                stat.S_IMODE(os.stat(path).st_mode) & 0o077, 0, path)
+
+    def test_removes_the_socket_when_closed(self):
+        self.tunnel.close()
+        self.assertFalse(os.path.exists(self.tunnel.directory))
+
+
+def _echo(server: socket.socket):
+    with server:
+        while True:
+            data = server.recv(1024)
+            if not data:
+                return
+            server.sendall(data)
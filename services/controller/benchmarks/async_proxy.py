@@ -0,0 +1,129 @@
+"""
+Compares driving many executions with the synchronous `ControllerProxy`
+against the `AsyncControllerProxy`.
+
+It serves a synthetic controller, where each request takes `--latency`
+seconds (as over the `http-ssh` tunnel), and for N executions it starts
+them, gets their statuses and reads their logs. The synchronous proxy runs
+them one after the other, and in a pool of threads; the asynchronous one
+runs them all at the same time.
+
+Usage:
+  python async_proxy.py [--executions N] [--latency SECONDS] [--threads N]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from flask import Flask, Response
+from werkzeug.serving import make_server
+
+from plz.cli.async_controller_proxy import AsyncControllerProxy
+from plz.cli.async_server import AsyncServer
+from plz.cli.controller_proxy import ControllerProxy
+from plz.cli.server import Server
+
+
+def create_app(latency: float) -> Flask:
+    app = Flask(__name__)
+
+    @app.route('/executions', methods=['POST'])
+    def run_execution():
+        def act():
+            time.sleep(latency)
+            yield json.dumps({'id': 'some-id'}) + '\n'
+            yield json.dumps({'status': 'queued'}) + '\n'
+        return Response(act(), status=202, mimetype='text/plain')
+
+    @app.route('/executions/<execution_id>/status')
+    def get_status(execution_id):
+        time.sleep(latency)
+        return Response(json.dumps({'running': True}),
+                        mimetype='application/json')
+
+    @app.route('/executions/<execution_id>/logs')
+    def get_logs(execution_id):
+        def act():
+            for i in range(10):
+                yield f'Line {i}\n'.encode('utf-8')
+            time.sleep(latency)
+        return Response(act(), mimetype='application/octet-stream')
+
+    return app
+
+
+def drive_sync(controller: ControllerProxy, n: int):
+    events = list(controller.run_execution(
+        command=['true'], snapshot_id=str(n), parameters={},
+        instance_market_spec={}, execution_spec={}, start_metadata={}))
+    controller.get_status(events[0]['id'])
+    for _ in controller.get_logs(events[0]['id'], since=None):
+        pass
+
+
+async def drive_async(controller: AsyncControllerProxy, n: int):
+    events = [e async for e in await controller.run_execution(
+        command=['true'], snapshot_id=str(n), parameters={},
+        instance_market_spec={}, execution_spec={}, start_metadata={})]
+    await controller.get_status(events[0]['id'])
+    async for _ in await controller.get_logs(events[0]['id'], since=None):
+        pass
+
+
+def timed(act: Callable[[], None]) -> float:
+    start = time.time()
+    act()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--executions', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    # Otherwise the server logs every request
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server(
+        '127.0.0.1', 0, create_app(args.latency), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+    executions = range(args.executions)
+
+    sync_controller = ControllerProxy(Server('127.0.0.1', port))
+
+    def sequential():
+        for n in executions:
+            drive_sync(sync_controller, n)
+
+    def in_threads():
+        with ThreadPoolExecutor(args.threads) as executor:
+            list(executor.map(
+                lambda n: drive_sync(sync_controller, n), executions))
+
+    def concurrent():
+        async def act():
+            async with AsyncControllerProxy(
+                    AsyncServer('127.0.0.1', port)) as controller:
+                await asyncio.gather(
+                    *(drive_async(controller, n) for n in executions))
+        asyncio.new_event_loop().run_until_complete(act())
+
+    print('proxy\tseconds\texecutions_per_second')
+    for name, act in [('sync', sequential),
+                      (f'sync_{args.threads}_threads', in_threads),
+                      ('async', concurrent)]:
+        seconds = timed(act)
+        print(f'{name}\t{seconds:.2f}\t{args.executions / seconds:.0f}',
+              flush=True)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Measures the effect of compressing responses over a slow link.
+
+Requests go through a local proxy that throttles the bandwidth, to mimic the
+`http-ssh` tunnel. For each content encoding it measures the bytes sent over
+the link, the time to download a large log, and the time until the first
+line of a live log arrives (which must not wait for the compressor).
+
+By default it serves synthetic logs with the controller compression. To
+measure a real controller, pass `--controller HOST:PORT --path PATH`, for
+instance `--path /executions/EXECUTION_ID/logs`; the live log is skipped.
+
+Usage:
+  python compressed_streams.py [--bytes-per-second N] [--log-lines N]
+    [--controller HOST:PORT --path PATH]
+
+Needs urllib3 2, and `urllib3[zstd]` to measure zstd.
+"""
+import argparse
+import random
+import socket
+import threading
+import time
+from typing import Optional, Tuple
+
+import requests
+from flask import Flask, Response, request
+from urllib3.util.request import ACCEPT_ENCODING
+from werkzeug.serving import make_server
+
+from plz.controller import compression
+from plz.controller.api.types import ACCEPT_COMPRESSED_HEADER
+
+_LIVE_LINE_PERIOD_SECONDS = 0.5
+
+
+class ThrottlingProxy:
+    def __init__(self, upstream: Tuple[str, int], bytes_per_second: int):
+        self.upstream = upstream
+        self.bytes_per_second = bytes_per_second
+        self.bytes_downstream = 0
+        self.lock = threading.Lock()
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(16)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self.listener.accept()
+            server = socket.create_connection(self.upstream)
+            threading.Thread(
+                target=self._pump, args=(client, server, False),
+                daemon=True).start()
+            threading.Thread(
+                target=self._pump, args=(server, client, True),
+                daemon=True).start()
+
+    def _pump(self, source: socket.socket, destination: socket.socket,
+              is_downstream: bool):
+        try:
+            while True:
+                data = source.recv(4096)
+                if not data:
+                    break
+                time.sleep(len(data) / self.bytes_per_second)
+                if is_downstream:
+                    with self.lock:
+                        self.bytes_downstream += len(data)
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            # Not `close`, which wouldn't wake up the pump in the other
+            # direction
+            try:
+                destination.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+
+def synthetic_log_line(n: int) -> bytes:
+    loss = random.random()
+    return (f'2018-10-01 12:00:00 INFO Epoch {n // 100}, batch {n % 100}: '
+            f'loss={loss:.6f}, accuracy={1 - loss:.6f}\n').encode('utf-8')
+
+
+def create_synthetic_app(log_lines: int) -> Flask:
+    app = Flask(__name__)
+
+    @app.route('/logs')
+    def logs():
+        return Response((synthetic_log_line(n) for n in range(log_lines)),
+                        mimetype='application/octet-stream')
+
+    @app.route('/live')
+    def live():
+        def act():
+            for n in range(3):
+                yield synthetic_log_line(n)
+                time.sleep(_LIVE_LINE_PERIOD_SECONDS)
+        return Response(act(), mimetype='application/octet-stream')
+
+    @app.after_request
+    def compress_response(response: Response) -> Response:
+        encoding = request.accept_encodings.best_match(
+            compression.available_encodings())
+        return compression.compress_response(response, encoding, 1024)
+
+    return app
+
+
+def _headers(encoding: str) -> dict:
+    # As the CLI, so that a real controller compresses
+    return {'Accept-Encoding': encoding, ACCEPT_COMPRESSED_HEADER: 'true'}
+
+
+def download(url: str, encoding: str) -> Tuple[float, int]:
+    start = time.time()
+    response = requests.get(
+        url, headers=_headers(encoding), stream=True)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    decoded_size = sum(len(line) for line in response.raw)
+    return time.time() - start, decoded_size
+
+
+def first_line_seconds(url: str, encoding: str) -> float:
+    start = time.time()
+    response = requests.get(
+        url, headers=_headers(encoding), stream=True)
+    # Unlike reading lines, `read1` doesn't wait for a full buffer when the
+    # server doesn't send chunks, as the development server does
+    while len(response.raw.read1(decode_content=True)) == 0:
+        if response.raw.closed:
+            break
+    seconds = time.time() - start
+    response.close()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bytes-per-second', type=int, default=512 * 1024)
+    parser.add_argument('--log-lines', type=int, default=50000)
+    parser.add_argument('--controller', default=None)
+    parser.add_argument('--path', default='/logs')
+    args = parser.parse_args()
+
+    live_path: Optional[str] = None
+    if args.controller is None:
+        server = make_server(
+            '127.0.0.1', 0, create_synthetic_app(args.log_lines),
+            threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        upstream = ('127.0.0.1', server.server_port)
+        live_path = '/live'
+    else:
+        host, port = args.controller.split(':')
+        upstream = (host, int(port))
+
+    proxy = ThrottlingProxy(upstream, args.bytes_per_second)
+    prefix = f'http://127.0.0.1:{proxy.port}'
+    print('encoding\tlink_bytes\tdecoded_bytes\tseconds\tfirst_line_seconds')
+    # Only the encodings that urllib3 (and so the CLI) can decode here
+    decodable_encodings = ACCEPT_ENCODING.split(',')
+    for encoding in ['identity'] + compression.available_encodings():
+        if encoding != 'identity' and encoding not in decodable_encodings:
+            print(f'{encoding}\tcan\'t be decoded by this urllib3')
+            continue
+        bytes_before = proxy.bytes_downstream
+        seconds, decoded_size = download(prefix + args.path, encoding)
+        link_bytes = proxy.bytes_downstream - bytes_before
+        first_line = '-'
+        if live_path is not None:
+            seconds_to_first_line = first_line_seconds(
+                prefix + live_path, encoding)
+            first_line = f'{seconds_to_first_line:.3f}'
+        print(f'{encoding}\t{link_bytes}\t{decoded_size}\t{seconds:.3f}\t'
+              f'{first_line}', flush=True)
+
+
+if __name__ == '__main__':
+    main()
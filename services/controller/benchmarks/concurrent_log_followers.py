@@ -0,0 +1,82 @@
+"""
+Measures how many concurrent log followers a controller can hold.
+
+It opens an increasing number of streams following the logs of a running
+execution, and while they are open it measures the latency of `/ping`.
+The controller is considered saturated when pings start failing or their
+latency goes over the threshold.
+
+Usage:
+  python concurrent_log_followers.py HOST:PORT EXECUTION_ID \
+    [--max-followers N] [--step N] [--max-ping-seconds S]
+
+Start the execution with something like `sleep 3600` so that log streams
+stay open for the whole benchmark. Run it once with
+`server.worker_class = sync` and once with `server.worker_class = gevent`
+to compare.
+"""
+import argparse
+import threading
+import time
+from typing import List
+
+import requests
+
+
+def follow_logs(url: str, stop: threading.Event, opened: List[bool]):
+    try:
+        with requests.get(url, stream=True, timeout=(5, None)) as response:
+            opened.append(response.status_code == requests.codes.ok)
+            for _ in response.iter_content(chunk_size=None):
+                if stop.is_set():
+                    return
+    except requests.RequestException:
+        opened.append(False)
+
+
+def ping_latency(prefix: str, timeout: float) -> float:
+    start = time.time()
+    try:
+        requests.get(f'{prefix}/ping', timeout=timeout).raise_for_status()
+    except requests.RequestException:
+        return float('inf')
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('host_and_port')
+    parser.add_argument('execution_id')
+    parser.add_argument('--max-followers', type=int, default=1024)
+    parser.add_argument('--step', type=int, default=16)
+    parser.add_argument('--max-ping-seconds', type=float, default=1)
+    args = parser.parse_args()
+
+    prefix = f'http://{args.host_and_port}'
+    logs_url = f'{prefix}/executions/{args.execution_id}/logs'
+    stop = threading.Event()
+    opened: List[bool] = []
+    held = 0
+    print('followers\tping_seconds')
+    try:
+        while held < args.max_followers:
+            for _ in range(args.step):
+                threading.Thread(
+                    target=follow_logs, args=(logs_url, stop, opened),
+                    daemon=True).start()
+            held += args.step
+            # Give the streams time to be accepted by the controller
+            time.sleep(1)
+            latency = ping_latency(prefix, timeout=args.max_ping_seconds * 5)
+            print(f'{held}\t{latency:.3f}', flush=True)
+            if latency > args.max_ping_seconds or not all(opened):
+                print(f'Controller saturated at {held} followers '
+                      f'({opened.count(True)} streams accepted)')
+                return
+        print(f'Controller held {held} followers')
+    finally:
+        stop.set()
+
+
+if __name__ == '__main__':
+    main()
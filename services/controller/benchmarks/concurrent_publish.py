@@ -0,0 +1,115 @@
+"""
+Measures how long publishing takes when the logs, output and measures come
+from a remote worker, against the time of each stream on its own.
+
+Each stream is a stand-in for a request to the docker daemon of a worker:
+it waits for `--latency-ms` before the first chunk, and then transfers at
+`--connection-mb-per-second`. Publishing collects the three streams at the
+same time, so it should take about as long as the slowest one, rather than
+their sum. It prints the metrics stored with the results for each stream.
+
+Usage:
+  python concurrent_publish.py [--logs-mb N] [--output-mb N]
+    [--measures-mb N] [--latency-ms N] [--connection-mb-per-second N]
+"""
+import argparse
+import io
+import os
+import tarfile
+import tempfile
+import time
+from typing import Iterator
+
+from plz.controller.results import LocalResultsStorage
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+class StandInLock:
+    def acquire(self):
+        pass
+
+    def reacquire(self):
+        pass
+
+    def release(self):
+        pass
+
+
+class StandInRedis:
+    def lock(self, name: str, timeout: int, thread_local: bool):
+        return StandInLock()
+
+
+class StandInDBStorage:
+    def retrieve_start_metadata(self, execution_id: str) -> dict:
+        return {'user': 'user', 'project': 'project'}
+
+    def add_finished_execution_id(self, **kwargs):
+        pass
+
+    def add_execution_event(self, *args):
+        pass
+
+
+def tarball(name: str, size: int) -> bytes:
+    tarball = io.BytesIO()
+    with tarfile.open(fileobj=tarball, mode='w') as tar:
+        tarinfo = tarfile.TarInfo(name)
+        tarinfo.size = size
+        tar.addfile(tarinfo, io.BytesIO(os.urandom(size)))
+    return tarball.getvalue()
+
+
+def remote(content: bytes, latency_seconds: float,
+           bytes_per_second: float) -> Iterator[bytes]:
+    time.sleep(latency_seconds)
+    for i in range(0, len(content), _CHUNK_SIZE):
+        chunk = content[i:i + _CHUNK_SIZE]
+        time.sleep(len(chunk) / bytes_per_second)
+        yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logs-mb', type=int, default=16)
+    parser.add_argument('--output-mb', type=int, default=64)
+    parser.add_argument('--measures-mb', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--connection-mb-per-second', type=float, default=80)
+    args = parser.parse_args()
+
+    contents = {
+        'logs': os.urandom(args.logs_mb * 1024 * 1024),
+        'output': tarball('output/checkpoint', args.output_mb * 1024 * 1024),
+        'measures': tarball('measures/weights',
+                            args.measures_mb * 1024 * 1024),
+    }
+
+    def stream(name: str) -> Iterator[bytes]:
+        return remote(contents[name], args.latency_ms / 1000,
+                      args.connection_mb_per_second * 1024 * 1024)
+
+    with tempfile.TemporaryDirectory() as directory:
+        storage = LocalResultsStorage(
+            StandInRedis(), StandInDBStorage(), directory)
+        start = time.time()
+        storage.publish(
+            'execution', 0, logs=stream('logs'),
+            output_tarball=stream('output'),
+            measures_tarball=stream('measures'), finish_timestamp=0)
+        publish_seconds = time.time() - start
+        with storage.get('execution') as results:
+            stream_metrics = results.get_stored_metadata()['stream_metrics']
+
+    print('stream\tmb\tfetch_seconds\tseconds')
+    for name, metrics in stream_metrics.items():
+        print(f'{name}\t{metrics["bytes"] / 2 ** 20:.0f}\t'
+              f'{metrics["fetch_seconds"]:.2f}\t{metrics["seconds"]:.2f}')
+    print(f'publish_seconds: {publish_seconds:.2f}')
+    print(f'sum_of_stream_seconds: '
+          f'{sum(m["seconds"] for m in stream_metrics.values()):.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Compares storing outputs as they are (`LocalResultsStorage`) against
+storing each file once (`DeduplicatingResultsStorage`).
+
+It publishes the outputs of a synthetic sweep: every execution has the same
+`--shared-files` (like pretrained checkpoints or vocabularies), and
+`--own-files` of its own. It reports the space used on disk, the
+deduplication ratio, and the time to publish and to read all the outputs.
+
+Usage:
+  python deduplicated_results.py [--executions N] [--shared-files N]
+    [--own-files N] [--file-size-mb N]
+"""
+import argparse
+import contextlib
+import io
+import os
+import tarfile
+import tempfile
+import time
+from typing import Callable, Iterator, List, Tuple
+
+from plz.controller.results import DeduplicatingResultsStorage, \
+    LocalResultsStorage
+from plz.controller.results.results_base import ResultsStorage
+
+
+class StandInRedis:
+    def lock(self, name: str, timeout: int):
+        return contextlib.suppress()
+
+
+class StandInDBStorage:
+    def retrieve_start_metadata(self, execution_id: str) -> dict:
+        return {'user': 'user', 'project': 'project'}
+
+    def add_finished_execution_id(self, **kwargs):
+        pass
+
+    def add_execution_event(self, *args):
+        pass
+
+
+def output_tarball(shared_files: List[bytes], own_files: int,
+                   file_size: int) -> Iterator[bytes]:
+    tarball = io.BytesIO()
+    with tarfile.open(fileobj=tarball, mode='w') as tar:
+        files = [*shared_files,
+                 *(os.urandom(file_size) for _ in range(own_files))]
+        for i, content in enumerate(files):
+            tarinfo = tarfile.TarInfo(f'output/file_{i}')
+            tarinfo.size = len(content)
+            tar.addfile(tarinfo, io.BytesIO(content))
+    content = tarball.getvalue()
+    for i in range(0, len(content), 1024 * 1024):
+        yield content[i:i + 1024 * 1024]
+
+
+def disk_usage(directory: str) -> int:
+    # Blobs are linked from several directories, so count each file once
+    inodes = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            stat = os.stat(os.path.join(root, name))
+            inodes[stat.st_ino] = stat.st_blocks * 512
+    return sum(inodes.values())
+
+
+def measure(create: Callable[[str], ResultsStorage], executions: int,
+            shared_files: List[bytes], own_files: int, file_size: int) \
+        -> Tuple[int, float, float, int]:
+    with tempfile.TemporaryDirectory() as directory:
+        storage = create(directory)
+        start = time.time()
+        for i in range(executions):
+            storage.publish(
+                f'execution-{i}', 0, logs=iter([]),
+                output_tarball=output_tarball(
+                    shared_files, own_files, file_size),
+                measures_tarball=output_tarball([], 0, 0),
+                finish_timestamp=0)
+        publish_seconds = time.time() - start
+        usage = disk_usage(directory)
+
+        start = time.time()
+        read = 0
+        for i in range(executions):
+            with storage.get(f'execution-{i}') as results:
+                for chunk in results.get_output_files_tarball():
+                    read += len(chunk)
+        read_seconds = time.time() - start
+    return usage, publish_seconds, read_seconds, read
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--executions', type=int, default=10)
+    parser.add_argument('--shared-files', type=int, default=4)
+    parser.add_argument('--own-files', type=int, default=1)
+    parser.add_argument('--file-size-mb', type=int, default=16)
+    args = parser.parse_args()
+
+    file_size = args.file_size_mb * 1024 * 1024
+    shared_files = [os.urandom(file_size) for _ in range(args.shared_files)]
+    print('storage\tdisk_mb\tpublish_seconds\tread_mb_per_second')
+    usages = {}
+    for name, storage_class in [('local', LocalResultsStorage),
+                                ('deduplicating',
+                                 DeduplicatingResultsStorage)]:
+        usage, publish_seconds, read_seconds, read = measure(
+            lambda directory: storage_class(
+                StandInRedis(), StandInDBStorage(), directory),
+            args.executions, shared_files, args.own_files, file_size)
+        usages[name] = usage
+        print(f'{name}\t{usage / 2 ** 20:.0f}\t{publish_seconds:.2f}\t'
+              f'{read / 2 ** 20 / read_seconds:.0f}')
+    print(f'deduplication_ratio: '
+          f'{usages["local"] / usages["deduplicating"]:.2f}')
+
+
+if __name__ == '__main__':
+    main()
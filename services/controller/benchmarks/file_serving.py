@@ -0,0 +1,116 @@
+"""
+Compares sending a results file through a Python generator (as the
+controller did, with `read_bytes`) against `send_file`, which lets gunicorn
+use `sendfile`.
+
+It starts gunicorn with one sync worker serving a file of the given size,
+downloads it repeatedly through each path, and reports the throughput and
+the CPU time used by the worker.
+
+Usage:
+  python file_serving.py [--size-mb N] [--repeat N] [--port N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+from flask import Flask, Response, send_file
+
+from plz.controller.results.local import read_bytes
+
+_FILE_ENVIRONMENT_VARIABLE = 'PLZ_BENCHMARK_FILE'
+
+
+def create_app() -> Flask:
+    app = Flask(__name__)
+    path = os.environ[_FILE_ENVIRONMENT_VARIABLE]
+
+    @app.route('/generator')
+    def generator():
+        return Response(read_bytes(path), mimetype='application/octet-stream')
+
+    @app.route('/send_file')
+    def send_file_():
+        return send_file(path, mimetype='application/octet-stream')
+
+    return app
+
+
+def worker_cpu_seconds(master_pid: int) -> float:
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        worker_pids = f.read().split()
+    total = 0
+    for pid in worker_pids:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        # utime and stime, fields 14 and 15 of the whole line
+        total += int(fields[11]) + int(fields[12])
+    return total / os.sysconf('SC_CLK_TCK')
+
+
+def download(url: str) -> int:
+    size = 0
+    with requests.get(url, stream=True) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            size += len(chunk)
+    return size
+
+
+def wait_until_up(prefix: str):
+    for _ in range(100):
+        try:
+            requests.get(f'{prefix}/send_file', stream=True).close()
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError('gunicorn didn\'t start')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=1024)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--port', type=int, default=5127)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile() as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(args.size_mb):
+            f.write(block)
+        f.flush()
+
+        environment = dict(os.environ)
+        environment[_FILE_ENVIRONMENT_VARIABLE] = f.name
+        environment['PYTHONPATH'] = os.pathsep.join(
+            sys.path + [os.path.dirname(os.path.abspath(__file__))])
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--workers', '1',
+             '--bind', f'127.0.0.1:{args.port}', 'file_serving:create_app()'],
+            env=environment, stderr=subprocess.DEVNULL)
+        try:
+            prefix = f'http://127.0.0.1:{args.port}'
+            wait_until_up(prefix)
+            print('path\tmb_per_second\tworker_cpu_seconds_per_gb')
+            for path in ('generator', 'send_file'):
+                cpu_before = worker_cpu_seconds(server.pid)
+                start = time.time()
+                size = 0
+                for _ in range(args.repeat):
+                    size += download(f'{prefix}/{path}')
+                seconds = time.time() - start
+                cpu_seconds = worker_cpu_seconds(server.pid) - cpu_before
+                gigabytes = size / 1024 ** 3
+                print(f'{path}\t{size / 1024 ** 2 / seconds:.0f}\t'
+                      f'{cpu_seconds / gigabytes:.2f}', flush=True)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Compares JSON and msgpack for encoding the history of a project.
+
+It builds a synthetic history, with metadata shaped like the one stored by
+the controller, and measures the size of the payload and the time to encode
+and decode it in both formats. JSON is encoded the same way the controller
+streams it, an entry at a time.
+
+Usage:
+  python history_encoding.py [--executions N] [--measures N] [--repeat N]
+"""
+import argparse
+import json
+import time
+import uuid
+from typing import Callable, Tuple
+
+import msgpack
+
+
+def synthetic_history(executions: int, measures: int) -> dict:
+    history = {}
+    for i in range(executions):
+        execution_id = str(uuid.uuid4())
+        history[execution_id] = {
+            'execution_id': execution_id,
+            'user': 'user',
+            'project': 'project',
+            'instance_type': 't2.micro',
+            'start_timestamp': 1540000000 + i,
+            'finish_timestamp': 1540000100 + i,
+            'exit_status': 0,
+            'parameters': {'learning_rate': 0.01, 'epochs': 100,
+                           'layers': [64, 128, 64]},
+            'measures': {
+                'summary': {f'measure_{j}': j / 3 for j in range(measures)},
+            },
+        }
+    return history
+
+
+def encode_json(history: dict) -> bytes:
+    fragments = ['{\n']
+    for n, (execution_id, metadata) in enumerate(history.items()):
+        if n > 0:
+            fragments.append(',\n')
+        fragments.append(f'"{execution_id}": {json.dumps(metadata)}')
+    fragments.append('\n}\n')
+    return ''.join(fragments).encode('utf-8')
+
+
+def decode_json(payload: bytes) -> dict:
+    return json.loads(payload)
+
+
+def encode_msgpack(history: dict) -> bytes:
+    packer = msgpack.Packer(use_bin_type=True)
+    return b''.join(packer.pack(entry) for entry in history.items())
+
+
+def decode_msgpack(payload: bytes) -> dict:
+    unpacker = msgpack.Unpacker(raw=False)
+    unpacker.feed(payload)
+    return dict(unpacker)
+
+
+def best_time(f: Callable, argument, repeat: int) -> Tuple[float, object]:
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f(argument)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--executions', type=int, default=20000)
+    parser.add_argument('--measures', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    history = synthetic_history(args.executions, args.measures)
+    print('format\tbytes\tencode_seconds\tdecode_seconds')
+    for name, encode, decode in (('json', encode_json, decode_json),
+                                 ('msgpack', encode_msgpack, decode_msgpack)):
+        encode_seconds, payload = best_time(encode, history, args.repeat)
+        decode_seconds, decoded = best_time(decode, payload, args.repeat)
+        assert decoded == history
+        print(f'{name}\t{len(payload)}\t{encode_seconds:.3f}\t'
+              f'{decode_seconds:.3f}')
+
+
+if __name__ == '__main__':
+    main()
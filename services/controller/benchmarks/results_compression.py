@@ -0,0 +1,120 @@
+"""
+Measures storing results compressed, as `LocalResultsStorage` does with
+`results.compression`.
+
+For outputs shaped like those of training runs (logs, an output tarball of
+CSV and JSON files, and one of random bytes, like binary checkpoints), it
+reports the compression ratio and the throughput of writing and reading
+them (decompressing), for each encoding.
+
+Usage:
+  python results_compression.py [--size-mb N]
+"""
+import argparse
+import io
+import json
+import os
+import random
+import tarfile
+import tempfile
+import time
+from typing import Dict, Iterator, Optional
+
+from plz.controller.results.local import CHUNK_SIZE, LocalResultsStorage, \
+    _read_stored
+
+
+class StandInRedis:
+    pass
+
+
+class StandInDBStorage:
+    pass
+
+
+def training_logs(size: int) -> bytes:
+    lines = []
+    total = 0
+    step = 0
+    while total < size:
+        line = (f'Epoch {step // 1000} step {step}: '
+                f'loss={random.random():.6f} '
+                f'accuracy={random.random():.4f} lr=0.001\n')
+        lines.append(line)
+        total += len(line)
+        step += 1
+    return ''.join(lines).encode('utf-8')
+
+
+def text_output(size: int) -> bytes:
+    files = {
+        'metrics.csv': '\n'.join(
+            f'{i},{random.random():.6f},{random.random():.6f}'
+            for i in range(size // 40)).encode('utf-8'),
+        'vocabulary.json': json.dumps(
+            {f'token_{i}': i for i in range(size // 40)}).encode('utf-8'),
+    }
+    return tarball(files)
+
+
+def binary_output(size: int) -> bytes:
+    return tarball({'checkpoint.pt': os.urandom(size)})
+
+
+def tarball(files: Dict[str, bytes]) -> bytes:
+    output = io.BytesIO()
+    with tarfile.open(fileobj=output, mode='w') as tar:
+        for name, content in files.items():
+            tarinfo = tarfile.TarInfo(f'output/{name}')
+            tarinfo.size = len(content)
+            tar.addfile(tarinfo, io.BytesIO(content))
+    return output.getvalue()
+
+
+def chunks_of(content: bytes) -> Iterator[bytes]:
+    for i in range(0, len(content), CHUNK_SIZE):
+        yield content[i:i + CHUNK_SIZE]
+
+
+def measure(content: bytes, encoding: Optional[str]):
+    with tempfile.TemporaryDirectory() as directory:
+        storage = LocalResultsStorage(
+            StandInRedis(), StandInDBStorage(), directory,
+            compression_encoding=encoding)
+        path = os.path.join(directory, 'file')
+        start = time.time()
+        storage._write(path, chunks_of(content))
+        write_seconds = time.time() - start
+        stored_size = sum(os.path.getsize(os.path.join(directory, name))
+                          for name in os.listdir(directory))
+        start = time.time()
+        read = sum(len(chunk) for chunk in _read_stored(path))
+        read_seconds = time.time() - start
+    assert read == len(content)
+    megabytes = len(content) / 2 ** 20
+    return (len(content) / stored_size, megabytes / write_seconds,
+            megabytes / read_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=64)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    contents = {
+        'logs': training_logs(size),
+        'text_output': text_output(size),
+        'binary_output': binary_output(size),
+    }
+    print('content\tencoding\tratio\twrite_mb_per_second\t'
+          'read_mb_per_second')
+    for name, content in contents.items():
+        for encoding in [None, 'gzip', 'zstd']:
+            ratio, write_speed, read_speed = measure(content, encoding)
+            print(f'{name}\t{encoding or "none"}\t{ratio:.2f}\t'
+                  f'{write_speed:.0f}\t{read_speed:.0f}')
+
+
+if __name__ == '__main__':
+    main()
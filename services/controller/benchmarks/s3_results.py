@@ -0,0 +1,216 @@
+"""
+Compares the throughput of `S3ResultsStorage` against `LocalResultsStorage`.
+
+It publishes an output tarball of `--size-mb` and reads it back, reporting
+megabytes per second for each, and the peak memory allocated while
+publishing (which, for S3, depends on the part size and concurrency, and not
+on the size of the output).
+
+Against a bucket (S3, or an S3-compatible storage like MinIO with
+`--endpoint-url`), with the credentials boto3 finds. Without a bucket, it
+uses an in-process stand-in where each request waits for `--latency-ms` and
+each connection transfers at `--connection-mb-per-second`, like requests to
+S3 from EC2, so that it shows what concurrent transfers make up for.
+
+Usage:
+  python s3_results.py [--size-mb N] [--part-size-mb N]
+    [--concurrency N [N ...]] [--bucket BUCKET [--endpoint-url URL]]
+    [--latency-ms N] [--connection-mb-per-second N]
+"""
+import argparse
+import contextlib
+import io
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import boto3
+import botocore.config
+from botocore.exceptions import ClientError
+
+from plz.controller.results import LocalResultsStorage, S3ResultsStorage
+from plz.controller.results.results_base import ResultsStorage
+
+
+class StandInRedis:
+    def lock(self, name: str, timeout: int):
+        return contextlib.suppress()
+
+
+class StandInDBStorage:
+    def retrieve_start_metadata(self, execution_id: str) -> dict:
+        return {'user': 'user', 'project': 'project'}
+
+    def add_finished_execution_id(self, **kwargs):
+        pass
+
+    def add_execution_event(self, *args):
+        pass
+
+
+class StandInS3Client:
+    """Objects in files (so that they don't count as memory of the
+       storage), with the latency and bandwidth of a remote storage"""
+
+    def __init__(self, directory: str, latency_seconds: float,
+                 bytes_per_second: float):
+        self.directory = directory
+        self.latency_seconds = latency_seconds
+        self.bytes_per_second = bytes_per_second
+        self.uploads = 0
+        self.lock = threading.Lock()
+
+    def _transfer(self, size: int):
+        time.sleep(self.latency_seconds + size / self.bytes_per_second)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key.replace('/', '_'))
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        self._transfer(0)
+        if not os.path.exists(self._path(Key)):
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        return {'ContentLength': os.path.getsize(self._path(Key))}
+
+    def get_object(self, Bucket: str, Key: str,
+                   Range: Optional[str] = None) -> dict:
+        if not os.path.exists(self._path(Key)):
+            self._transfer(0)
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        with open(self._path(Key), 'rb') as f:
+            if Range is None:
+                content = f.read()
+            else:
+                start, end = re.fullmatch(
+                    r'bytes=(\d+)-(\d+)', Range).groups()
+                f.seek(int(start))
+                content = f.read(int(end) + 1 - int(start))
+        self._transfer(len(content))
+        return {'Body': io.BytesIO(content)}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes):
+        self._transfer(len(Body))
+        with open(self._path(Key), 'wb') as f:
+            f.write(Body)
+
+    def delete_object(self, Bucket: str, Key: str):
+        self._transfer(0)
+        if os.path.exists(self._path(Key)):
+            os.remove(self._path(Key))
+
+    def create_multipart_upload(self, Bucket: str, Key: str) -> dict:
+        self._transfer(0)
+        with self.lock:
+            self.uploads += 1
+            return {'UploadId': str(self.uploads)}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str,
+                    PartNumber: int, Body: bytes) -> dict:
+        self.put_object(Bucket, f'{UploadId}.{PartNumber}', Body)
+        return {'ETag': str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str,
+                                  MultipartUpload: dict):
+        self._transfer(0)
+        with open(self._path(Key), 'wb') as f:
+            for part in MultipartUpload['Parts']:
+                part_path = self._path(f'{UploadId}.{part["PartNumber"]}')
+                with open(part_path, 'rb') as part_file:
+                    shutil.copyfileobj(part_file, f)
+                os.remove(part_path)
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str):
+        pass
+
+
+def tarball(name: str, content: bytes) -> bytes:
+    tarball = io.BytesIO()
+    with tarfile.open(fileobj=tarball, mode='w') as tar:
+        tarinfo = tarfile.TarInfo(name)
+        tarinfo.size = len(content)
+        tar.addfile(tarinfo, io.BytesIO(content))
+    return tarball.getvalue()
+
+
+def output_tarball(size: int) -> Iterator[bytes]:
+    content = tarball('output/checkpoint', os.urandom(size))
+    for i in range(0, len(content), 1024 * 1024):
+        yield content[i:i + 1024 * 1024]
+
+
+def measure(storage: ResultsStorage, execution_id: str, size: int) \
+        -> Tuple[float, float, int]:
+    chunks = list(output_tarball(size))
+    tracemalloc.start()
+    start = time.time()
+    storage.publish(
+        execution_id, 0, logs=iter([]), output_tarball=iter(chunks),
+        measures_tarball=iter([tarball('measures/loss', b'0.5')]),
+        finish_timestamp=0)
+    publish_seconds = time.time() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.time()
+    with storage.get(execution_id) as results:
+        read = sum(len(chunk) for chunk in results.get_output_files_tarball())
+    read_seconds = time.time() - start
+    assert read == sum(len(chunk) for chunk in chunks)
+    return publish_seconds, read_seconds, peak_memory
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--part-size-mb', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 4, 8, 16])
+    parser.add_argument('--bucket')
+    parser.add_argument('--endpoint-url')
+    parser.add_argument('--latency-ms', type=float, default=30)
+    parser.add_argument('--connection-mb-per-second', type=float, default=80)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+
+    def s3_client(directory: str, concurrency: int):
+        if args.bucket is None:
+            return StandInS3Client(
+                directory, args.latency_ms / 1000,
+                args.connection_mb_per_second * 1024 * 1024)
+        return boto3.client(
+            's3', endpoint_url=args.endpoint_url,
+            config=botocore.config.Config(max_pool_connections=concurrency))
+
+    storages: Dict[str, Callable[[str], ResultsStorage]] = {
+        'local': lambda directory: LocalResultsStorage(
+            StandInRedis(), StandInDBStorage(), directory),
+    }
+    for concurrency in args.concurrency:
+        storages[f's3-concurrency-{concurrency}'] = \
+            lambda directory, concurrency=concurrency: S3ResultsStorage(
+                StandInRedis(), StandInDBStorage(),
+                s3_client(directory, concurrency),
+                args.bucket, prefix=f'benchmark-{time.time()}',
+                part_size=args.part_size_mb * 1024 * 1024,
+                max_concurrency=concurrency)
+
+    print('storage\tpublish_mb_per_second\tread_mb_per_second\t'
+          'peak_publish_memory_mb')
+    for name, create in storages.items():
+        with tempfile.TemporaryDirectory() as directory:
+            publish_seconds, read_seconds, peak_memory = measure(
+                create(directory), 'execution', size)
+        print(f'{name}\t{args.size_mb / publish_seconds:.0f}\t'
+              f'{args.size_mb / read_seconds:.0f}\t'
+              f'{peak_memory / 2 ** 20:.0f}')
+
+
+if __name__ == '__main__':
+    main()
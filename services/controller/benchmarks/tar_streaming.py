@@ -0,0 +1,131 @@
+"""
+Compares extracting the output of an execution by copying the tarball to a
+temporary file first (as the CLI did) against reading it as a stream.
+
+It builds a tarball of files of random bytes, and sends it in chunks to
+both, at `--bytes-per-second` to mimic the download. It reports the peak
+disk usage while extracting (of the whole file system, as temporary files
+have no name), the time until the first file is written, and the total
+time. Run it on an otherwise idle file system.
+
+Usage:
+  python tar_streaming.py [--files N] [--file-size-mb N]
+    [--bytes-per-second N]
+"""
+import argparse
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from typing import Callable, Iterator, List, Tuple
+
+from plz.cli.retrieve_output_operation import untar
+from plz.controller.api.iterator_reader import IteratorReader
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def synthetic_tarball(path: str, files: int, file_size: int):
+    with tarfile.open(path, mode='w') as tar:
+        for i in range(files):
+            tarinfo = tarfile.TarInfo(f'output/file_{i}')
+            tarinfo.size = file_size
+            tar.addfile(tarinfo, io.BytesIO(os.urandom(file_size)))
+
+
+def chunks_of(path: str, bytes_per_second: int) -> Iterator[bytes]:
+    start = time.time()
+    sent = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_CHUNK_SIZE)
+            if not chunk:
+                return
+            sent += len(chunk)
+            if bytes_per_second:
+                time.sleep(max(0, start + sent / bytes_per_second
+                               - time.time()))
+            yield chunk
+
+
+def untar_from_temporary_file(
+        chunks: Iterator[bytes], output_dir: str) -> Iterator[str]:
+    with tempfile.TemporaryFile() as tarball:
+        for chunk in chunks:
+            tarball.write(chunk)
+        tarball.seek(0)
+        tar = tarfile.open(fileobj=tarball)
+        for tarinfo in tar.getmembers():
+            path = tarinfo.name.split(os.sep, 1)[1]
+            yield path
+            with open(os.path.join(output_dir, path), 'wb') as dest:
+                shutil.copyfileobj(tar.extractfile(tarinfo.name), dest)
+
+
+def untar_stream(chunks: Iterator[bytes], output_dir: str) -> Iterator[str]:
+    return untar(IteratorReader(chunks), output_dir)
+
+
+def measure(extract: Callable[[Iterator[bytes], str], Iterator[str]],
+            tarball_path: str, bytes_per_second: int) \
+        -> Tuple[int, float, float]:
+    scratch = tempfile.mkdtemp()
+    output_dir = os.path.join(scratch, 'output')
+    os.makedirs(output_dir)
+    previous_tempdir, tempfile.tempdir = tempfile.tempdir, scratch
+    used_before = shutil.disk_usage(scratch).used
+    peaks: List[int] = [0]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            used = shutil.disk_usage(scratch).used - used_before
+            peaks[0] = max(peaks[0], used)
+            done.wait(0.01)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    try:
+        start = time.time()
+        first_file_seconds = None
+        paths = extract(chunks_of(tarball_path, bytes_per_second), output_dir)
+        for n, _ in enumerate(paths):
+            # The previous file is written once the next one is yielded
+            if n == 1:
+                first_file_seconds = time.time() - start
+        total_seconds = time.time() - start
+    finally:
+        done.set()
+        sampler.join()
+        tempfile.tempdir = previous_tempdir
+        shutil.rmtree(scratch)
+    return peaks[0], first_file_seconds, total_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--file-size-mb', type=int, default=64)
+    parser.add_argument('--bytes-per-second', type=int,
+                        default=256 * 1024 * 1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        tarball_path = os.path.join(directory, 'output.tar')
+        synthetic_tarball(
+            tarball_path, args.files, args.file_size_mb * 1024 * 1024)
+        print(f'tarball_mb: {os.path.getsize(tarball_path) / 2 ** 20:.0f}')
+        print('method\tpeak_disk_mb\tfirst_file_seconds\ttotal_seconds')
+        for name, extract in [('temporary_file', untar_from_temporary_file),
+                              ('stream', untar_stream)]:
+            peak, first_file_seconds, total_seconds = measure(
+                extract, tarball_path, args.bytes_per_second)
+            print(f'{name}\t{peak / 2 ** 20:.0f}\t'
+                  f'{first_file_seconds:.2f}\t{total_seconds:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # Live gauges (such as the active streams) of a worker that is gone
+    # shouldn't count anymore
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import BinaryIO, Iterator, List, Optional
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
 
 from plz.controller.api.exceptions import ResponseHandledException
+from plz.controller.api.framing import Frame
 from plz.controller.api.types import InputMetadata, JSONString
 
 
@@ -40,13 +41,71 @@ class Controller(ABC):
     def get_status(self, execution_id: str) -> dict:
         pass
 
+    @abstractmethod
+    def get_statuses(self, execution_ids: List[str]) -> Dict[str, dict]:
+        """Statuses for several executions in one go.
+
+           :returns: for each execution ID, either the status or, if it
+               couldn't be obtained, the exception (with an `exception_type`
+               entry)
+        """
+        pass
+
     @abstractmethod
     def get_logs(self, execution_id: str, since: Optional[int]) \
             -> Iterator[bytes]:
         pass
 
     @abstractmethod
-    def get_output_files(self, execution_id: str) -> Iterator[bytes]:
+    def get_multiplexed_logs(
+            self, execution_ids: List[str], since: Optional[int],
+            offsets: Optional[Dict[str, int]] = None) -> Iterator[Frame]:
+        """Follows the logs of several executions at the same time.
+
+           Headers of the frames contain the `execution_id`, the `stream`
+           (`logs`, or `end` or `error` after the last frame of an
+           execution) and the `offset` of the payload in the logs of the
+           execution.
+
+           :param offsets: for each execution ID, number of bytes of logs to
+               skip, as to resume following
+        """
+        pass
+
+    @abstractmethod
+    def get_execution_events(
+            self, last_event_id: Optional[str] = None,
+            execution_ids: Optional[List[str]] = None) \
+            -> Iterator[Optional[dict]]:
+        """Follows the events in the lifecycle of executions, as they happen.
+
+           Each event has an `id`, the `execution_id`, a `type` and a
+           `timestamp`, plus fields depending on the type. Types, in the
+           order they usually happen, are: `created`, `instance_acquired`,
+           `container_started`, `exited`, `published` (or `tombstoned`)
+           and `instance_disposed`.
+
+           Yields `None` when there were no events for a while, so that
+           callers can check that their clients are still there.
+
+           :param last_event_id: follow events after this one. By default,
+               the events from now on
+           :param execution_ids: only events for these executions
+        """
+        pass
+
+    @abstractmethod
+    def get_output_files(self, execution_id: str,
+                         paths: Optional[List[str]] = None,
+                         globs: Optional[List[str]] = None) \
+            -> Iterator[bytes]:
+        """A tarball with the output of the execution.
+
+           :param paths: only these files and directories of the output,
+               relative to the output directory
+           :param globs: only the files matching these patterns (with the
+               files in `paths`)
+        """
         pass
 
     @abstractmethod
@@ -62,7 +121,56 @@ class Controller(ABC):
         pass
 
     @abstractmethod
-    def get_history(self, user: str, project: str) -> Iterator[JSONString]:
+    def finalize_execution(self, execution_id: str) -> Iterator[Frame]:
+        """Harvests a finished execution and sends what the CLI shows at the
+           end of a run, in one go.
+
+           The `stream` in the headers of the frames is, in order: `status`
+           (the status as JSON), `measures` (the summary measures as JSON
+           text, empty if there are none), `output` (chunks of the output
+           tarball, only if the execution succeeded) and `end`.
+
+           :raises InstanceStillRunningException:
+        """
+        pass
+
+    @abstractmethod
+    def get_history(self, user: str, project: str,
+                    limit: Optional[int] = None,
+                    before: Optional[int] = None,
+                    after: Optional[int] = None,
+                    before_execution_id: Optional[str] = None,
+                    after_execution_id: Optional[str] = None) \
+            -> Iterator[JSONString]:
+        """JSON object mapping execution IDs to metadata, newest first (and
+           in reverse order of their IDs when they finished on the same
+           second).
+
+           :param limit: maximum number of executions. With `after` but not
+               `before`, the ones next to `after` (the oldest after it), so
+               that pages go towards newer executions
+           :param before: only executions with a `finish_timestamp` strictly
+               before this one
+           :param after: only executions with a `finish_timestamp` strictly
+               after this one
+           :param before_execution_id: with `before`, also the executions
+               finished at `before` that come after the one with this ID.
+               To get the next page, pass the `finish_timestamp` and the ID
+               of the last execution of the page, so that executions
+               finished on the same second aren't skipped
+           :param after_execution_id: same, for `after`
+        """
+        pass
+
+    @abstractmethod
+    def get_history_entries(
+            self, user: str, project: str, limit: Optional[int] = None,
+            before: Optional[int] = None, after: Optional[int] = None,
+            before_execution_id: Optional[str] = None,
+            after_execution_id: Optional[str] = None) \
+            -> Iterator[Tuple[str, dict]]:
+        """Same as `get_history`, but as pairs of execution ID and metadata
+           instead of JSON text"""
         pass
 
     @abstractmethod
@@ -9,6 +9,13 @@ class ResponseHandledException(Exception):
         for k in kwargs:
             setattr(self, k, kwargs[k])
 
+    def as_dict(self) -> dict:
+        """Representation in responses, from which the CLI can rebuild the
+           exception"""
+        return {'exception_type': type(self).__name__,
+                **{k: v for k, v in self.__dict__.items()
+                   if k != 'response_code'}}
+
 
 class JSONResponseException(Exception):
     def __init__(self, json_string: str):
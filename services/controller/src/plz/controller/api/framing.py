@@ -0,0 +1,55 @@
+import json
+from typing import Iterator, Optional, Tuple
+
+# Responses that interleave several streams (for instance, the logs of
+# several executions) are sent as a sequence of frames. Each frame is a line
+# with a JSON header, followed by `length` bytes of payload. The header
+# describes where the payload comes from.
+
+Frame = Tuple[dict, bytes]
+
+
+def encode_frame(header: dict, payload: bytes = b'') -> bytes:
+    header_line = json.dumps({**header, 'length': len(payload)}) + '\n'
+    return header_line.encode('utf-8') + payload
+
+
+class FrameDecoder:
+    """Reads frames from chunks of bytes of arbitrary size, as they arrive
+       from the network. Use `decode_frames` unless you need to feed the
+       chunks yourself (for instance, when they arrive asynchronously)"""
+
+    def __init__(self):
+        self.buffer = b''
+        self.header: Optional[dict] = None
+
+    def feed(self, chunk: bytes) -> Iterator[Frame]:
+        """The frames completed by the chunk"""
+        self.buffer += chunk
+        while True:
+            if self.header is None:
+                end_of_header = self.buffer.find(b'\n')
+                if end_of_header < 0:
+                    return
+                self.header = json.loads(
+                    self.buffer[:end_of_header].decode('utf-8'))
+                self.buffer = self.buffer[end_of_header + 1:]
+            length = self.header['length']
+            if len(self.buffer) < length:
+                return
+            yield self.header, self.buffer[:length]
+            self.buffer = self.buffer[length:]
+            self.header = None
+
+    def finish(self):
+        if self.header is not None or self.buffer:
+            raise ValueError('Stream of frames ended in the middle of a frame')
+
+
+def decode_frames(chunks: Iterator[bytes]) -> Iterator[Frame]:
+    """Reads frames from chunks of bytes of arbitrary size, as they arrive
+       from the network"""
+    decoder = FrameDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    decoder.finish()
@@ -0,0 +1,29 @@
+import io
+from typing import Iterator
+
+
+class IteratorReader(io.RawIOBase):
+    """A file reading the chunks of an iterator, as they are needed.
+
+       Unlike werkzeug's `IterIO`, reading a large stream in small pieces
+       (as `tarfile` does) doesn't copy the rest of the chunk every time."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        super().__init__()
+        self.chunks = chunks
+        # A view, so that taking the start of it doesn't copy the rest
+        self.pending = memoryview(b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.pending:
+            try:
+                self.pending = memoryview(next(self.chunks))
+            except StopIteration:
+                return 0
+        n = min(len(buffer), len(self.pending))
+        buffer[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
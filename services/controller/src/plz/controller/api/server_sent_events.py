@@ -0,0 +1,49 @@
+import json
+from typing import Iterator, Optional
+
+# Execution events are sent as Server-Sent Events, so that browsers can
+# follow them with an `EventSource`. The `id` of each event can be sent back
+# in the `Last-Event-ID` header to resume after it.
+
+MIMETYPE = 'text/event-stream'
+
+# Comments are ignored by clients, but let them (and proxies in between) know
+# that the connection is alive
+KEEP_ALIVE = ': keep-alive\n\n'
+
+
+def encode_event(event: dict) -> str:
+    return (f'id: {event["id"]}\n'
+            f'event: {event["type"]}\n'
+            f'data: {json.dumps(event)}\n\n')
+
+
+class EventDecoder:
+    """Reads the events encoded with `encode_event`, a line at a time. Use
+       `decode_events` unless you need to feed the lines yourself"""
+
+    def __init__(self):
+        self.data_lines = []
+
+    def feed_line(self, line: str) -> Optional[dict]:
+        """:param line: a line of the stream, without the line terminator
+           :returns: the event completed by the line, if any"""
+        if line == '':
+            data_lines, self.data_lines = self.data_lines, []
+            if len(data_lines) > 0:
+                return json.loads('\n'.join(data_lines))
+        elif line.startswith('data:'):
+            value = line[len('data:'):]
+            self.data_lines.append(
+                value[1:] if value.startswith(' ') else value)
+        return None
+
+
+def decode_events(lines: Iterator[str]) -> Iterator[dict]:
+    """Reads the events encoded with `encode_event` from the lines of the
+       stream, without line terminators"""
+    decoder = EventDecoder()
+    for line in lines:
+        event = decoder.feed_line(line)
+        if event is not None:
+            yield event
@@ -0,0 +1,38 @@
+import os
+import tarfile
+from typing import Optional
+
+# Paths of the members of output and measures tarballs, relative to the
+# directory that was tarred up. Used by the controller when reading them,
+# and by the CLI when extracting them.
+
+
+def path_in_tarball(name: str) -> Optional[str]:
+    """:returns: the path of the member, or `None` for the directory that
+                was tarred up"""
+    # Drop the first segment, because it's just the name of the
+    # directory that was tarred up, and we don't care.
+    path_segments = name.split(os.sep)[1:]
+    if not path_segments:
+        return None
+    # Unfortunately we can't just pass `*path_segments`
+    # because `os.path.join` explicitly expects an argument
+    # for the first parameter.
+    return os.path.join(path_segments[0], *path_segments[1:])
+
+
+def link_target_name(tarinfo: tarfile.TarInfo) -> Optional[str]:
+    """:returns: the name of the target in the tarball, or `None` if it's
+                outside of it"""
+    # Hard links name their target from the root of the tarball, symbolic
+    # links from their directory
+    if tarinfo.issym():
+        name = os.path.normpath(os.path.join(
+            os.path.dirname(tarinfo.name), tarinfo.linkname))
+    else:
+        name = os.path.normpath(tarinfo.linkname)
+    # Say, `output/a -> ../../../etc/passwd`. We'd copy whatever is there
+    if os.path.isabs(name) or name == os.pardir or \
+            name.startswith(os.pardir + os.sep):
+        return None
+    return name
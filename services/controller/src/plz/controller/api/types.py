@@ -29,3 +29,12 @@ class InputMetadata:
 
 
 JSONString = str
+
+# Binary alternative to JSON for structured responses, used when the client
+# accepts it
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+# Sent by clients that decode compressed responses, whatever they are read
+# with. Older clients read some responses as they come, so responses are
+# compressed (according to `Accept-Encoding`) only for clients sending it
+ACCEPT_COMPRESSED_HEADER = 'X-Plz-Accept-Compressed'
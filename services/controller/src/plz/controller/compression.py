@@ -0,0 +1,154 @@
+import zlib
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, Optional
+
+from flask import Response
+
+from plz.controller.api.types import MSGPACK_MIMETYPE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Anything else is either tiny or likely to be compressed already
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/octet-stream',
+    'text/plain',
+    MSGPACK_MIMETYPE,
+}
+
+
+# Suffixes of files stored compressed
+FILE_SUFFIXES = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+
+class ChunkCompressor(ABC):
+    """Compresses a response a chunk at a time. Unless told otherwise, each
+       chunk is flushed, so that the client can decompress it as soon as it
+       arrives (which is what keeps followed logs live)"""
+
+    @abstractmethod
+    def compress(self, chunk: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def finish(self) -> bytes:
+        pass
+
+
+class GzipChunkCompressor(ChunkCompressor):
+    def __init__(self, level: int = 6, flush: bool = True):
+        # 16 + MAX_WBITS writes the gzip header and trailer
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                           16 + zlib.MAX_WBITS)
+        self.flush = flush
+
+    def compress(self, chunk: bytes) -> bytes:
+        if not self.flush:
+            return self.compressor.compress(chunk)
+        return self.compressor.compress(chunk) + \
+            self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class ZstdChunkCompressor(ChunkCompressor):
+    def __init__(self, level: int = 3, flush: bool = True):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        self.flush = flush
+
+    def compress(self, chunk: bytes) -> bytes:
+        if not self.flush:
+            return self.compressor.compress(chunk)
+        return self.compressor.compress(chunk) + self.compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encodings() -> [str]:
+    """Supported content encodings, most preferred first.
+
+       As every chunk is flushed, zstd does worse than gzip for small chunks
+       (like lines of logs), so we use it only when the client prefers it"""
+    if zstandard is not None:
+        return ['gzip', 'zstd']
+    return ['gzip']
+
+
+def create_compressor(encoding: str, flush: bool = True) -> ChunkCompressor:
+    if encoding == 'zstd' and zstandard is not None:
+        return ZstdChunkCompressor(flush=flush)
+    elif encoding == 'gzip':
+        return GzipChunkCompressor(flush=flush)
+    raise ValueError(f'Unsupported content encoding: {encoding}')
+
+
+def decompress_chunks(chunks: Iterator[bytes], encoding: str) \
+        -> Iterator[bytes]:
+    if encoding == 'zstd' and zstandard is not None:
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    elif encoding == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    else:
+        raise ValueError(f'Unsupported content encoding: {encoding}')
+    for chunk in chunks:
+        decompressed = decompressor.decompress(chunk)
+        if decompressed:
+            yield decompressed
+    if encoding == 'gzip':
+        yield decompressor.flush()
+
+
+def compress_response(response: Response, encoding: Optional[str],
+                      min_size: int) -> Response:
+    """Compresses the response with the encoding, if it's worth it.
+
+       Streamed responses are compressed as they are produced. Other
+       responses are compressed only if they have at least `min_size`
+       bytes"""
+    response.vary.add('Accept-Encoding')
+    if encoding is None or not _is_compressible(response):
+        return response
+    compressor = create_compressor(encoding)
+    if response.is_streamed:
+        original_iterable = response.response
+        response.response = _compress_chunks(
+            response.iter_encoded(), original_iterable, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(compressor.compress(data) + compressor.finish())
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _is_compressible(response: Response) -> bool:
+    # Files are sent as they are, so that they can be served by the web
+    # server and requested by ranges
+    return response.status_code == 200 \
+        and not response.direct_passthrough \
+        and 'Content-Encoding' not in response.headers \
+        and response.mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def _compress_chunks(chunks: Iterator[bytes], original_iterable: Iterable,
+                     compressor: ChunkCompressor) -> Iterator[bytes]:
+    try:
+        for chunk in chunks:
+            if len(chunk) > 0:
+                yield compressor.compress(chunk)
+        yield compressor.finish()
+    finally:
+        # The WSGI server closes our generator, not the original one
+        if hasattr(original_iterable, 'close'):
+            original_iterable.close()
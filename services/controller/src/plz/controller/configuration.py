@@ -1,26 +1,34 @@
 import collections
 import os
 import sys
+import threading
+from typing import Callable, Dict, Generic, TypeVar
 
 import boto3
+import botocore.config
 import docker
 import pyhocon
-from redis import StrictRedis
 
+from plz.controller import docker_hosts, metrics, tracing
 from plz.controller.containers import Containers
 from plz.controller.images import ECRImages, LocalImages
 from plz.controller.instances.aws.ec2_instance_group import EC2InstanceGroup
 from plz.controller.instances.localhost import Localhost
+from plz.controller.instances.publications import Publications
 from plz.controller.redis_db_storage import RedisDBStorage
-from plz.controller.results import LocalResultsStorage
+from plz.controller.results import DeduplicatingResultsStorage, \
+    LocalResultsStorage, S3ResultsStorage
 from plz.controller.volumes import Volumes
 
 AMI_TAG = '2018-07-05'
 WORKER_AMI = f'plz-worker-{AMI_TAG}'
 
-Dependencies = collections.namedtuple(
-    'Dependencies',
-    ['redis', 'instance_provider', 'images', 'results_storage', 'db_storage'])
+T = TypeVar('T')
+
+# Who can use the profiling endpoints. They are disabled unless enabled in
+# the configuration, and, if there's a token, need it as a bearer token
+ProfilingAccess = collections.namedtuple(
+    'ProfilingAccess', ['enabled', 'token'])
 
 
 def load() -> pyhocon.ConfigTree:
@@ -47,35 +55,130 @@ def load_from_file(path) -> pyhocon.ConfigTree:
     return pyhocon.ConfigFactory.parse_file(path)
 
 
+class _BuiltOnFirstUse(Generic[T]):
+    """An attribute of `Dependencies`, built by the decorated method the
+       first time it's read. If building fails, the exception goes to the
+       reader, and the next read tries again"""
+
+    def __init__(self, build: Callable[['Dependencies'], T]):
+        self.build = build
+        self.name = build.__name__
+
+    def __get__(self, dependencies: 'Dependencies', owner) -> T:
+        if dependencies is None:
+            return self
+        built = dependencies.built.get(self.name)
+        if built is not None:
+            return built
+        # One lock per dependency, so that a dependency that takes long to
+        # build (say, because AWS is slow) doesn't hold the others
+        with dependencies.locks[self.name]:
+            if self.name not in dependencies.built:
+                dependencies.built[self.name] = self.build(dependencies)
+            return dependencies.built[self.name]
+
+
+class Dependencies:
+    """The dependencies of the controller. They are built when first used,
+       and not when the controller starts, so that workers start quickly,
+       and start even if AWS, docker or redis are unreachable for a while"""
+
+    def __init__(self, config):
+        self.config = config
+        self.built: Dict[str, object] = {}
+        self.locks = {name: threading.Lock() for name in _dependency_names()}
+
+    @_BuiltOnFirstUse
+    def redis(self):
+        return metrics.InstrumentedRedis(
+            host=self.config.get('redis_host', 'localhost'))
+
+    @_BuiltOnFirstUse
+    def db_storage(self):
+        # DB storage can only be redis for now, but in case we want to drop
+        # redis for something else, or allow other DBs to be specified in the
+        # info, the dependence on redis is nicely encapsulated here
+        return _db_storage_from(self.redis)
+
+    @_BuiltOnFirstUse
+    def images(self):
+        return _images_from(self.config)
+
+    @_BuiltOnFirstUse
+    def results_storage(self):
+        return _results_storage_from(
+            self.config, self.redis, self.db_storage)
+
+    @_BuiltOnFirstUse
+    def instance_provider(self):
+        return _instance_provider_from(
+            self.config, self.images, self.redis, self.results_storage)
+
+    def readiness(self) -> Dict[str, dict]:
+        """Builds the dependencies that aren't built yet, and checks that
+           the services behind them answer.
+
+           :returns: for each dependency, whether it's ready and, if not,
+                     the error"""
+        statuses = {}
+        for name in _dependency_names():
+            try:
+                _READINESS_CHECKS.get(name, _is_built)(getattr(self, name))
+                statuses[name] = {'ready': True}
+            except Exception as e:
+                statuses[name] = {'ready': False,
+                                  'error': f'{type(e).__name__}: {e}'}
+        return statuses
+
+
+def _dependency_names() -> [str]:
+    return [name for name, value in vars(Dependencies).items()
+            if isinstance(value, _BuiltOnFirstUse)]
+
+
 def dependencies_from_config(config) -> Dependencies:
-    redis = StrictRedis(host=config.get('redis_host', 'localhost'))
-    # DB storage can only be redis for now, but in case we want to drop redis
-    # for something else, or allow other DBs to be specified in the info,
-    # the dependence on redis is nicely encapsulated here
-    db_storage = _db_storage_from(redis)
-    images = _images_from(config)
-    results_storage = _results_storage_from(config, redis, db_storage)
-    instance_provider = _instance_provider_from(
-        config, images, redis, results_storage)
-    return Dependencies(
-        redis, instance_provider, images, results_storage, db_storage)
+    dependencies = Dependencies(config)
+    docker_hosts.configure(
+        connect_timeout_seconds=config.get_float(
+            'instances.docker_connect_timeout_in_seconds', 5),
+        read_timeout_seconds=config.get_float(
+            'instances.docker_read_timeout_in_seconds', 60),
+        failures_to_open=config.get_int(
+            'instances.docker_failures_to_open_circuit', 3),
+        open_seconds=config.get_float(
+            'instances.docker_circuit_open_in_seconds', 30))
+    tracing.configure(
+        lambda: dependencies.db_storage,
+        otlp_endpoint=config.get('tracing.otlp_endpoint', None))
+    return dependencies
+
+
+def profiling_access_from_config(config) -> ProfilingAccess:
+    return ProfilingAccess(
+        enabled=config.get_bool('profiling.enabled', False),
+        token=config.get('profiling.token', None))
 
 
 def _instance_provider_from(
         config, images, redis, results_storage):
     docker_host = get_docker_host_from_config(config)
     instance_provider_type = config.get('instances.provider', 'localhost')
+    publications = Publications(
+        redis, results_storage,
+        max_workers=config.get_int(
+            'instances.max_concurrent_publications', 4))
     if instance_provider_type == 'localhost':
         containers = Containers.for_host(docker_host)
         volumes = Volumes.for_host(docker_host)
         instance_provider = Localhost(
-            results_storage, images, containers, volumes, redis)
+            results_storage, images, containers, volumes, redis,
+            publications)
     elif instance_provider_type == 'aws-ec2':
         instance_provider = EC2InstanceGroup(
             redis=redis,
-            client=boto3.client(
+            client=metrics.instrument_aws_client(boto3.client(
                 service_name='ec2',
-                region_name=config['instances.region']),
+                region_name=config['instances.region'])),
             aws_worker_ami=WORKER_AMI,
             aws_key_name=config.get('instances.key_name', None),
             results_storage=results_storage,
@@ -88,6 +191,7 @@ def _instance_provider_from(
             worker_security_group_names=config.get(
                 'instances.worker_security_group_names', []),
             use_public_dns=config.get('instances.use_public_dns', False),
+            publications=publications,
         )
     else:
         raise ValueError('Invalid instance provider.')
@@ -105,8 +209,8 @@ def _images_from(config):
         images = LocalImages(docker_api_client_creator, repository)
     elif images_type == 'aws-ecr':
         def ecr_client_creator():
-            return boto3.client(service_name='ecr',
-                                region_name=config['images.region'])
+            return metrics.instrument_aws_client(boto3.client(
+                service_name='ecr', region_name=config['images.region']))
         repository_without_registry = config['images.repository']
         images = ECRImages(
             docker_api_client_creator, ecr_client_creator,
@@ -136,9 +240,42 @@ def _results_storage_from(config, redis, db_storage):
     results_storage_type = config.get('results.provider', 'local')
     if results_storage_type == 'local':
         directory = config.get('results.directory')
-        results_storage = LocalResultsStorage(redis, db_storage, directory)
-    elif results_storage_type == 'aws-s3':  # TODO: Implement this
-        raise NotImplementedError('The AWS S3 provider is not implemented.')
+        results_storage = LocalResultsStorage(
+            redis, db_storage, directory,
+            finished_results_cache_size=config.get_int(
+                'results.finished_cache_size', 1000),
+            compression_encoding=config.get('results.compression', None))
+    elif results_storage_type == 'local-deduplicated':
+        directory = config.get('results.directory')
+        results_storage = DeduplicatingResultsStorage(
+            redis, db_storage, directory,
+            finished_results_cache_size=config.get_int(
+                'results.finished_cache_size', 1000),
+            compression_encoding=config.get('results.compression', None),
+            garbage_collection_interval_seconds=60 * config.get_int(
+                'results.garbage_collection_interval_in_minutes', 60))
+    elif results_storage_type == 'aws-s3':
+        # Rather than storing uncompressed what was meant to be compressed
+        if config.get('results.compression', None) is not None:
+            raise ValueError(
+                'Compression of results is only available for local results')
+        max_concurrency = config.get_int('results.max_concurrent_transfers', 8)
+        results_storage = S3ResultsStorage(
+            redis, db_storage,
+            client=metrics.instrument_aws_client(boto3.client(
+                service_name='s3',
+                region_name=config.get('results.region', None),
+                # For S3-compatible storages, like MinIO
+                endpoint_url=config.get('results.endpoint_url', None),
+                config=botocore.config.Config(
+                    max_pool_connections=max_concurrency))),
+            bucket=config['results.bucket'],
+            prefix=config.get('results.prefix', ''),
+            part_size=1024 * 1024 * config.get_int(
+                'results.part_size_in_mb', 8),
+            max_concurrency=max_concurrency,
+            finished_results_cache_size=config.get_int(
+                'results.finished_cache_size', 1000))
     else:
         raise ValueError('Invalid results storage provider.')
     return results_storage
@@ -146,3 +283,28 @@ def _results_storage_from(config, redis, db_storage):
 
 def _db_storage_from(redis):
     return RedisDBStorage(redis)
+
+
+def _is_built(_):
+    pass
+
+
+def _check_instance_provider(instance_provider):
+    if isinstance(instance_provider, Localhost):
+        instance_provider.containers.docker_client.ping()
+    elif isinstance(instance_provider, EC2InstanceGroup):
+        instance_provider.client.describe_instances(MaxResults=5)
+
+
+def _check_results_storage(results_storage):
+    if isinstance(results_storage, S3ResultsStorage):
+        results_storage.client.head_bucket(Bucket=results_storage.bucket)
+
+
+# What to check, other than building the dependency
+_READINESS_CHECKS: Dict[str, Callable[[object], None]] = {
+    'redis': lambda redis: redis.ping(),
+    'images': lambda images: images.docker_api_client.ping(),
+    'instance_provider': _check_instance_provider,
+    'results_storage': _check_results_storage,
+}
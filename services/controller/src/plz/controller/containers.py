@@ -10,6 +10,7 @@ import requests
 from docker.models.containers import Container
 from docker.types import Mount
 
+from plz.controller import docker_hosts, metrics
 from plz.controller.api.exceptions import WorkerUnreachableException
 
 ContainerState = collections.namedtuple(
@@ -24,12 +25,13 @@ class Containers:
 
     @staticmethod
     def for_host(docker_url):
-        docker_client = docker.DockerClient(base_url=docker_url)
+        docker_client = docker_hosts.docker_client(docker_url)
         return Containers(docker_client)
 
     def __init__(self, docker_client: docker.DockerClient):
         self.docker_client = docker_client
 
+    @metrics.docker_call
     def run(self,
             execution_id: str,
             repository: str,
@@ -52,6 +54,7 @@ class Containers:
         )
         log.info(f'Started container: {container.id}')
 
+    @metrics.docker_call
     def logs(self,
              execution_id: str,
              since: Optional[int],
@@ -63,6 +66,7 @@ class Containers:
             stdout=stdout, stderr=stderr, stream=True, follow=True,
             since=since)
 
+    @metrics.docker_call
     def stop(self, name: str):
         try:
             container = self.from_execution_id(name)
@@ -70,6 +74,7 @@ class Containers:
             return
         container.stop()
 
+    @metrics.docker_call
     def rm(self, execution_id: str):
         try:
             container = self.from_execution_id(execution_id)
@@ -78,6 +83,7 @@ class Containers:
         container.stop()
         container.remove()
 
+    @metrics.docker_call
     def get_state(self, execution_id: str) -> ContainerState:
         container = self.from_execution_id(execution_id)
         if not container:
@@ -92,26 +98,31 @@ class Containers:
             exit_code=container_state['ExitCode'],
             finished_at=finished_at)
 
+    @metrics.docker_call
     def get_files(self, execution_id: str, path: str) -> Iterator[bytes]:
         container = self.from_execution_id(execution_id)
         tar, _ = container.get_archive(path)
         yield from tar
 
+    @metrics.docker_call
     def execution_ids(self):
         return [container.name[len(self._CONTAINER_NAME_PREFIX):]
                 for container in self.docker_client.containers.list(all=True)
                 if container.name.startswith(self._CONTAINER_NAME_PREFIX)]
 
+    # Not timed, as it's part of the operations calling it
     def from_execution_id(self, execution_id: str) -> Optional[Container]:
         try:
             return self.docker_client.containers.get(
                 self._CONTAINER_NAME_PREFIX + execution_id)
         except docker.errors.NotFound:
             return None
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout):
             log.exception('Connecting to worker')
             raise WorkerUnreachableException(execution_id)
 
+    @metrics.docker_call
     def kill(self, execution_id: str):
         container = self.from_execution_id(execution_id)
         container.kill()
@@ -3,40 +3,45 @@ import logging
 import os
 import random
 import uuid
-from typing import BinaryIO, Iterator, List, Optional
+from typing import BinaryIO, Collection, Dict, Iterator, List, Optional, \
+    Tuple, Union
 
 import requests
 from flask import jsonify, request
 from pyhocon import ConfigTree
 from redis import StrictRedis
 
-from plz.controller import configuration
+from plz.controller import configuration, tracing
 from plz.controller.api.controller import Controller
+from plz.controller.api.framing import Frame
 from plz.controller.api.exceptions import BadInputMetadataException, \
     ExecutionAlreadyHarvestedException, ExecutionNotFoundException, \
     InstanceStillRunningException, ResponseHandledException
 from plz.controller.api.types import InputMetadata, JSONString
+from plz.controller.arbitrary_object_json_encoder import dumps_arbitrary_json
 from plz.controller.configuration import Dependencies
 from plz.controller.db_storage import DBStorage
-from plz.controller.execution import Executions
+from plz.controller.execution import Execution, Executions
 from plz.controller.images import Images
 from plz.controller.input_data import InputDataConfiguration
 from plz.controller.instances.instance_base import Instance, \
     InstanceProvider, NoInstancesFoundException
+from plz.controller.multiplexing import EndOfStream, multiplex
+from plz.controller.results.results_base import InstanceStatus, ResultsFile
+
+
+# Events are read from storage in batches of this size
+_EXECUTION_EVENTS_BATCH_SIZE = 100
+# How long to wait for events before reporting that there are none
+_EXECUTION_EVENTS_KEEP_ALIVE_MILLISECONDS = 15000
 
 
 class ControllerImpl(Controller):
     def __init__(self, config: ConfigTree, log: logging.Logger):
         self.port = config.get_int('port', 8080)
-        dependencies: Dependencies = configuration.dependencies_from_config(
-            config)
-        self.images: Images = dependencies.images
-        self.instance_provider: InstanceProvider = \
-            dependencies.instance_provider
-        self.db_storage: DBStorage = dependencies.db_storage
-        self.redis: StrictRedis = dependencies.redis
-        self.executions: Executions = Executions(
-            dependencies.results_storage, self.instance_provider)
+        # Built on first use, see the properties below
+        self.dependencies: Dependencies = \
+            configuration.dependencies_from_config(config)
         data_dir = config['data_dir']
         input_dir = os.path.join(data_dir, 'input')
         temp_data_dir = os.path.join(data_dir, 'tmp')
@@ -46,6 +51,27 @@ class ControllerImpl(Controller):
             self.redis, input_dir=input_dir, temp_data_dir=temp_data_dir)
         self.log = log
 
+    @property
+    def images(self) -> Images:
+        return self.dependencies.images
+
+    @property
+    def instance_provider(self) -> InstanceProvider:
+        return self.dependencies.instance_provider
+
+    @property
+    def db_storage(self) -> DBStorage:
+        return self.dependencies.db_storage
+
+    @property
+    def redis(self) -> StrictRedis:
+        return self.dependencies.redis
+
+    @property
+    def executions(self) -> Executions:
+        return Executions(
+            self.dependencies.results_storage, self.instance_provider)
+
     # noinspection PyMethodMayBeStatic
     def ping(self,
              ping_timeout: int,
@@ -82,24 +108,38 @@ class ControllerImpl(Controller):
         start_metadata['project'] = execution_spec['project']
         start_metadata['previous_execution_id'] = previous_execution_id
         self.db_storage.store_start_metadata(execution_id, start_metadata)
+        self.db_storage.add_execution_event(
+            execution_id, 'created',
+            {'user': start_metadata['user'],
+             'project': start_metadata['project']})
 
         yield {'id': execution_id}
 
         try:
-            input_stream = self.input_data_configuration.prepare_input_stream(
-                execution_spec)
-            startup_statuses = self.instance_provider.run_in_instance(
-                execution_id, command, snapshot_id, parameters,
-                input_stream, instance_market_spec, execution_spec)
-            instance: Optional[Instance] = None
-            for status in startup_statuses:
-                if 'message' in status:
-                    yield {'status': status['message']}
-                if 'instance' in status:
-                    instance = status['instance']
+            with tracing.span(execution_id, 'input.prepare'):
+                input_stream = \
+                    self.input_data_configuration.prepare_input_stream(
+                        execution_spec)
+            with tracing.span(execution_id, 'instance.start'):
+                startup_statuses = self.instance_provider.run_in_instance(
+                    execution_id, command, snapshot_id, parameters,
+                    input_stream, instance_market_spec, execution_spec)
+                instance: Optional[Instance] = None
+                for status in startup_statuses:
+                    if 'message' in status:
+                        yield {'status': status['message']}
+                    if 'instance' in status:
+                        instance = status['instance']
             if instance is None:
                 yield {'error': 'Couldn\'t get an instance.'}
                 return
+            # Providers hand over the instance once the container is running
+            self.db_storage.add_execution_event(
+                execution_id, 'instance_acquired',
+                {'instance_id': instance.instance_id,
+                 'instance_type': instance.get_instance_type()})
+            self.db_storage.add_execution_event(
+                execution_id, 'container_started')
             self._set_user_last_execution_id(
                 execution_spec['user'], execution_id)
         except Exception as e:
@@ -135,34 +175,121 @@ class ControllerImpl(Controller):
 
     def harvest(self) -> None:
         self.instance_provider.harvest()
+        self.dependencies.results_storage.collect_garbage()
 
     def get_status(self, execution_id: str) -> dict:
-        return self.executions.get(execution_id).get_status()
+        status = self.executions.get(execution_id).get_status()
+        return _status_as_dict(
+            status,
+            self.instance_provider.publications.get_state(execution_id))
+
+    def get_statuses(self, execution_ids: List[str]) -> Dict[str, dict]:
+        statuses = self.executions.get_statuses(execution_ids)
+        publication_states = self.instance_provider.publications.get_states(
+            execution_ids)
+        return {
+            execution_id: status.as_dict()
+            if isinstance(status, ResponseHandledException)
+            else _status_as_dict(
+                status, publication_states.get(execution_id))
+            for execution_id, status in statuses.items()}
 
     def get_logs(self, execution_id: str, since: Optional[int]) \
             -> Iterator[bytes]:
         return self.executions.get(execution_id).get_logs(since=since)
 
-    def get_output_files(self, execution_id: str) -> Iterator[bytes]:
-        return self.executions.get(execution_id).get_output_files_tarball()
+    def get_multiplexed_logs(
+            self, execution_ids: List[str], since: Optional[int],
+            offsets: Optional[Dict[str, int]] = None) -> Iterator[Frame]:
+        offsets = offsets or {}
+
+        def logs_creator(execution_id: str):
+            return lambda: self.get_logs(execution_id, since=since)
+
+        streams = {execution_id: logs_creator(execution_id)
+                   for execution_id in execution_ids}
+        current_offsets = {execution_id: 0 for execution_id in streams}
+        for execution_id, value in multiplex(streams):
+            offset = current_offsets[execution_id]
+            header = {'execution_id': execution_id, 'offset': offset}
+            if isinstance(value, EndOfStream):
+                yield {**header, 'stream': 'end'}, b''
+            elif isinstance(value, ResponseHandledException):
+                yield {**header, 'stream': 'error'}, \
+                    dumps_arbitrary_json(value.as_dict()).encode('utf-8')
+            elif isinstance(value, Exception):
+                self.log.error(
+                    f'Exception following logs for {execution_id}',
+                    exc_info=value)
+                yield {**header, 'stream': 'error'}, \
+                    json.dumps({'error': str(value)}).encode('utf-8')
+            else:
+                current_offsets[execution_id] += len(value)
+                # Skip what the client has already seen
+                skip = offsets.get(execution_id, 0) - offset
+                if skip >= len(value):
+                    continue
+                skip = max(skip, 0)
+                yield {**header, 'offset': offset + skip, 'stream': 'logs'}, \
+                    value[skip:]
+
+    def get_execution_events(
+            self, last_event_id: Optional[str] = None,
+            execution_ids: Optional[List[str]] = None) \
+            -> Iterator[Optional[dict]]:
+        if last_event_id is None:
+            last_event_id = self.db_storage.get_last_execution_event_id()
+        while True:
+            events = self.db_storage.retrieve_execution_events(
+                last_event_id, count=_EXECUTION_EVENTS_BATCH_SIZE,
+                block_milliseconds=_EXECUTION_EVENTS_KEEP_ALIVE_MILLISECONDS)
+            if len(events) == 0:
+                yield None
+            for event_id, event in events:
+                last_event_id = event_id
+                if execution_ids is None or \
+                        event['execution_id'] in execution_ids:
+                    yield {'id': event_id, **event}
+
+    def get_output_files(self, execution_id: str,
+                         paths: Optional[List[str]] = None,
+                         globs: Optional[List[str]] = None) \
+            -> Iterator[bytes]:
+        execution = self.executions.get(execution_id)
+        if paths is None and globs is None:
+            return execution.get_output_files_tarball()
+        return execution.get_output_files_members(paths or [], globs or [])
+
+    # The following are not part of the API, they let the server send
+    # finished results without reading them
+
+    def get_logs_file_or_logs(
+            self, execution_id: str, since: Optional[int],
+            encodings: Collection[str]) \
+            -> Union[ResultsFile, Iterator[bytes]]:
+        """The file with the logs, if the execution finished and the file
+           can be sent as it is, or the logs otherwise"""
+        execution = self.executions.get(execution_id)
+        logs_file = execution.get_logs_file(encodings)
+        if logs_file is not None:
+            # Finished logs are complete, regardless of `since`
+            return logs_file
+        return execution.get_logs(since=since)
+
+    def get_output_files_file_or_tarball(
+            self, execution_id: str, encodings: Collection[str]) \
+            -> Union[ResultsFile, Iterator[bytes]]:
+        """As `get_logs_file_or_logs`, for the output tarball"""
+        execution = self.executions.get(execution_id)
+        output_files_file = execution.get_output_files_tarball_file(encodings)
+        if output_files_file is not None:
+            return output_files_file
+        return execution.get_output_files_tarball()
 
     def get_measures(self, execution_id: str, summary: bool) \
             -> Iterator[JSONString]:
-        measures = self.executions.get(execution_id).get_measures()
-        if summary:
-            measures_to_return = measures.get('summary', {})
-        else:
-            measures_to_return = measures
-        if measures_to_return == {}:
-            return []
-        # We return text that happens to be json, as we want the cli to show it
-        # indented properly and we don't want an additional conversion round
-        # json <-> str.
-        # In the future we can have another entrypoint or a parameter
-        # to return the json if we use it programmatically in the CLI.
-        str_response = json.dumps(measures_to_return, indent=2) + '\n'
-        for l in str_response.splitlines(keepends=True):
-            yield l
+        return _measures_to_json_lines(
+            self.executions.get(execution_id).get_measures(), summary)
 
     def delete_execution(self, execution_id: str, fail_if_running: bool,
                          fail_if_deleted: bool) -> None:
@@ -178,26 +305,98 @@ class ControllerImpl(Controller):
         response.status_code = requests.codes.no_content
         return response
 
-    def get_history(self, user: str, project: str) -> Iterator[JSONString]:
-        execution_ids = self.db_storage.retrieve_finished_execution_ids(
-            user, project)
-
+    def finalize_execution(self, execution_id: str) -> Iterator[Frame]:
+        # Check and harvest before streaming anything, so that errors are
+        # sent as such
+        if self.executions.get(execution_id).get_status().running:
+            raise InstanceStillRunningException(execution_id=execution_id)
+        self.instance_provider.release_instance(
+            execution_id, fail_if_not_found=False)
+        execution = self.executions.get(execution_id)
+        status = execution.get_status()
+        return _finalization_frames(execution, status)
+
+    def get_history(self, user: str, project: str,
+                    limit: Optional[int] = None,
+                    before: Optional[int] = None,
+                    after: Optional[int] = None,
+                    before_execution_id: Optional[str] = None,
+                    after_execution_id: Optional[str] = None) \
+            -> Iterator[JSONString]:
         yield '{\n'
         first = True
-        for execution_id in execution_ids:
+        for execution_id, metadata in self.get_history_entries(
+                user, project, limit=limit, before=before, after=after,
+                before_execution_id=before_execution_id,
+                after_execution_id=after_execution_id):
             if not first:
                 yield ',\n'
             first = False
-            metadata = self.executions.get(execution_id).get_metadata()
             yield f'"{execution_id}": {json.dumps(metadata)}'
         yield '\n}\n'
 
+    def get_history_entries(
+            self, user: str, project: str, limit: Optional[int] = None,
+            before: Optional[int] = None, after: Optional[int] = None,
+            before_execution_id: Optional[str] = None,
+            after_execution_id: Optional[str] = None) \
+            -> Iterator[Tuple[str, dict]]:
+        if not self.db_storage.is_history_indexed(user, project):
+            self._index_history(user, project)
+        execution_ids = self.db_storage.retrieve_finished_execution_ids_page(
+            user, project, limit=limit, before=before, after=after,
+            before_execution_id=before_execution_id,
+            after_execution_id=after_execution_id)
+        for execution_id in execution_ids:
+            metadata = self._get_history_metadata(
+                execution_id, with_measures=True)
+            if metadata is not None:
+                yield execution_id, metadata
+
+    def _index_history(self, user: str, project: str) -> None:
+        # Executions finished before the history index existed are only in
+        # the unordered sets. Add them to the index once.
+        execution_ids = self.db_storage.retrieve_finished_execution_ids(
+            user, project)
+        for execution_id in execution_ids:
+            metadata = self._get_history_metadata(
+                execution_id, with_measures=False)
+            if metadata is None:
+                continue
+            self.db_storage.add_finished_execution_id(
+                user, project, execution_id,
+                finish_timestamp=metadata.get('finish_timestamp') or 0)
+        self.db_storage.mark_history_as_indexed(user, project)
+
+    def _get_history_metadata(self, execution_id: str, with_measures: bool) \
+            -> Optional[dict]:
+        """Metadata of the finished execution, or None if its results are
+           gone (removed to free space, for instance) or it was aborted, so
+           that one of them doesn't fail the whole history"""
+        execution = self.executions.get_finished(execution_id)
+        if execution is None:
+            self.log.warning(
+                f'Leaving {execution_id} out of the history, as its results '
+                f'are missing')
+            return None
+        try:
+            if with_measures:
+                return execution.get_metadata()
+            return execution.get_stored_metadata()
+        except ResponseHandledException as e:
+            self.log.warning(
+                f'Leaving {execution_id} out of the history: {e}')
+            return None
+
     def create_snapshot(self, image_metadata: dict, context: BinaryIO) -> \
             Iterator[JSONString]:
         tag = Images.construct_tag(image_metadata)
-        yield from (
-            frag.decode('utf-8') for frag in self.images.build(context, tag))
-        self.instance_provider.push(tag)
+        # There's no execution yet, so spans are for the snapshot
+        with tracing.span(tag, 'snapshot.build'):
+            yield from (frag.decode('utf-8')
+                        for frag in self.images.build(context, tag))
+        with tracing.span(tag, 'snapshot.push'):
+            self.instance_provider.push(tag)
         yield json.dumps({'id': tag})
 
     def put_input(self, input_id: str, input_metadata: InputMetadata,
@@ -251,7 +450,16 @@ class ControllerImpl(Controller):
         start_metadata = self.db_storage.retrieve_start_metadata(execution_id)
         if start_metadata is None:
             raise ExecutionNotFoundException(execution_id)
-        return {'start_metadata': start_metadata}
+        # Snapshots are built again when they change, and spans for the same
+        # snapshot pile up. Keep the last ones
+        snapshot_spans = {
+            s['name']: s for s in self.db_storage.retrieve_execution_spans(
+                start_metadata['snapshot_id'])}
+        return {
+            'start_metadata': start_metadata,
+            'spans': self.db_storage.retrieve_execution_spans(execution_id),
+            'snapshot_spans': list(snapshot_spans.values()),
+        }
 
     @classmethod
     def handle_exception(cls, exception: ResponseHandledException):
@@ -268,3 +476,39 @@ def _get_execution_uuid() -> str:
     # physical address (see Python uuid docs)
     random_node = random.getrandbits(48) | 0x010000000000
     return str(uuid.uuid1(node=random_node))
+
+
+def _status_as_dict(status: InstanceStatus,
+                    publication_state: Optional[dict]) -> dict:
+    # Whether the results are stored, or how far they are
+    return {**vars(status), 'publication': publication_state}
+
+
+def _measures_to_json_lines(measures: dict, summary: bool) \
+        -> Iterator[JSONString]:
+    if summary:
+        measures_to_return = measures.get('summary', {})
+    else:
+        measures_to_return = measures
+    if measures_to_return == {}:
+        return
+    # We return text that happens to be json, as we want the cli to show it
+    # indented properly and we don't want an additional conversion round
+    # json <-> str.
+    # In the future we can have another entrypoint or a parameter
+    # to return the json if we use it programmatically in the CLI.
+    str_response = json.dumps(measures_to_return, indent=2) + '\n'
+    for l in str_response.splitlines(keepends=True):
+        yield l
+
+
+def _finalization_frames(execution: Execution, status: InstanceStatus) \
+        -> Iterator[Frame]:
+    yield {'stream': 'status'}, dumps_arbitrary_json(status).encode('utf-8')
+    summary = ''.join(_measures_to_json_lines(
+        execution.get_measures(), summary=True))
+    yield {'stream': 'measures'}, summary.encode('utf-8')
+    if status.success:
+        for chunk in execution.get_output_files_tarball():
+            yield {'stream': 'output'}, chunk
+    yield {'stream': 'end'}, b''
@@ -1,6 +1,6 @@
 import logging
 from abc import ABC, abstractmethod
-from typing import Set
+from typing import Dict, List, Optional, Set, Tuple
 
 log = logging.getLogger(__name__)
 
@@ -17,10 +17,100 @@ class DBStorage(ABC):
 
     @abstractmethod
     def add_finished_execution_id(
-            self, user: str, project: str, execution_id: str) -> None:
+            self, user: str, project: str, execution_id: str,
+            finish_timestamp: int) -> None:
         pass
 
     @abstractmethod
     def retrieve_finished_execution_ids(
             self, user: str, project: str) -> Set[str]:
         pass
+
+    @abstractmethod
+    def retrieve_finished_execution_ids_page(
+            self, user: str, project: str, limit: Optional[int] = None,
+            before: Optional[int] = None, after: Optional[int] = None,
+            before_execution_id: Optional[str] = None,
+            after_execution_id: Optional[str] = None) -> List[str]:
+        """Finished executions for user and project, newest first (and, when
+           they finished on the same second, in reverse order of their IDs).
+
+           :param limit: maximum number of executions. With `after` but not
+               `before`, the ones next to `after` (the oldest after it), so
+               that pages go towards newer executions
+           :param before: only executions finished before this timestamp
+           :param after: only executions finished after this timestamp
+           :param before_execution_id: with `before`, the cursor is the
+               execution with this ID finished at `before`, and executions
+               finished on that same second after it in the order are
+               included, so that pages don't skip them
+           :param after_execution_id: same, for `after`
+        """
+        pass
+
+    @abstractmethod
+    def is_history_indexed(self, user: str, project: str) -> bool:
+        """Whether all finished executions for the user and project are
+           available through `retrieve_finished_execution_ids_page`.
+
+           Executions finished before the index existed are not."""
+        pass
+
+    @abstractmethod
+    def mark_history_as_indexed(self, user: str, project: str) -> None:
+        pass
+
+    @abstractmethod
+    def add_execution_event(self, execution_id: str, event_type: str,
+                            data: Optional[dict] = None) -> None:
+        """Appends an event in the lifecycle of an execution (for instance,
+           `created` or `published`) to the stream of events"""
+        pass
+
+    @abstractmethod
+    def add_execution_span(self, trace_id: str, span: dict) -> None:
+        """Stores a finished span (see `tracing`) of the execution or
+           snapshot with the given ID. Storages might keep only the most
+           recent spans of each ID, and only for some time"""
+        pass
+
+    @abstractmethod
+    def retrieve_execution_spans(self, trace_id: str) -> List[dict]:
+        """Spans of the execution or snapshot, in the order they finished"""
+        pass
+
+    @abstractmethod
+    def store_publication_state(self, execution_id: str, state: dict,
+                                expire_seconds: Optional[int] = None) \
+            -> None:
+        """Stores how publishing the results of the execution is going (see
+           `Publications`), replacing the previous state.
+
+           :param expire_seconds: forget the state after this time
+        """
+        pass
+
+    @abstractmethod
+    def retrieve_publication_states(self, execution_ids: List[str]) \
+            -> Dict[str, dict]:
+        """States of the publications of the executions. Executions without
+           one are not present in the result"""
+        pass
+
+    @abstractmethod
+    def get_last_execution_event_id(self) -> str:
+        """ID of the last event in the stream, so that events can be read
+           from now on. If there are no events, an ID before any event"""
+        pass
+
+    @abstractmethod
+    def retrieve_execution_events(
+            self, after_event_id: str, count: int,
+            block_milliseconds: int) -> List[Tuple[str, dict]]:
+        """Pairs of event ID and event, for the events after the given ID,
+           oldest first.
+
+           If there are no events yet, waits for them for at most
+           `block_milliseconds`, and returns an empty list if none arrived.
+        """
+        pass
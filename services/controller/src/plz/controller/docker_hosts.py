@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import docker
+import requests
+from requests.adapters import BaseAdapter
+
+from plz.controller import metrics
+
+# Clients of docker daemons (the daemons of the workers, mostly), with
+# timeouts and a circuit breaker per daemon.
+#
+# When a daemon doesn't answer, each call to it would hold a gunicorn worker
+# until it times out. After a few calls fail to connect or time out, the
+# circuit of the daemon opens, and calls fail right away. After a while, one
+# call goes through to check whether the daemon is back: if it succeeds, the
+# circuit closes, otherwise it stays open for another while.
+
+log = logging.getLogger(__name__)
+
+_CONNECT_TIMEOUT_SECONDS = 5
+# Same as the default of docker-py
+_READ_TIMEOUT_SECONDS = 60
+_FAILURES_TO_OPEN = 3
+_OPEN_SECONDS = 30
+
+# Circuits of daemons that failed recently, by base URL. Circuits are removed
+# once a call succeeds, so that these don't pile up as workers come and go
+_circuits: Dict[str, '_Circuit'] = {}
+_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a daemon known to be unreachable. It's a
+       connection error, so that it's handled as if the call failed"""
+    pass
+
+
+def configure(connect_timeout_seconds: float, read_timeout_seconds: float,
+              failures_to_open: int, open_seconds: float):
+    global _CONNECT_TIMEOUT_SECONDS, _READ_TIMEOUT_SECONDS, \
+        _FAILURES_TO_OPEN, _OPEN_SECONDS
+    _CONNECT_TIMEOUT_SECONDS = connect_timeout_seconds
+    _READ_TIMEOUT_SECONDS = read_timeout_seconds
+    _FAILURES_TO_OPEN = failures_to_open
+    _OPEN_SECONDS = open_seconds
+
+
+def docker_client(docker_url: Optional[str]) -> docker.DockerClient:
+    client = docker.DockerClient(
+        base_url=docker_url, timeout=_READ_TIMEOUT_SECONDS)
+    _break_circuit_of(client.api)
+    return client
+
+
+def api_client(docker_url: Optional[str]) -> docker.APIClient:
+    client = docker.APIClient(
+        base_url=docker_url, timeout=_READ_TIMEOUT_SECONDS)
+    _break_circuit_of(client)
+    return client
+
+
+def circuit_state(base_url: str) -> dict:
+    """The state of the circuit of the daemon: `closed` (calls go through),
+       `open` (calls fail right away) or `half-open` (the next call goes
+       through, to check whether the daemon is back)"""
+    with _lock:
+        circuit = _circuits.get(base_url)
+        if circuit is None:
+            return {'state': 'closed', 'failures': 0}
+        return {'state': circuit.state(), 'failures': circuit.failures}
+
+
+def _break_circuit_of(client: docker.APIClient):
+    # docker-py sends requests with requests, through the adapter for the
+    # scheme (HTTP, or the unix socket adapter of docker-py)
+    for prefix, adapter in list(client.adapters.items()):
+        client.mount(prefix, _CircuitBreakingAdapter(client.base_url, adapter))
+
+
+class _Circuit:
+    def __init__(self):
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # Whether a call is checking if the daemon is back
+        self.is_trying = False
+
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if self.is_trying or \
+                time.monotonic() < self.opened_at + _OPEN_SECONDS:
+            return 'open'
+        return 'half-open'
+
+
+class _CircuitBreakingAdapter(BaseAdapter):
+    def __init__(self, base_url: str, delegate: BaseAdapter):
+        super().__init__()
+        self.base_url = base_url
+        self.delegate = delegate
+
+    def send(self, request, timeout=None, **kwargs):
+        self._before_call()
+        # docker-py takes one timeout for both connecting and reading.
+        # Connecting to a daemon that's up is quick
+        if not isinstance(timeout, tuple):
+            timeout = (_CONNECT_TIMEOUT_SECONDS, timeout)
+        try:
+            response = self.delegate.send(request, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout):
+            self._after_failure()
+            raise
+        except Exception:
+            # The daemon answered, even if not as expected
+            self._after_success()
+            raise
+        self._after_success()
+        return response
+
+    def close(self):
+        self.delegate.close()
+
+    def _before_call(self):
+        with _lock:
+            circuit = _circuits.get(self.base_url)
+            if circuit is None:
+                return
+            state = circuit.state()
+            if state == 'half-open':
+                circuit.is_trying = True
+                return
+            if state == 'open':
+                metrics.DOCKER_CALLS_REJECTED.labels(self.base_url).inc()
+                raise CircuitOpenError(
+                    f'The docker daemon at {self.base_url} failed '
+                    f'{circuit.failures} times in a row')
+
+    def _after_success(self):
+        with _lock:
+            circuit = _circuits.pop(self.base_url, None)
+        if circuit is not None and circuit.opened_at is not None:
+            log.info(f'Docker daemon at {self.base_url} is back')
+            metrics.DOCKER_HOST_CIRCUIT_OPEN.labels(self.base_url).set(0)
+
+    def _after_failure(self):
+        with _lock:
+            circuit = _circuits.setdefault(self.base_url, _Circuit())
+            circuit.failures += 1
+            circuit.is_trying = False
+            if circuit.failures < _FAILURES_TO_OPEN:
+                return
+            if circuit.opened_at is None:
+                log.warning(f'Docker daemon at {self.base_url} is '
+                            'unreachable, failing calls to it for '
+                            f'{_OPEN_SECONDS} seconds')
+            circuit.opened_at = time.monotonic()
+        metrics.DOCKER_HOST_CIRCUIT_OPEN.labels(self.base_url).set(1)
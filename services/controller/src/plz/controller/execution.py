@@ -1,10 +1,13 @@
 from abc import ABC
+from typing import Dict, List, Optional, Union
 
-from plz.controller.api.exceptions import ExecutionNotFoundException
-from plz.controller.execution_metadata import convert_measures_to_dict
+from plz.controller.api.exceptions import ExecutionNotFoundException, \
+    ResponseHandledException
 from plz.controller.instances.instance_base import InstanceProvider
 from plz.controller.results import ResultsStorage
-from plz.controller.results.results_base import Results
+from plz.controller.results.results_base import InstanceStatus, Results
+
+StatusOrException = Union[InstanceStatus, ResponseHandledException]
 
 
 class Execution(ABC):
@@ -12,20 +15,24 @@ class Execution(ABC):
         self.results = results
         self.get_logs = self.results.get_logs
         self.get_output_files_tarball = self.results.get_output_files_tarball
+        self.get_output_files_members = self.results.get_output_files_members
         self.get_status = self.results.get_status
+        self.get_stored_metadata = self.results.get_stored_metadata
+        self.get_logs_file = self.results.get_logs_file
+        self.get_output_files_tarball_file = \
+            self.results.get_output_files_tarball_file
 
     def get_measures(self) -> dict:
-        return convert_measures_to_dict(
-            self.results.get_measures_files_tarball())
+        return self.results.get_measures()
 
     def get_metadata(self) -> dict:
         stored_metadata = self.results.get_stored_metadata()
         # Measures are written by the workers in a specific directory and
         # we store the tarball as to preserve the original data as much as
-        # possible. We don't store a structured representation as to avoid
-        # having two sources of truth. Instead, we recompute the structured
-        # representation from the tarball and add it to the metadata each time
-        # it's requested.
+        # possible. The tarball is the source of truth: results storages
+        # might keep the structured representation, but stamped with the
+        # version of the conversion, so that they convert again when it
+        # changes.
         stored_metadata.update({'measures': self.get_measures()})
         return stored_metadata
 
@@ -37,18 +44,63 @@ class Executions:
         self.instance_provider = instance_provider
 
     def get(self, execution_id: str):
-        with self.results_storage.get(execution_id) as results:
-            # We acquire the lock to make sure the results were successfully
-            # written. On return, the lock will be released but we know that,
-            # after written, the content of the results doesn't change
-            if results:
-                return _FinishedExecution(results)
+        finished_execution = self.get_finished(execution_id)
+        if finished_execution is not None:
+            return finished_execution
 
         instance = self.instance_provider.instance_for(execution_id)
         if instance is None:
-            raise ExecutionNotFoundException(execution_id=execution_id)
+            # Instances are released after publishing the results, so the
+            # execution might have finished after we looked at the results
+            finished_execution = self.get_finished(execution_id)
+            if finished_execution is None:
+                raise ExecutionNotFoundException(execution_id=execution_id)
+            return finished_execution
         return _OngoingExecution(instance)
 
+    def get_finished(self, execution_id: str) \
+            -> Optional['_FinishedExecution']:
+        """The execution, if its results are stored, without looking for its
+           instance"""
+        with self.results_storage.get(execution_id) as results:
+            # Results are only there once completely written, and they
+            # don't change after that
+            if results:
+                return _FinishedExecution(results)
+        return None
+
+    def get_statuses(self, execution_ids: List[str]) \
+            -> Dict[str, StatusOrException]:
+        """Statuses for several executions, querying the instance provider
+           once for all the executions that are not finished"""
+        statuses = {}
+        for execution_id in execution_ids:
+            status = self._get_finished_status_or_none(execution_id)
+            if status is not None:
+                statuses[execution_id] = status
+        ongoing_ids = [e for e in execution_ids if e not in statuses]
+        instances = self.instance_provider.instances_for(ongoing_ids)
+        for execution_id in ongoing_ids:
+            instance = instances.get(execution_id)
+            if instance is None:
+                # The execution might have finished (and its instance been
+                # released) after we looked at the results
+                status = self._get_finished_status_or_none(execution_id)
+                if status is None:
+                    status = ExecutionNotFoundException(
+                        execution_id=execution_id)
+                statuses[execution_id] = status
+            else:
+                statuses[execution_id] = _get_status_or_exception(instance)
+        return statuses
+
+    def _get_finished_status_or_none(self, execution_id: str) \
+            -> Optional[StatusOrException]:
+        with self.results_storage.get(execution_id) as results:
+            if results:
+                return _get_status_or_exception(results)
+        return None
+
 
 class _OngoingExecution(Execution):
     def __init__(self, instance):
@@ -58,3 +110,10 @@ class _OngoingExecution(Execution):
 class _FinishedExecution(Execution):
     def __init__(self, results):
         super().__init__(results)
+
+
+def _get_status_or_exception(results: Results) -> StatusOrException:
+    try:
+        return results.get_status()
+    except ResponseHandledException as e:
+        return e
@@ -2,26 +2,32 @@ import base64
 import io
 import json
 import os
-import shutil
 import tarfile
-import tempfile
 from json import JSONDecodeError
-from typing import IO, Iterator, Optional, Tuple
-
-from werkzeug.contrib.iterio import IterIO
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
 
+from plz.controller.api.iterator_reader import IteratorReader
+from plz.controller.api.tarball_paths import link_target_name, \
+    path_in_tarball
 from plz.controller.db_storage import DBStorage
 
 
+# Version of the conversion of measures to a dict. Measures stored after
+# converting them with another version are converted again
+MEASURES_FORMAT_VERSION = 1
+
+
 def convert_measures_to_dict(measures_tarball: Iterator[bytes]) -> dict:
-    measures_dict = {}
-    for path, file_content in _tar_iterator(measures_tarball):
+    return convert_measures_file_to_dict(IteratorReader(measures_tarball))
 
-        content = file_content.read()
+
+def convert_measures_file_to_dict(measures_tarball: BinaryIO) -> dict:
+    measures_dict = {}
+    for path, content in _tar_iterator(measures_tarball):
         content_as_json = None
         try:
             content_as_json = json.load(io.BytesIO(content))
-        except JSONDecodeError or UnicodeDecodeError:
+        except (JSONDecodeError, UnicodeDecodeError):
             pass
         # Treat directories as nested dictionaries
         obj, key = _container_object_and_key_from_path(measures_dict, path)
@@ -46,31 +52,38 @@ def _container_object_and_key_from_path(measures_dict: dict, path: str):
 
 def compile_metadata_for_storage(
         db_storage: DBStorage, execution_id: str,
-        finish_timestamp: int) -> dict:
+        finish_timestamp: int,
+        stream_metrics: Optional[Dict[str, dict]] = None) -> dict:
+    """:param stream_metrics: the size of each stream collected when
+                           publishing, and how long it took (see
+                           `collect_concurrently`)"""
     start_metadata = db_storage.retrieve_start_metadata(execution_id)
-    return {**start_metadata,
-            'finish_timestamp': finish_timestamp}
+    metadata = {**start_metadata,
+                'finish_timestamp': finish_timestamp}
+    if stream_metrics is not None:
+        metadata['stream_metrics'] = stream_metrics
+    return metadata
 
 
-def _tar_iterator(tarball_bytes: Iterator[bytes]) \
-        -> Iterator[Tuple[str, Optional[IO]]]:
-    # The response is a tarball we need to extract into `output_dir`.
-    with tempfile.TemporaryFile() as tarball:
-        # `tarfile.open` needs to read from a real file, so we copy to one.
-        shutil.copyfileobj(IterIO(tarball_bytes), tarball)
-        # And rewind to the start.
-        tarball.seek(0)
-        tar = tarfile.open(fileobj=tarball)
-        for tarinfo in tar.getmembers():
-            # Drop the first segment, because it's just the name of the
-            # directory that was tarred up, and we don't care.
-            path_segments = tarinfo.name.split(os.sep)[1:]
-            if path_segments:
-                # Unfortunately we can't just pass `*path_segments`
-                # because `os.path.join` explicitly expects an argument
-                # for the first parameter.
-                path = os.path.join(path_segments[0], *path_segments[1:])
-                file_bytes = tar.extractfile(tarinfo.name)
-                # Not None for files and links
-                if file_bytes is not None:
-                    yield path, tar.extractfile(tarinfo.name)
+def _tar_iterator(tarball: BinaryIO) -> Iterator[Tuple[str, bytes]]:
+    """Yields the path and contents of files in the tarball, as they arrive.
+
+       The tarball is read as a stream, so it doesn't need to be a real file.
+       As we can't go back to the target of a link, we keep the contents of
+       the files read so far. Measures are small."""
+    tar = tarfile.open(fileobj=tarball, mode='r|*')
+    contents_by_name: Dict[str, bytes] = {}
+    for tarinfo in tar:
+        if tarinfo.isfile():
+            content = tar.extractfile(tarinfo).read()
+            contents_by_name[os.path.normpath(tarinfo.name)] = content
+        elif tarinfo.islnk() or tarinfo.issym():
+            # Targets outside of the tarball (`None`) aren't there either
+            content = contents_by_name.get(link_target_name(tarinfo))
+            if content is None:
+                continue
+        else:
+            continue
+        path = path_in_tarball(tarinfo.name)
+        if path is not None:
+            yield path, content
@@ -7,6 +7,7 @@ from typing import Any, BinaryIO, Callable, Iterator
 import docker
 from requests.exceptions import ChunkedEncodingError, ConnectionError
 
+from plz.controller import docker_hosts, metrics
 from plz.controller.images.images_base import Images
 
 log = logging.getLogger(__name__)
@@ -30,7 +31,7 @@ class ECRImages(Images):
 
     def for_host(self, docker_url: str) -> 'ECRImages':
         def new_docker_api_client_creator():
-            return docker.APIClient(base_url=docker_url)
+            return docker_hosts.api_client(docker_url)
         return ECRImages(
             new_docker_api_client_creator,
             self.ecr_client_creator,
@@ -41,6 +42,7 @@ class ECRImages(Images):
         self._login()
         return self._build(fileobj, tag)
 
+    @metrics.docker_call
     def push(self, tag: str,
              log_level: int = logging.DEBUG, log_progress: bool = False):
         self._login()
@@ -50,11 +52,13 @@ class ECRImages(Images):
                 repository=self.repository, tag=tag, stream=True),
             log_level, log_progress)
 
+    @metrics.docker_call
     def pull(self, tag: str):
         self._login()
         self._log_output('Push', self.docker_api_client.pull(
             repository=self.repository, tag=tag, stream=True))
 
+    @metrics.docker_call
     def can_pull(self, times: int) -> bool:
         try:
             for _ in range(times):
@@ -65,6 +69,7 @@ class ECRImages(Images):
             log.debug('Couldn\'t pull image')
             return False
 
+    @metrics.docker_call
     def _login(self) -> None:
         if self.last_login_time:
             time_since_last_login = time.time() - self.last_login_time
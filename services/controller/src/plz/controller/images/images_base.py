@@ -7,6 +7,7 @@ from typing import BinaryIO, Callable, Iterator
 
 import docker
 
+from plz.controller import metrics
 from plz.controller.api.exceptions import JSONResponseException
 
 Metadata = collections.namedtuple('Metadata', ['user', 'project', 'timestamp'])
@@ -49,6 +50,7 @@ class Images(ABC):
     def can_pull(self, times: int) -> bool:
         pass
 
+    @metrics.docker_call
     def _build(self, fileobj: BinaryIO, tag: str) -> Iterator[bytes]:
         builder = self.docker_api_client.build(
             fileobj=fileobj,
@@ -2,6 +2,7 @@ from typing import BinaryIO, Callable, Iterator
 
 import docker
 
+from plz.controller import docker_hosts
 from plz.controller.images.images_base import Images
 
 
@@ -16,7 +17,7 @@ class LocalImages(Images):
 
     def for_host(self, docker_url: str) -> 'LocalImages':
         def new_docker_api_client_creator():
-            return docker.APIClient(base_url=docker_url)
+            return docker_hosts.api_client(docker_url)
         return LocalImages(new_docker_api_client_creator, self.repository)
 
     def push(self, tag: str):
@@ -1,11 +1,12 @@
 import io
 import logging
 import os.path
-from typing import Dict, Iterator, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional
 
 import time
 from redis import StrictRedis
 
+from plz.controller import docker_hosts, tracing
 from plz.controller.containers import ContainerState, Containers
 from plz.controller.images import Images
 from plz.controller.instances.docker import DockerInstance
@@ -58,7 +59,8 @@ class EC2Instance(Instance):
                     f'Instance {self.instance_id} cannot execute '
                     f'{self.delegate.execution_id} as it\'s not '
                     f'free (executing [{self.get_execution_id()}])')
-            self.images.pull(snapshot_id)
+            with tracing.span(self.delegate.execution_id, 'images.pull'):
+                self.images.pull(snapshot_id)
             self.delegate.run(command, snapshot_id, parameters, input_stream,
                               docker_run_args)
             self._set_execution_id(
@@ -144,6 +146,12 @@ class EC2Instance(Instance):
             return None
         return self.delegate.container_state()
 
+    def publish_results(
+            self, results_storage: ResultsStorage, idle_since_timestamp: int,
+            record_progress: Optional[Callable[[int], None]] = None) -> None:
+        self.delegate.publish_results(
+            results_storage, idle_since_timestamp, record_progress)
+
     def release(self,
                 results_storage: ResultsStorage,
                 idle_since_timestamp: int,
@@ -199,7 +207,9 @@ class EC2Instance(Instance):
         else:
             spot_request_info = spot_requests[0]
         return {'SpotInstanceRequest': spot_request_info,
-                'InstanceState': self.get_resource_state()}
+                'InstanceState': self.get_resource_state(),
+                'DockerDaemonCircuit': docker_hosts.circuit_state(
+                    self.delegate.containers.docker_client.api.base_url)}
 
     @property
     def instance_id(self):
@@ -235,7 +245,9 @@ def get_aws_instances(
 
 
 def describe_instances(client, filters) -> [dict]:
-    new_filters = [{'Name': n, 'Values': [v]} for (n, v) in filters]
+    # Values can be a single value or a list of values, any of which matches
+    new_filters = [{'Name': n, 'Values': v if isinstance(v, list) else [v]}
+                   for (n, v) in filters]
     response = client.describe_instances(Filters=new_filters)
     return [instance
             for reservation in response['Reservations']
@@ -6,10 +6,12 @@ from typing import Any, Dict, Iterator, List, Optional
 
 from redis import StrictRedis
 
+from plz.controller import tracing
 from plz.controller.containers import Containers
 from plz.controller.images import Images
 from plz.controller.instances.instance_base import Instance, \
     InstanceProvider, Parameters
+from plz.controller.instances.publications import Publications
 from plz.controller.results.results_base import ResultsStorage
 from plz.controller.volumes import Volumes
 from .ec2_instance import EC2Instance, InstanceAssignedException, \
@@ -18,6 +20,8 @@ from .ec2_instance import EC2Instance, InstanceAssignedException, \
 
 class EC2InstanceGroup(InstanceProvider):
     DOCKER_PORT = 2375
+    # Maximum number of values AWS accepts in a filter
+    MAX_FILTER_VALUES = 200
 
     def __init__(self,
                  name,
@@ -30,8 +34,9 @@ class EC2InstanceGroup(InstanceProvider):
                  acquisition_delay_in_seconds: int,
                  max_acquisition_tries: int,
                  worker_security_group_names: [str],
-                 use_public_dns: bool):
-        super().__init__(results_storage)
+                 use_public_dns: bool,
+                 publications: Publications):
+        super().__init__(results_storage, publications)
         self.name = name
         self.redis = redis
         self.client = client
@@ -96,21 +101,24 @@ class EC2InstanceGroup(InstanceProvider):
         instance_type = execution_spec.get('instance_type')
         instance_max_uptime_in_minutes = execution_spec.get(
             'instance_max_uptime_in_minutes')
-        instances_not_assigned = self._get_group_aws_instances(
-            only_running=True,
-            filters=[(f'tag:{EC2Instance.EXECUTION_ID_TAG}', ''),
-                     ('instance-type', instance_type)])
-        if len(instances_not_assigned) > 0:
-            yield _msg('reusing existing instance')
-            is_instance_newly_created = False
-            instance_data = instances_not_assigned[0]
-        else:
-            yield _msg('requesting new instance')
-            is_instance_newly_created = True
-            instance_data = self._ask_aws_for_new_instance(
-                instance_type,
-                instance_max_uptime_in_minutes,
-                instance_market_spec)
+        with tracing.span(execution_id, 'instance.find') as find_span:
+            instances_not_assigned = self._get_group_aws_instances(
+                only_running=True,
+                filters=[(f'tag:{EC2Instance.EXECUTION_ID_TAG}', ''),
+                         ('instance-type', instance_type)])
+            if len(instances_not_assigned) > 0:
+                yield _msg('reusing existing instance')
+                is_instance_newly_created = False
+                instance_data = instances_not_assigned[0]
+            else:
+                yield _msg('requesting new instance')
+                is_instance_newly_created = True
+                instance_data = self._ask_aws_for_new_instance(
+                    instance_type,
+                    instance_max_uptime_in_minutes,
+                    instance_market_spec)
+            find_span['attributes']['newly_created'] = \
+                is_instance_newly_created
         yield _msg(
             f'waiting for the instance to be ready')
         instance = None
@@ -165,6 +173,25 @@ class EC2InstanceGroup(InstanceProvider):
                 f'More than one instance for execution ID {execution_id}')
         return self._ec2_instance_from_instance_data(instance_data_list[0])
 
+    def instances_for(self, execution_ids: List[str]) \
+            -> Dict[str, EC2Instance]:
+        instances = {}
+        for i in range(0, len(execution_ids), self.MAX_FILTER_VALUES):
+            instance_data_list = self._get_group_aws_instances(
+                filters=[(f'tag:{EC2Instance.EXECUTION_ID_TAG}',
+                          execution_ids[i:i + self.MAX_FILTER_VALUES])],
+                only_running=False)
+            for instance_data in instance_data_list:
+                execution_id = get_tag(
+                    instance_data, EC2Instance.EXECUTION_ID_TAG)
+                if execution_id in instances:
+                    raise ValueError(
+                        'More than one instance for execution ID '
+                        f'{execution_id}')
+                instances[execution_id] = \
+                    self._ec2_instance_from_instance_data(instance_data)
+        return instances
+
     def release_instance(self, execution_id: str,
                          fail_if_not_found: bool=True,
                          idle_since_timestamp: Optional[int] = None):
@@ -2,11 +2,12 @@ import io
 import json
 import logging
 import os
-from typing import Dict, Iterator, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional
 
 from docker.types import Mount
 from redis import StrictRedis
 
+from plz.controller import tracing
 from plz.controller.containers import ContainerState, Containers
 from plz.controller.images import Images
 from plz.controller.instances.instance_base import ExecutionInfo, Instance, \
@@ -50,23 +51,25 @@ class DockerInstance(Instance):
         environment = {
             'CONFIGURATION_FILE': Volumes.CONFIGURATION_FILE_PATH
         }
-        volume = self.volumes.create(self.volume_name, [
-            VolumeDirectory(
-                Volumes.INPUT_DIRECTORY,
-                contents_tarball=input_stream or io.BytesIO()),
-            VolumeEmptyDirectory(Volumes.OUTPUT_DIRECTORY),
-            VolumeEmptyDirectory(Volumes.MEASURES_DIRECTORY),
-            VolumeFile(Volumes.CONFIGURATION_FILE,
-                       contents=json.dumps(configuration, indent=2)),
-        ])
-        self.containers.run(execution_id=self.execution_id,
-                            repository=self.images.repository,
-                            tag=snapshot_id,
-                            command=command,
-                            environment=environment,
-                            mounts=[Mount(source=volume.name,
-                                          target=Volumes.VOLUME_MOUNT)],
-                            docker_run_args=docker_run_args)
+        with tracing.span(self.execution_id, 'volumes.create'):
+            volume = self.volumes.create(self.volume_name, [
+                VolumeDirectory(
+                    Volumes.INPUT_DIRECTORY,
+                    contents_tarball=input_stream or io.BytesIO()),
+                VolumeEmptyDirectory(Volumes.OUTPUT_DIRECTORY),
+                VolumeEmptyDirectory(Volumes.MEASURES_DIRECTORY),
+                VolumeFile(Volumes.CONFIGURATION_FILE,
+                           contents=json.dumps(configuration, indent=2)),
+            ])
+        with tracing.span(self.execution_id, 'containers.run'):
+            self.containers.run(execution_id=self.execution_id,
+                                repository=self.images.repository,
+                                tag=snapshot_id,
+                                command=command,
+                                environment=environment,
+                                mounts=[Mount(source=volume.name,
+                                              target=Volumes.VOLUME_MOUNT)],
+                                docker_run_args=docker_run_args)
 
     def stop_execution(self):
         self.containers.stop(self.execution_id)
@@ -129,10 +132,10 @@ class DockerInstance(Instance):
         if not release_container:
             # Everything to release here is about the container
             return
-        with self._lock:
+        with self._lock, tracing.span(self.execution_id, 'instance.release'):
             self.stop_execution()
-            self._publish_results(results_storage,
-                                  finish_timestamp=idle_since_timestamp)
+            if not results_storage.is_finished(self.execution_id):
+                self.publish_results(results_storage, idle_since_timestamp)
             # Check that we could collect the logs before destroying the
             # container
             if not results_storage.is_finished(self.execution_id):
@@ -143,14 +146,22 @@ class DockerInstance(Instance):
     def get_forensics(self) -> dict:
         return {}
 
-    def _publish_results(self, results_storage: ResultsStorage,
-                         finish_timestamp: int):
+    def publish_results(
+            self, results_storage: ResultsStorage, idle_since_timestamp: int,
+            record_progress: Optional[Callable[[int], None]] = None) -> None:
+        finish_timestamp = idle_since_timestamp
+        if not finish_timestamp:
+            # Local instances don't keep track of when they became idle
+            finish_timestamp = self.container_state().finished_at
+        record_progress = record_progress or (lambda size: None)
         results_storage.publish(
             self.get_execution_id(),
             exit_status=self.get_status().exit_status,
-            logs=self.get_logs(since=None),
-            output_tarball=self.get_output_files_tarball(),
-            measures_tarball=self.get_measures_files_tarball(),
+            logs=_recorded(self.get_logs(since=None), record_progress),
+            output_tarball=_recorded(
+                self.get_output_files_tarball(), record_progress),
+            measures_tarball=_recorded(
+                self.get_measures_files_tarball(), record_progress),
             finish_timestamp=finish_timestamp)
 
     @property
@@ -174,3 +185,10 @@ class DockerInstance(Instance):
 
     def get_stored_metadata(self) -> dict:
         raise InstanceStillRunningException(self.execution_id)
+
+
+def _recorded(chunks: Iterator[bytes],
+              record_progress: Callable[[int], None]) -> Iterator[bytes]:
+    for chunk in chunks:
+        record_progress(len(chunk))
+        yield chunk
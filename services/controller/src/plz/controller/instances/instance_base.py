@@ -1,15 +1,19 @@
+import collections
 import io
 import logging
 import time
 from abc import ABC, abstractmethod
 from collections import namedtuple
-from typing import Any, ContextManager, Dict, Iterator, List, Optional
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, \
+    Optional
 
 from redis import StrictRedis
 from redis.lock import Lock
 
+from plz.controller import metrics
 from plz.controller.containers import ContainerMissingException, ContainerState
 from plz.controller.api.exceptions import ProviderKillingInstancesException
+from plz.controller.instances.publications import Publications
 from plz.controller.results.results_base import InstanceStatus, \
     InstanceStatusFailure, InstanceStatusRunning, InstanceStatusSuccess, \
     Results, ResultsStorage
@@ -20,7 +24,7 @@ Parameters = Dict[str, Any]
 ExecutionInfo = namedtuple(
     'ExecutionInfo',
     ['execution_id', 'running', 'status', 'instance_type', 'max_idle_seconds',
-     'idle_since_timestamp', 'instance_id'])
+     'idle_since_timestamp', 'instance_id', 'publication'])
 
 
 class Instance(Results):
@@ -107,16 +111,31 @@ class Instance(Results):
             running=running,
             status=status,
             idle_since_timestamp=idle_since_timestamp,
-            max_idle_seconds=self.get_max_idle_seconds())
+            max_idle_seconds=self.get_max_idle_seconds(),
+            # Filled in by the provider, for all instances at once
+            publication=None)
 
     @abstractmethod
     def container_state(self) -> Optional[ContainerState]:
         pass
 
+    @abstractmethod
+    def publish_results(
+            self, results_storage: ResultsStorage, idle_since_timestamp: int,
+            record_progress: Optional[Callable[[int], None]] = None) -> None:
+        """Copies the results of the execution to the storage, without
+           holding the lock of the instance, or releasing it.
+
+           :param record_progress: called with the size of each chunk copied
+        """
+        pass
+
     @abstractmethod
     def release(self, results_storage: ResultsStorage,
                 idle_since_timestamp: int,
                 release_container: bool = True) -> bool:
+        """Publishes the results, unless they are already, and releases the
+           instance"""
         pass
 
     @abstractmethod
@@ -130,7 +149,9 @@ class Instance(Results):
         """Set the underlying resource to not be listed among the live ones"""
         pass
 
-    def harvest(self, results_storage: ResultsStorage):
+    def harvest(self, results_storage: ResultsStorage,
+                publications: Publications) -> str:
+        """:returns: the state of the resource, as in `get_resource_state`"""
         with self._lock:
             resource_state = self.get_resource_state()
             execution_id = self.get_execution_id()
@@ -142,21 +163,24 @@ class Instance(Results):
                         log.warning(
                             'There\'s a terminated instance without an '
                             'execution ID associated.')
-                        return
+                        return resource_state
                     with results_storage.get(execution_id) as results:
                         if results is not None:
-                            return
+                            return resource_state
                     results_storage.write_tombstone(
                         execution_id,
                         tombstone={'forensics': self.get_forensics()})
                 finally:
                     self.delete_resource()
+                    if execution_id != '':
+                        results_storage.db_storage.add_execution_event(
+                            execution_id, 'instance_disposed')
 
             # We only care about harvesting running and terminated instances
             if resource_state != 'running':
                 log.info(f'Instance for execution ID [{execution_id}] is '
                          f'[{resource_state}]')
-                return
+                return resource_state
 
             try:
                 info = self.get_execution_info()
@@ -173,16 +197,31 @@ class Instance(Results):
                     # There's no container so don't try to release things
                     # there
                     release_container=False)
-                return
+                results_storage.db_storage.add_execution_event(
+                    execution_id, 'instance_disposed')
+                return resource_state
             if info.status == 'exited':
-                self.release(results_storage, info.idle_since_timestamp)
-
-            if info.status in {'exited', 'idle'}:
+                # Publishing might take a while, so it's done in the
+                # background. Once published, the execution doesn't hold the
+                # instance anymore, and it's idle at the next harvest.
+                # Whether it's terminated or kept for other executions is up
+                # to the instance
+                publications.start(
+                    execution_id,
+                    publish=lambda record_progress: self.publish_results(
+                        results_storage, info.idle_since_timestamp,
+                        record_progress),
+                    release=lambda: self.release(
+                        results_storage, info.idle_since_timestamp))
+                return resource_state
+
+            if info.status == 'idle':
                 result = self.dispose_if_its_time(execution_info=info)
                 if result is not None:
                     log.error(f'Harvesting: Instance {self.instance_id} for '
                               f'execution ID: {self.get_execution_id()}: '
                               f'{result}')
+            return resource_state
 
     def is_terminated(self) -> bool:
         return self.get_resource_state() == 'terminated'
@@ -221,8 +260,10 @@ class Instance(Results):
 
 
 class InstanceProvider(ABC):
-    def __init__(self, results_storage: ResultsStorage):
+    def __init__(self, results_storage: ResultsStorage,
+                 publications: Publications):
         self.results_storage = results_storage
+        self.publications = publications
 
     @abstractmethod
     def run_in_instance(self,
@@ -239,10 +280,28 @@ class InstanceProvider(ABC):
     def instance_for(self, execution_id: str) -> Optional[Instance]:
         pass
 
+    def instances_for(self, execution_ids: List[str]) \
+            -> Dict[str, Instance]:
+        """Gets the instances assigned to several execution IDs. Executions
+           without an instance are not present in the result.
+
+           Providers should override it when they can get all the instances
+           with less queries than one per execution ID."""
+        instances = {}
+        for execution_id in execution_ids:
+            instance = self.instance_for(execution_id)
+            if instance is not None:
+                instances[execution_id] = instance
+        return instances
+
     def release_instance(
             self, execution_id: str,
             fail_if_not_found: bool=True,
             idle_since_timestamp: Optional[int]=None):
+        # A publication in the background releases the instance once it's
+        # done, so wait for it rather than writing the same results at the
+        # same time
+        self.publications.wait(execution_id)
         instance = self.instance_for(execution_id)
         if instance is None:
             if fail_if_not_found:
@@ -305,20 +364,28 @@ class InstanceProvider(ABC):
         pass
 
     def harvest(self):
+        start = time.time()
+        instances_by_state = collections.Counter()
         for instance in self.instance_iterator(only_running=False):
             # noinspection PyBroadException
             try:
-                instance.harvest(self.results_storage)
+                instances_by_state[instance.harvest(
+                    self.results_storage, self.publications)] += 1
             except Exception:
                 # Make sure that an exception thrown while harvesting an
                 # instance doesn't stop the whole harvesting process
                 log.exception('Exception harvesting')
+        metrics.record_harvest(instances_by_state, time.time() - start)
 
     def get_executions(self) -> [ExecutionInfo]:
-        return [
+        infos = [
             instance.get_execution_info()
             for instance in self.instance_iterator(only_running=False)
             if not instance.is_terminated()]
+        publications = self.publications.get_states(
+            [info.execution_id for info in infos if info.execution_id != ''])
+        return [info._replace(publication=publications.get(info.execution_id))
+                for info in infos]
 
     @abstractmethod
     def get_forensics(self, execution_id: str) -> dict:
@@ -9,6 +9,7 @@ from plz.controller.images import Images
 from plz.controller.instances.docker import DockerInstance
 from plz.controller.instances.instance_base \
     import Instance, InstanceProvider, Parameters
+from plz.controller.instances.publications import Publications
 from plz.controller.results.results_base import ResultsStorage
 from plz.controller.volumes import Volumes
 
@@ -21,8 +22,9 @@ class Localhost(InstanceProvider):
                  images: Images,
                  containers: Containers,
                  volumes: Volumes,
-                 redis: StrictRedis):
-        super().__init__(results_storage)
+                 redis: StrictRedis,
+                 publications: Publications):
+        super().__init__(results_storage, publications)
         self.images = images
         self.containers = containers
         self.volumes = volumes
@@ -69,6 +71,16 @@ class Localhost(InstanceProvider):
             execution_id,
             self.redis)
 
+    def instances_for(self, execution_ids: List[str]) \
+            -> Dict[str, Instance]:
+        existing_execution_ids = set(self.containers.execution_ids())
+        return {
+            execution_id: DockerInstance(
+                self.images, self.containers, self.volumes, execution_id,
+                self.redis)
+            for execution_id in execution_ids
+            if execution_id in existing_execution_ids}
+
     def push(self, image_tag: str):
         pass
 
@@ -0,0 +1,157 @@
+import concurrent.futures
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from redis import StrictRedis
+
+from plz.controller.results import ResultsStorage
+
+log = logging.getLogger(__name__)
+
+# States of a publication, in order
+EXITED = 'exited'
+PUBLISHING = 'publishing'
+PUBLISHED = 'published'
+CLEANED = 'cleaned'
+
+# Finished publications are only interesting for a while
+_CLEANED_EXPIRE_SECONDS = 7 * 24 * 60 * 60
+# How often the bytes published so far are stored, at most
+_PROGRESS_PERIOD_SECONDS = 1
+# How often waiting for a publication checks whether it's over
+_WAIT_POLL_SECONDS = 1
+
+# Publishes results, calling the function with the number of bytes of each
+# chunk as it goes
+Publish = Callable[[Callable[[int], None]], None]
+
+
+class Publications:
+    """Publishes the results of executions that exited, and then releases
+       their instances, in a pool of threads, so that harvesting doesn't wait
+       for executions with large outputs.
+
+       The state of each publication goes from `exited` to `publishing`,
+       `published` (the results are stored) and `cleaned` (the instance is
+       released). If publishing fails, it's back to `exited` and, as the
+       instance isn't released, it's retried at the next harvest. If
+       releasing fails, it's retried without publishing again.
+
+       A publication is claimed (for `claim_seconds`, renewed while it makes
+       progress) so that other processes harvesting don't start it again,
+       and so that releasing the instance elsewhere can wait for it."""
+
+    def __init__(self,
+                 redis: StrictRedis,
+                 results_storage: ResultsStorage,
+                 max_workers: int = 4,
+                 claim_seconds: int = 60):
+        self.redis = redis
+        self.results_storage = results_storage
+        self.db_storage = results_storage.db_storage
+        self.claim_seconds = claim_seconds
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='publications')
+
+    def get_state(self, execution_id: str) -> Optional[dict]:
+        return self.get_states([execution_id]).get(execution_id)
+
+    def get_states(self, execution_ids: List[str]) -> Dict[str, dict]:
+        return self.db_storage.retrieve_publication_states(execution_ids)
+
+    def start(self, execution_id: str, publish: Publish,
+              release: Callable[[], None]) \
+            -> Optional[concurrent.futures.Future]:
+        """Publishes and releases in the background, unless it's happening
+           already (maybe in another process).
+
+           :returns: the future of the publication, if it was started"""
+        claim = self._claim(execution_id)
+        if claim is None:
+            return None
+        state = self.get_state(execution_id)
+        if state is None:
+            state = {'state': EXITED, 'attempts': 0}
+            self._store(execution_id, state)
+            self.db_storage.add_execution_event(execution_id, 'exited')
+        return self._pool.submit(
+            self._publish, execution_id, claim, state['attempts'] + 1,
+            publish, release)
+
+    def wait(self, execution_id: str):
+        """Waits until the publication of the execution is over, if it's
+           happening (maybe in another process)"""
+        while self.redis.get(self._claim_key(execution_id)) is not None:
+            time.sleep(_WAIT_POLL_SECONDS)
+
+    def _publish(self, execution_id: str, claim: str, attempt: int,
+                 publish: Publish, release: Callable[[], None]):
+        state = {'state': PUBLISHING, 'attempts': attempt, 'bytes': 0,
+                 'started_at': int(time.time())}
+        try:
+            self._store(execution_id, state)
+            if not self.results_storage.is_finished(execution_id):
+                publish(self._progress_recorder(execution_id, state))
+            state = {**state, 'state': PUBLISHED}
+            self._store(execution_id, state)
+            release()
+            state = {**state, 'state': CLEANED,
+                     'finished_at': int(time.time())}
+            self._store(execution_id, state, _CLEANED_EXPIRE_SECONDS)
+            self.db_storage.add_execution_event(
+                execution_id, 'instance_disposed')
+        except Exception as e:
+            log.exception(f'Couldn\'t publish {execution_id} (attempt '
+                          f'{attempt}), retrying at the next harvest')
+            self._store(execution_id, {
+                **state,
+                'state': EXITED if state['state'] == PUBLISHING
+                else state['state'],
+                'error': f'{type(e).__name__}: {e}'})
+        finally:
+            self._release_claim(execution_id, claim)
+
+    def _progress_recorder(self, execution_id: str, state: dict) \
+            -> Callable[[int], None]:
+        stored_at = time.time()
+        # Streams are published concurrently
+        lock = threading.Lock()
+
+        def record(size: int):
+            nonlocal stored_at
+            with lock:
+                state['bytes'] += size
+                if time.time() - stored_at < _PROGRESS_PERIOD_SECONDS:
+                    return
+                stored_at = time.time()
+                self._store(execution_id, state)
+            self.redis.expire(self._claim_key(execution_id),
+                              self.claim_seconds)
+
+        return record
+
+    def _store(self, execution_id: str, state: dict,
+               expire_seconds: Optional[int] = None):
+        self.db_storage.store_publication_state(
+            execution_id, {**state, 'updated_at': int(time.time())},
+            expire_seconds)
+
+    def _claim(self, execution_id: str) -> Optional[str]:
+        """:returns: a token for the claim, if we got it"""
+        claim = uuid.uuid4().hex
+        if not self.redis.set(self._claim_key(execution_id), claim, nx=True,
+                              ex=self.claim_seconds):
+            return None
+        return claim
+
+    def _release_claim(self, execution_id: str, claim: str):
+        # Unless it expired, and someone else claimed it
+        if self.redis.get(self._claim_key(execution_id)) == \
+                claim.encode('ascii'):
+            self.redis.delete(self._claim_key(execution_id))
+
+    def _claim_key(self, execution_id: str) -> str:
+        return f'{__name__}.{self.__class__.__name__}:claim:{execution_id}'
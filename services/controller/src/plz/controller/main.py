@@ -1,21 +1,29 @@
+import hmac
 import json
 import logging
 import os
 import sys
-from distutils.util import strtobool
-from typing import Any, Callable, Iterator, Optional, TypeVar, Union
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar, \
+    Union
 
+import msgpack
 import requests
-from flask import Flask, Response, abort, jsonify, request, stream_with_context
+from flask import Flask, Response, abort, g, jsonify, request, send_file, \
+    stream_with_context
 
-from plz.controller import configuration
+from plz.controller import compression, configuration, metrics, profiling
+from plz.controller.api import server_sent_events
 from plz.controller.api.exceptions import AbortedExecutionException, \
     InstanceNotRunningException, JSONResponseException, \
     ResponseHandledException, WorkerUnreachableException
-from plz.controller.api.types import InputMetadata, JSONString
+from plz.controller.api.framing import encode_frame
+from plz.controller.api.types import ACCEPT_COMPRESSED_HEADER, \
+    InputMetadata, JSONString, MSGPACK_MIMETYPE
 from plz.controller.arbitrary_object_json_encoder import \
-    ArbitraryObjectJSONEncoder
+    ArbitraryObjectJSONEncoder, dumps_arbitrary_json
 from plz.controller.controller_impl import ControllerImpl
+from plz.controller.results.results_base import ResultsFile
 
 T = TypeVar('T')
 ResponseGenerator = Iterator[Union[bytes, str]]
@@ -23,6 +31,19 @@ ResponseGeneratorFunction = Callable[[], ResponseGenerator]
 
 config = configuration.load()
 port = config.get_int('port', 8080)
+# Responses are compressed only for clients sending
+# `ACCEPT_COMPRESSED_HEADER`
+compression_enabled = config.get_bool('compression.enabled', True)
+# Smaller non-streamed responses aren't worth compressing
+compression_min_size = config.get_int('compression.min_size', 1024)
+# How to send files with finished results: `server` (with the WSGI server,
+# which uses `sendfile` when it can), or headers for a fronting proxy to
+# send it: `x-sendfile` or `x-accel-redirect` (nginx)
+results_file_serving = config.get('results.file_serving', 'server')
+if results_file_serving not in {'server', 'x-sendfile', 'x-accel-redirect'}:
+    raise ValueError(
+        f'Invalid value for results.file_serving: {results_file_serving}')
+profiling_access = configuration.profiling_access_from_config(config)
 
 
 def _setup_logging():
@@ -60,6 +81,7 @@ def _get_build_timestamp() -> int:
 
 app = Flask(__name__)
 app.json_encoder = ArbitraryObjectJSONEncoder
+app.use_x_sendfile = results_file_serving == 'x-sendfile'
 
 _setup_logging()
 log = logging.getLogger(__name__)
@@ -82,14 +104,35 @@ def handle_chunked_input():
         request.environ['wsgi.input_terminated'] = True
 
 
+@app.before_request
+def start_timing_request():
+    g.request_start_time = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response: Response) -> Response:
+    # Registered before compressing, so that it runs after it
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe_request(
+        route, request.method, response, g.request_start_time)
+    return response
+
+
+@app.after_request
+def compress_response(response: Response) -> Response:
+    if not _accepts_compressed() or request.method == 'HEAD':
+        return response
+    encoding = request.accept_encodings.best_match(
+        compression.available_encodings())
+    return compression.compress_response(
+        response, encoding, min_size=compression_min_size)
+
+
 @app.errorhandler(ResponseHandledException)
 def handle_exception(exception: ResponseHandledException):
     if isinstance(exception, WorkerUnreachableException):
         exception = maybe_add_forensics(exception)
-    return jsonify(exception_type=type(exception).__name__,
-                   **{k: v for k, v in exception.__dict__.items()
-                      if k != 'response_code'}), \
-        exception.response_code
+    return jsonify(exception.as_dict()), exception.response_code
 
 
 def maybe_add_forensics(exception: WorkerUnreachableException) \
@@ -117,11 +160,71 @@ def ping_entrypoint():
             build_timestamp=_build_timestamp))
 
 
+@app.route('/ready', methods=['GET'])
+def ready_entrypoint():
+    """Unlike `/ping`, which tells that the controller is up, tells whether
+       the services it depends on (redis, docker, AWS...) answer"""
+    dependencies = controller.dependencies.readiness()
+    ready = all(d['ready'] for d in dependencies.values())
+    response = jsonify({'ready': ready, 'dependencies': dependencies})
+    if not ready:
+        response.status_code = requests.codes.service_unavailable
+    return response
+
+
 @app.route('/', methods=['GET'])
 def root():
     return jsonify({})
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics_entrypoint():
+    data, content_type = metrics.render()
+    return Response(data, content_type=content_type)
+
+
+@app.route('/admin/profile', methods=['GET'])
+def profile_entrypoint():
+    """Profiles this worker for `seconds`. With `format=collapsed`, samples
+       the stacks for flame graphs. With `format=pstats`, returns `cProfile`
+       stats, to read with `pstats`"""
+    _check_profiling_access()
+    seconds = _profiling_seconds()
+    profile_format = request.args.get('format', default='collapsed')
+    if profile_format == 'collapsed':
+        interval = request.args.get('interval', default=0.01, type=float)
+        return _profile_response(
+            lambda: profiling.collapsed_stacks(seconds, interval),
+            mimetype='text/plain')
+    elif profile_format == 'pstats':
+        return _profile_response(
+            lambda: profiling.cprofile_stats(seconds),
+            mimetype='application/octet-stream',
+            headers={'Content-Disposition':
+                     'attachment; filename=controller.pstats'})
+    abort(requests.codes.bad_request)
+
+
+@app.route('/admin/memory', methods=['GET'])
+def memory_growth_entrypoint():
+    """Where this worker allocated memory, that is still in use, in the next
+       `seconds`"""
+    _check_profiling_access()
+    seconds = _profiling_seconds()
+    group_by = request.args.get('group_by', default='lineno')
+    if group_by not in {'lineno', 'filename', 'traceback'}:
+        abort(requests.codes.bad_request)
+    return _profile_response(
+        lambda: profiling.memory_growth(
+            seconds,
+            limit=request.args.get('limit', default=50, type=int),
+            group_by=group_by,
+            frames=request.args.get(
+                'frames', default=10 if group_by == 'traceback' else 1,
+                type=int)),
+        mimetype='text/plain')
+
+
 @app.route(f'/executions', methods=['POST'])
 def run_execution_entrypoint():
     # Test with:
@@ -180,10 +283,8 @@ def rerun_execution_entrypoint():
 
 @app.route('/executions/list', methods=['GET'])
 def list_executions_entrypoint():
-    return Response(
-        json.dumps({'executions': controller.list_executions()}),
-        mimetype='application/json',
-        status=requests.codes.ok)
+    return _structured_response(
+        {'executions': controller.list_executions()})
 
 
 @app.route('/executions/harvest', methods=['POST'])
@@ -198,25 +299,89 @@ def get_status_entrypoint(execution_id):
     return jsonify(controller.get_status(execution_id))
 
 
+@app.route('/executions/status', methods=['POST'])
+def get_statuses_entrypoint():
+    execution_ids = _execution_ids_from(_json_body())
+    return jsonify({'statuses': controller.get_statuses(execution_ids)})
+
+
 @app.route(f'/executions/<execution_id>/logs',
            methods=['GET'])
 def get_logs_entrypoint(execution_id):
     since: Optional[int] = request.args.get(
         'since', default=None, type=int)
-    return Response(controller.get_logs(execution_id, since=since),
-                    mimetype='application/octet-stream')
+    logs = controller.get_logs_file_or_logs(
+        execution_id, since, _encodings_of_results_files())
+    if isinstance(logs, ResultsFile):
+        return _send_results_file(logs)
+    return Response(logs, mimetype='application/octet-stream')
+
+
+@app.route('/executions/logs', methods=['POST'])
+def get_multiplexed_logs_entrypoint():
+    body = _json_body()
+    execution_ids = _execution_ids_from(body)
+    since: Optional[int] = body.get('since', None)
+    offsets: Optional[Dict[str, int]] = body.get('offsets', None)
+    if not (since is None or _is_int(since)):
+        abort(requests.codes.bad_request)
+    if not (offsets is None or isinstance(offsets, dict) and
+            all(_is_int(offset) for offset in offsets.values())):
+        abort(requests.codes.bad_request)
+
+    @stream_with_context
+    def act() -> Iterator[bytes]:
+        for header, payload in controller.get_multiplexed_logs(
+                execution_ids, since=since, offsets=offsets):
+            yield encode_frame(header, payload)
+    return Response(act(), mimetype='application/octet-stream')
+
+
+@app.route('/executions/events', methods=['GET'])
+def get_execution_events_entrypoint():
+    # Browsers send the header when reconnecting, other clients can use the
+    # parameter
+    last_event_id: Optional[str] = request.headers.get(
+        'Last-Event-ID', default=request.args.get('last_event_id', None))
+    execution_ids: Optional[List[str]] = \
+        request.args.getlist('execution_id') or None
+
+    @stream_with_context
+    def act() -> Iterator[str]:
+        for event in controller.get_execution_events(
+                last_event_id, execution_ids):
+            if event is None:
+                yield server_sent_events.KEEP_ALIVE
+            else:
+                yield server_sent_events.encode_event(event)
+
+    return Response(
+        act(), mimetype=server_sent_events.MIMETYPE,
+        # Ask proxies like nginx to not buffer the events
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route(f'/executions/<execution_id>/output/files')
 def get_output_files_entrypoint(execution_id):
-    return Response(controller.get_output_files(execution_id),
-                    mimetype='application/octet-stream')
+    paths: Optional[List[str]] = request.args.getlist('path') or None
+    globs: Optional[List[str]] = request.args.getlist('glob') or None
+    if paths is not None or globs is not None:
+        # Only some members of the tarball, so there's no file to send
+        return Response(
+            stream_with_context(
+                controller.get_output_files(execution_id, paths, globs)),
+            mimetype='application/octet-stream')
+    output_files = controller.get_output_files_file_or_tarball(
+        execution_id, _encodings_of_results_files())
+    if isinstance(output_files, ResultsFile):
+        return _send_results_file(output_files)
+    return Response(output_files, mimetype='application/octet-stream')
 
 
 @app.route(f'/executions/<execution_id>/measures', methods=['GET'])
 def get_measures(execution_id):
     summary: bool = request.args.get(
-        'summary', default=False, type=strtobool)
+        'summary', default=False, type=_strtobool)
     return Response(
         stream_with_context(controller.get_measures(execution_id, summary)),
         mimetype='text/plain')
@@ -227,19 +392,52 @@ def delete_execution(execution_id):
     # Test with:
     # curl -XDELETE localhost:5000/executions/some-id
     fail_if_running: bool = request.args.get(
-        'fail_if_running', default=False, type=strtobool)
+        'fail_if_running', default=False, type=_strtobool)
     fail_if_deleted: bool = request.args.get(
-        'fail_if_deleted', default=False, type=strtobool)
+        'fail_if_deleted', default=False, type=_strtobool)
     controller.delete_execution(
         execution_id, fail_if_running=fail_if_running,
         fail_if_deleted=fail_if_deleted)
     return jsonify({}), requests.codes.no_content
 
 
+@app.route('/executions/<execution_id>/finalize', methods=['POST'])
+def finalize_execution_entrypoint(execution_id):
+    frames = controller.finalize_execution(execution_id)
+    return Response(
+        stream_with_context(
+            encode_frame(header, payload) for header, payload in frames),
+        mimetype='application/octet-stream')
+
+
 @app.route(f'/executions/<user>/<project>/history', methods=['GET'])
 def history_entrypoint(user, project):
+    limit: Optional[int] = request.args.get('limit', default=None, type=int)
+    before: Optional[int] = request.args.get(
+        'before', default=None, type=int)
+    after: Optional[int] = request.args.get('after', default=None, type=int)
+    before_execution_id: Optional[str] = request.args.get(
+        'before_execution_id', default=None)
+    after_execution_id: Optional[str] = request.args.get(
+        'after_execution_id', default=None)
+    if _accepts_msgpack():
+        # A sequence of [execution_id, metadata] pairs, so that it can be
+        # streamed without knowing the number of entries in advance
+        entries = controller.get_history_entries(
+            user, project, limit=limit, before=before, after=after,
+            before_execution_id=before_execution_id,
+            after_execution_id=after_execution_id)
+        packer = msgpack.Packer(
+            default=_msgpack_default, use_bin_type=True)
+        return Response(
+            stream_with_context(packer.pack(entry) for entry in entries),
+            mimetype=MSGPACK_MIMETYPE,
+            headers={'Vary': 'Accept'})
     return Response(
-        stream_with_context(controller.get_history(user, project)),
+        stream_with_context(controller.get_history(
+            user, project, limit=limit, before=before, after=after,
+            before_execution_id=before_execution_id,
+            after_execution_id=after_execution_id)),
         mimetype='text/plain')
 
 
@@ -317,7 +515,128 @@ def kill_instances_entrypoint():
 
 @app.route(f'/executions/describe/<execution_id>', methods=['GET'])
 def describe_execution_entrypoint(execution_id: str):
-    return jsonify(controller.describe_execution_entrypoint(execution_id))
+    return _structured_response(
+        controller.describe_execution_entrypoint(execution_id))
+
+
+def _accepts_compressed() -> bool:
+    return compression_enabled and \
+        ACCEPT_COMPRESSED_HEADER in request.headers
+
+
+def _encodings_of_results_files() -> List[str]:
+    """Encodings that results files stored compressed can be sent with,
+       without decompressing them. For clients that didn't opt in to
+       compressed responses, they are decompressed"""
+    # nginx doesn't pass on the encoding of the response redirecting to the
+    # file
+    if not _accepts_compressed() or \
+            results_file_serving == 'x-accel-redirect':
+        return []
+    return [encoding for encoding in compression.available_encodings()
+            if request.accept_encodings[encoding] > 0]
+
+
+def _send_results_file(results_file: ResultsFile) -> Response:
+    path = results_file.path
+    if results_file_serving == 'x-accel-redirect':
+        # nginx needs an internal location mapped to the results directory
+        location = config.get(
+            'results.x_accel_redirect_location', '/results/')
+        relative_path = os.path.relpath(
+            path, os.path.abspath(config['results.directory']))
+        return Response(
+            mimetype='application/octet-stream',
+            headers={'X-Accel-Redirect':
+                     location.rstrip('/') + '/' + relative_path})
+    # Conditional, so that clients can resume broken downloads with `Range`
+    # and `If-Range` (nginx does the same for `X-Accel-Redirect`)
+    response = send_file(path, mimetype='application/octet-stream',
+                         conditional=True)
+    if results_file.encoding is not None:
+        response.headers['Content-Encoding'] = results_file.encoding
+    return response
+
+
+def _check_profiling_access():
+    # Not found, as if the endpoints didn't exist
+    if not profiling_access.enabled:
+        abort(requests.codes.not_found)
+    if profiling_access.token is not None and not hmac.compare_digest(
+            request.headers.get('Authorization', ''),
+            f'Bearer {profiling_access.token}'):
+        abort(Response(status=requests.codes.unauthorized,
+                       headers={'WWW-Authenticate': 'Bearer'}))
+
+
+def _profiling_seconds() -> float:
+    seconds = request.args.get('seconds', default=10, type=float)
+    if not 0 < seconds <= profiling.MAX_SECONDS:
+        abort(requests.codes.bad_request)
+    return seconds
+
+
+def _profile_response(profile: Callable[[], Union[bytes, str]],
+                      **kwargs) -> Response:
+    try:
+        return Response(profile(), **kwargs)
+    except profiling.ProfilerBusyException:
+        abort(requests.codes.conflict)
+
+
+def _strtobool(value: str) -> bool:
+    # Same as `distutils.util.strtobool`, as importing `distutils` takes
+    # longer than the rest of the controller
+    value = value.lower()
+    if value in {'y', 'yes', 't', 'true', 'on', '1'}:
+        return True
+    if value in {'n', 'no', 'f', 'false', 'off', '0'}:
+        return False
+    raise ValueError(f'Invalid truth value: {value}')
+
+
+def _json_body() -> dict:
+    """The JSON object in the body of the request. If there's no such
+       object, the request is bad"""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(requests.codes.bad_request)
+    return body
+
+
+def _execution_ids_from(body: dict) -> List[str]:
+    execution_ids = body.get('execution_ids')
+    if not isinstance(execution_ids, list) or \
+            not all(isinstance(e, str) for e in execution_ids):
+        abort(requests.codes.bad_request)
+    return execution_ids
+
+
+def _is_int(value: Any) -> bool:
+    # In JSON, booleans aren't numbers
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _accepts_msgpack() -> bool:
+    # JSON wins unless the client prefers msgpack explicitly
+    return request.accept_mimetypes.best_match(
+        ['application/json', MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE
+
+
+def _msgpack_default(o):
+    # Same as for JSON, encode arbitrary objects as their attributes
+    return o.__dict__
+
+
+def _structured_response(o: Any) -> Response:
+    if _accepts_msgpack():
+        body = msgpack.packb(o, default=_msgpack_default, use_bin_type=True)
+        mimetype = MSGPACK_MIMETYPE
+    else:
+        body = dumps_arbitrary_json(o)
+        mimetype = 'application/json'
+    return Response(body, mimetype=mimetype, headers={'Vary': 'Accept'},
+                    status=requests.codes.ok)
 
 
 def _json_stream(f: Callable[[], Iterator[Any]]):
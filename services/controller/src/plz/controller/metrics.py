@@ -0,0 +1,204 @@
+import functools
+import inspect
+import os
+import time
+from typing import Callable, Dict, Tuple
+
+from flask import Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, \
+    Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+from redis import StrictRedis
+
+# Metrics in the Prometheus format, served at `/metrics`.
+#
+# Under gunicorn, each worker keeps its metrics in memory-mapped files in
+# `PROMETHEUS_MULTIPROC_DIR` (set up by `run`), and `/metrics` adds up the
+# files of all workers. Updating a metric writes to the mapped file, with no
+# system calls.
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'plz_http_request_duration_seconds',
+    'Time until the response is ready (for streams, until it starts)',
+    ['route', 'method', 'status'])
+HTTP_ACTIVE_STREAMS = Gauge(
+    'plz_http_active_streams',
+    'Streamed responses still being sent',
+    ['route'],
+    multiprocess_mode='livesum')
+
+DOCKER_CALL_SECONDS = Histogram(
+    'plz_docker_call_duration_seconds',
+    'Calls to the docker API, by operation',
+    ['operation'])
+DOCKER_CALL_ERRORS = Counter(
+    'plz_docker_call_errors_total',
+    'Calls to the docker API that raised an exception, by operation',
+    ['operation'])
+
+# Only for daemons that have been unreachable, as there's a daemon per worker
+DOCKER_HOST_CIRCUIT_OPEN = Gauge(
+    'plz_docker_host_circuit_open',
+    'Whether calls to the docker daemon fail right away, as it was '
+    'unreachable (1) or not anymore (0), by daemon',
+    ['host'],
+    multiprocess_mode='livemax')
+DOCKER_CALLS_REJECTED = Counter(
+    'plz_docker_calls_rejected_total',
+    'Calls to a docker daemon that failed right away, as it was unreachable',
+    ['host'])
+
+AWS_CALL_SECONDS = Histogram(
+    'plz_aws_call_duration_seconds',
+    'Calls to AWS (EC2, ECR), by service and operation',
+    ['service', 'operation'])
+AWS_CALL_ERRORS = Counter(
+    'plz_aws_call_errors_total',
+    'Calls to AWS that failed, by service and operation',
+    ['service', 'operation'])
+
+REDIS_COMMAND_SECONDS = Histogram(
+    'plz_redis_command_duration_seconds',
+    'Redis commands, by command',
+    ['command'],
+    # Most commands take less than a millisecond
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1,
+             float('inf')))
+REDIS_COMMAND_ERRORS = Counter(
+    'plz_redis_command_errors_total',
+    'Redis commands that raised an exception, by command',
+    ['command'])
+
+INSTANCES = Gauge(
+    'plz_instances',
+    'Instances by the state of their resource, as of the last harvest',
+    ['state'],
+    multiprocess_mode='mostrecent')
+HARVEST_SECONDS = Gauge(
+    'plz_harvest_duration_seconds',
+    'Duration of the last harvest',
+    multiprocess_mode='mostrecent')
+
+# States we've seen, so that we report 0 once there are no instances left in
+# them
+_instance_states = set()
+
+
+def render() -> Tuple[bytes, str]:
+    """:returns: the metrics, and their content type"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def observe_request(route: str, method: str, response: Response,
+                    start_time: float):
+    HTTP_REQUEST_SECONDS.labels(route, method, response.status_code) \
+        .observe(time.perf_counter() - start_time)
+    if response.is_streamed:
+        active_streams = HTTP_ACTIVE_STREAMS.labels(route)
+        active_streams.inc()
+        response.call_on_close(active_streams.dec)
+
+
+def record_harvest(instances_by_state: Dict[str, int], seconds: float):
+    _instance_states.update(instances_by_state.keys())
+    for state in _instance_states:
+        INSTANCES.labels(state).set(instances_by_state.get(state, 0))
+    HARVEST_SECONDS.set(seconds)
+
+
+def docker_call(function: Callable) -> Callable:
+    """Times calls of the decorated method, which uses the docker API, and
+       counts the exceptions. The operation is the qualified name of the
+       method (for instance, `Containers.run`). For generators, times until
+       the generator finishes"""
+    operation = function.__qualname__
+    seconds = DOCKER_CALL_SECONDS.labels(operation)
+    errors = DOCKER_CALL_ERRORS.labels(operation)
+
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def timed_generator(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                yield from function(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                seconds.observe(time.perf_counter() - start_time)
+        return timed_generator
+
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - start_time)
+    return timed
+
+
+def instrument_aws_client(client):
+    """Times the calls of a boto3 client, with the events botocore sends
+       around each call"""
+    events = client.meta.events
+    # Not `before-call`, which stops at the first handler with a response
+    events.register('before-parameter-build', _before_aws_call)
+    events.register('after-call', _after_aws_call)
+    # Only sent by newer versions of botocore, when the call doesn't get a
+    # response at all
+    events.register('after-call-error', _after_aws_call_error)
+    return client
+
+
+def _before_aws_call(model, context: dict, **_):
+    context['plz_operation'] = (model.service_model.service_name, model.name)
+    context['plz_start_time'] = time.perf_counter()
+
+
+def _after_aws_call(http_response, context: dict, **_):
+    if 'plz_operation' not in context:
+        return
+    operation = context['plz_operation']
+    AWS_CALL_SECONDS.labels(*operation).observe(
+        time.perf_counter() - context['plz_start_time'])
+    if http_response.status_code >= 300:
+        AWS_CALL_ERRORS.labels(*operation).inc()
+
+
+def _after_aws_call_error(context: dict, **_):
+    if 'plz_operation' in context:
+        AWS_CALL_ERRORS.labels(*context['plz_operation']).inc()
+
+
+class InstrumentedRedis(StrictRedis):
+    """Times every command (except for those in pipelines)"""
+
+    # The metrics for each command. Cheaper than looking up labels, as this
+    # is called a lot
+    _command_metrics: Dict[str, Tuple[Histogram, Counter]] = {}
+
+    def execute_command(self, *args, **options):
+        command = args[0]
+        command_metrics = self._command_metrics.get(command)
+        if command_metrics is None:
+            command_metrics = (REDIS_COMMAND_SECONDS.labels(command),
+                               REDIS_COMMAND_ERRORS.labels(command))
+            self._command_metrics[command] = command_metrics
+        seconds, errors = command_metrics
+        start_time = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - start_time)
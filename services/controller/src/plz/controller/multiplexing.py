@@ -0,0 +1,87 @@
+import queue
+import threading
+from typing import Callable, Dict, Iterator, List, Tuple, TypeVar, Union
+
+T = TypeVar('T')
+
+# How long a producer waits on a full queue before checking whether the
+# consumer is gone
+_PUT_TIMEOUT_SECONDS = 1
+
+
+class EndOfStream:
+    pass
+
+
+def multiplex(streams: Dict[str, Callable[[], Iterator[T]]],
+              max_buffered: int = 64) \
+        -> Iterator[Tuple[str, Union[T, EndOfStream, Exception]]]:
+    """Consumes several blocking iterators at the same time, and yields
+       their values as they arrive, together with the key of the stream.
+
+       After the last value of a stream, yields an `EndOfStream` for its key
+       or, if the stream failed, the exception. At most `max_buffered` values
+       are kept in memory, so slow consumers slow down the streams.
+
+       When the consumer is gone, the streams are closed, so that producers
+       waiting for a value (say, logs of an idle container) stop.
+    """
+    values = queue.Queue(maxsize=max_buffered)
+    consumer_gone = threading.Event()
+    # Streams are created by the producers, and closed by the consumer
+    opened: List[Iterator[T]] = []
+    opened_lock = threading.Lock()
+
+    def put(value) -> bool:
+        while not consumer_gone.is_set():
+            try:
+                values.put(value, timeout=_PUT_TIMEOUT_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce(key: str, stream_creator: Callable[[], Iterator[T]]):
+        # noinspection PyBroadException
+        try:
+            stream = stream_creator()
+            with opened_lock:
+                opened.append(stream)
+                if consumer_gone.is_set():
+                    _close(stream)
+                    return
+            for value in stream:
+                if not put((key, value)):
+                    return
+            put((key, EndOfStream()))
+        except Exception as e:
+            put((key, e))
+
+    for key, stream_creator in streams.items():
+        threading.Thread(
+            target=produce, args=(key, stream_creator), daemon=True).start()
+
+    try:
+        remaining = len(streams)
+        while remaining > 0:
+            key, value = values.get()
+            if isinstance(value, (EndOfStream, Exception)):
+                remaining -= 1
+            yield key, value
+    finally:
+        with opened_lock:
+            consumer_gone.set()
+            for stream in opened:
+                _close(stream)
+
+
+def _close(stream: Iterator):
+    close = getattr(stream, 'close', None)
+    if close is None:
+        return
+    try:
+        close()
+    except ValueError:
+        # Generators can't be closed while they run in another thread. They
+        # stop when they try to put their next value
+        pass
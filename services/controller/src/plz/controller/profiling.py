@@ -0,0 +1,140 @@
+import cProfile
+import collections
+import contextlib
+import marshal
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator
+
+# Profiling of a live controller, for the admin endpoints in `main`.
+#
+# Profiles cover the worker process that handles the request, for the given
+# number of seconds. They are most useful with the gevent worker class, as
+# the worker keeps serving other requests while it profiles. With sync
+# workers, only background threads (such as the harvester) do anything in the
+# meantime.
+
+MAX_SECONDS = 300
+
+# Profiling hooks and `tracemalloc` are global to the process, so there's
+# one profile at a time
+_lock = threading.Lock()
+
+
+class ProfilerBusyException(Exception):
+    pass
+
+
+def collapsed_stacks(seconds: float, interval: float = 0.01) -> str:
+    """Samples the stacks of all threads every `interval` seconds.
+
+       :returns: the stacks in the collapsed format (one line per stack,
+                 with the frames separated by `;` and the number of
+                 samples), as taken by flame graph tools"""
+    with _exclusively():
+        counts: Dict[str, int] = collections.Counter()
+        # Not an event, as events are for greenlets under gevent
+        done = []
+
+        # Under gevent, `threading` and `time.sleep` are patched to run in
+        # greenlets. The sampler needs a real thread, that runs while
+        # greenlets do
+        start_new_thread = _original('_thread', 'start_new_thread')
+        real_sleep = _original('time', 'sleep')
+
+        def sample():
+            sampler_id = _original('_thread', 'get_ident')()
+            deadline = time.monotonic() + seconds
+            try:
+                while time.monotonic() < deadline:
+                    for thread_id, frame in sys._current_frames().items():
+                        if thread_id != sampler_id:
+                            counts[_collapsed_stack(frame)] += 1
+                    real_sleep(interval)
+            finally:
+                done.append(True)
+
+        start_new_thread(sample, ())
+        # Sleeping lets other greenlets run meanwhile
+        while not done:
+            time.sleep(interval)
+        return ''.join(f'{stack} {count}\n'
+                       for stack, count in sorted(counts.items()))
+
+
+def cprofile_stats(seconds: float) -> bytes:
+    """Profiles all function calls of the thread handling the request (and,
+       with gevent, of all greenlets) with `cProfile`.
+
+       :returns: the stats, in the format of `pstats.Stats.dump_stats`"""
+    with _exclusively():
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            time.sleep(seconds)
+        finally:
+            profiler.disable()
+        profiler.create_stats()
+        return marshal.dumps(profiler.stats)
+
+
+def memory_growth(seconds: float, limit: int = 50,
+                  group_by: str = 'lineno', frames: int = 1) -> str:
+    """Compares snapshots of `tracemalloc` taken `seconds` apart.
+
+       :returns: the `limit` places that allocated the most memory still in
+                 use by the end, grouped by `lineno` or `traceback` (of
+                 `frames` frames)"""
+    with _exclusively():
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(frames)
+        try:
+            before = tracemalloc.take_snapshot()
+            time.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+        ignore_tracemalloc = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        differences = after.filter_traces(ignore_tracemalloc).compare_to(
+            before.filter_traces(ignore_tracemalloc), group_by)
+        return ''.join(_format_difference(d, group_by) + '\n'
+                       for d in differences[:limit])
+
+
+@contextlib.contextmanager
+def _exclusively():
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusyException()
+    try:
+        yield
+    finally:
+        _lock.release()
+
+
+def _original(module: str, name: str) -> Callable:
+    # Imported here, as importing gevent is slow, and workers start faster
+    # without it
+    from gevent import monkey
+    return monkey.get_original(module, name)
+
+
+def _collapsed_stack(frame) -> str:
+    return ';'.join(reversed(list(_frame_names(frame))))
+
+
+def _frame_names(frame) -> Iterator[str]:
+    while frame is not None:
+        code = frame.f_code
+        yield f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'
+        frame = frame.f_back
+
+
+def _format_difference(difference: tracemalloc.StatisticDiff,
+                       group_by: str) -> str:
+    if group_by != 'traceback':
+        return str(difference)
+    return '\n'.join([str(difference), *difference.traceback.format()])
@@ -1,10 +1,24 @@
 import json
-from typing import Set
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple, Union
 
-from redis import StrictRedis
+from redis import ResponseError, StrictRedis
 
 from plz.controller.db_storage import DBStorage
 
+log = logging.getLogger(__name__)
+
+# Redis stream (needs redis 5) with the events of all executions
+_EXECUTION_EVENTS_KEY = 'execution_events'
+# The stream is trimmed (approximately) to this number of events
+_MAX_EXECUTION_EVENTS = 100000
+# Spans of a trace are trimmed to the most recent ones (snapshots are built
+# again for each execution that uses them, all in the same trace), and
+# forgotten once none was added for a while
+_MAX_SPANS_PER_TRACE = 1000
+_SPANS_EXPIRE_SECONDS = 30 * 24 * 60 * 60
+
 
 class RedisDBStorage(DBStorage):
     def __init__(self, redis: StrictRedis):
@@ -24,11 +38,14 @@ class RedisDBStorage(DBStorage):
         return json.loads(str(start_metadata))
 
     def add_finished_execution_id(
-            self, user: str, project: str, execution_id: str):
+            self, user: str, project: str, execution_id: str,
+            finish_timestamp: int):
         self.redis.sadd(f'finished_execution_ids_for_user#{user}',
                         execution_id)
         self.redis.sadd(f'finished_execution_ids_for_project#{project}',
                         execution_id)
+        self.redis.zadd(_history_key(user, project),
+                        {execution_id: finish_timestamp})
 
     def retrieve_finished_execution_ids(
             self, user: str, project: str) -> Set[str]:
@@ -36,3 +53,157 @@ class RedisDBStorage(DBStorage):
                 for e in self.redis.sinter([
                     f'finished_execution_ids_for_user#{user}',
                     f'finished_execution_ids_for_project#{project}'])}
+
+    def retrieve_finished_execution_ids_page(
+            self, user: str, project: str, limit: Optional[int] = None,
+            before: Optional[int] = None, after: Optional[int] = None,
+            before_execution_id: Optional[str] = None,
+            after_execution_id: Optional[str] = None) -> List[str]:
+        key = _history_key(user, project)
+        max_score = _score_bound(
+            before, '+inf', inclusive=before_execution_id is not None)
+        min_score = _score_bound(
+            after, '-inf', inclusive=after_execution_id is not None)
+        # Redis sorts executions finished on the same second by ID, so with
+        # an ID the cursor is the position of that execution in the index,
+        # instead of all executions finished on that second. The ones on the
+        # other side of the cursor are skipped
+        skipped_newest = []
+        if before is not None and before_execution_id is not None:
+            cursor = before_execution_id.encode('utf-8')
+            skipped_newest = [e for e in self.redis.zrangebyscore(
+                key, before, before) if e >= cursor]
+        skipped_oldest = []
+        if after is not None and after_execution_id is not None:
+            cursor = after_execution_id.encode('utf-8')
+            skipped_oldest = [e for e in self.redis.zrangebyscore(
+                key, after, after) if e <= cursor]
+        if after is not None and before is None:
+            # The page next to the cursor is the oldest executions after it
+            entries = self.redis.zrangebyscore(
+                key, min_score, max_score,
+                **_page(len(skipped_oldest), limit))
+            entries.reverse()
+        else:
+            entries = self.redis.zrevrangebyscore(
+                key, max_score, min_score,
+                **_page(len(skipped_newest), limit))
+            # At the end of the range, so the page ends there anyway
+            entries = [e for e in entries if e not in skipped_oldest]
+        return [str(e, 'utf-8') for e in entries]
+
+    def is_history_indexed(self, user: str, project: str) -> bool:
+        return bool(self.redis.exists(_history_indexed_key(user, project)))
+
+    def mark_history_as_indexed(self, user: str, project: str) -> None:
+        self.redis.set(_history_indexed_key(user, project), 1)
+
+    def add_execution_event(self, execution_id: str, event_type: str,
+                            data: Optional[dict] = None) -> None:
+        event = {'execution_id': execution_id,
+                 'type': event_type,
+                 'timestamp': int(time.time()),
+                 **(data or {})}
+        try:
+            self.redis.execute_command(
+                'XADD', _EXECUTION_EVENTS_KEY,
+                'MAXLEN', '~', _MAX_EXECUTION_EVENTS,
+                '*', 'event', json.dumps(event))
+        except ResponseError:
+            # Events are informative only, don't stop the execution because
+            # of them (for instance, when redis is too old for streams)
+            log.exception(f'Couldn\'t add event {event}')
+
+    def add_execution_span(self, trace_id: str, span: dict) -> None:
+        key = _spans_key(trace_id)
+        pipeline = self.redis.pipeline()
+        pipeline.rpush(key, json.dumps(span))
+        pipeline.ltrim(key, -_MAX_SPANS_PER_TRACE, -1)
+        pipeline.expire(key, _SPANS_EXPIRE_SECONDS)
+        pipeline.execute()
+
+    def retrieve_execution_spans(self, trace_id: str) -> List[dict]:
+        return [json.loads(_str(s))
+                for s in self.redis.lrange(_spans_key(trace_id), 0, -1)]
+
+    def store_publication_state(self, execution_id: str, state: dict,
+                                expire_seconds: Optional[int] = None) \
+            -> None:
+        self.redis.set(_publication_state_key(execution_id),
+                       json.dumps(state), ex=expire_seconds)
+
+    def retrieve_publication_states(self, execution_ids: List[str]) \
+            -> Dict[str, dict]:
+        if len(execution_ids) == 0:
+            return {}
+        states = self.redis.mget(
+            [_publication_state_key(e) for e in execution_ids])
+        return {execution_id: json.loads(_str(state))
+                for execution_id, state in zip(execution_ids, states)
+                if state is not None}
+
+    def get_last_execution_event_id(self) -> str:
+        last_entries = self.redis.execute_command(
+            'XREVRANGE', _EXECUTION_EVENTS_KEY, '+', '-', 'COUNT', 1)
+        if len(last_entries) == 0:
+            return '0-0'
+        return _str(last_entries[0][0])
+
+    def retrieve_execution_events(
+            self, after_event_id: str, count: int,
+            block_milliseconds: int) -> List[Tuple[str, dict]]:
+        response = self.redis.execute_command(
+            'XREAD', 'COUNT', count, 'BLOCK', block_milliseconds,
+            'STREAMS', _EXECUTION_EVENTS_KEY, after_event_id)
+        if not response:
+            # Timed out
+            return []
+        [(_, entries)] = response
+        return [(_str(event_id), json.loads(_str(_field(fields, b'event'))))
+                for event_id, fields in entries]
+
+
+def _history_key(user: str, project: str) -> str:
+    # Sorted set, with the finish timestamps as scores
+    return f'finished_execution_ids_for_user_and_project#{user}#{project}'
+
+
+def _page(start: int, limit: Optional[int]) -> dict:
+    """Arguments of a redis range command for `limit` entries from
+       `start`"""
+    if limit is None and start == 0:
+        return {}
+    # A negative number means all the rest
+    return {'start': start, 'num': limit if limit is not None else -1}
+
+
+def _score_bound(score: Optional[int], unbounded: str, inclusive: bool) \
+        -> Union[int, str]:
+    if score is None:
+        return unbounded
+    # Parenthesis means exclusive in redis intervals
+    return score if inclusive else f'({score}'
+
+
+def _history_indexed_key(user: str, project: str) -> str:
+    return f'history_indexed_for_user_and_project#{user}#{project}'
+
+
+def _spans_key(trace_id: str) -> str:
+    return f'execution_spans#{trace_id}'
+
+
+def _publication_state_key(execution_id: str) -> str:
+    return f'publication_state#{execution_id}'
+
+
+def _str(b: Union[bytes, str]) -> str:
+    return b if isinstance(b, str) else str(b, 'utf-8')
+
+
+def _field(fields: Union[list, dict], name: bytes) -> bytes:
+    # Older clients return the fields of stream entries as a flat list of
+    # names and values, newer ones as a dict
+    if isinstance(fields, dict):
+        return fields[name]
+    return fields[fields.index(name) + 1]
@@ -1,2 +1,4 @@
+from .deduplicating import DeduplicatingResultsStorage  # noqa: F401 (unused)
 from .local import LocalResultsStorage  # noqa: F401 (unused)
 from .results_base import ResultsStorage  # noqa: F401 (unused)
+from .s3 import S3ResultsStorage  # noqa: F401 (unused)
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import logging
+import os
+import tarfile
+from typing import Callable, Collection, Iterator, Optional, Tuple
+
+from redis import StrictRedis
+
+from plz.controller.api.iterator_reader import IteratorReader
+from plz.controller.db_storage import DBStorage
+from plz.controller.results import tar_members
+from plz.controller.results.local import CHUNK_SIZE, LocalResults, \
+    LocalResultsStorage, Paths, read_bytes
+from plz.controller.results.results_base import Results, ResultsFile
+
+log = logging.getLogger(__name__)
+
+# Blobs of all executions, by hash, in the results directory
+BLOBS_DIRECTORY = '.blobs'
+# Version of the manifest of the output
+MANIFEST_VERSION = 1
+
+_TAR_FORMAT = tarfile.PAX_FORMAT
+_TAR_ENCODING = 'utf-8'
+_TAR_ERRORS = 'surrogateescape'
+
+
+class DeduplicatingResultsStorage(LocalResultsStorage):
+    """Local results, where the files of the outputs are stored once.
+
+       Outputs are split into a blob per file, addressed by the hash of its
+       contents, and a manifest with the headers of the tarball. Blobs are
+       stored in `.blobs` of the results directory, and hard-linked into the
+       directories of the executions using them, so that the link count of
+       a blob is its reference count. Tarballs are rebuilt when read.
+
+       Removing the results of an execution releases its blobs. Blobs no
+       longer used are removed by `collect_garbage`.
+
+       Blobs are stored as they are. Logs and measures are compressed with
+       `compression_encoding`, as in `LocalResultsStorage`."""
+
+    def __init__(self,
+                 redis: StrictRedis,
+                 db_storage: DBStorage,
+                 directory: str,
+                 finished_results_cache_size: int = 1000,
+                 compression_encoding: Optional[str] = None,
+                 garbage_collection_interval_seconds: int = 3600):
+        super().__init__(
+            redis, db_storage, directory, finished_results_cache_size,
+            compression_encoding)
+        self.blobs_directory = os.path.join(directory, BLOBS_DIRECTORY)
+        self.garbage_collection_interval_seconds = \
+            garbage_collection_interval_seconds
+
+    def _write_output(self, paths: Paths, output_tarball: Iterator[bytes]):
+        os.makedirs(_blobs_directory_of(paths))
+        members = []
+        tar = tarfile.open(
+            fileobj=IteratorReader(output_tarball), mode='r|*',
+            bufsize=CHUNK_SIZE)
+        for tarinfo in tar:
+            blob = None
+            if tarinfo.isfile():
+                blob = self._write_blob(paths, tar.extractfile(tarinfo))
+            members.append({**_tarinfo_to_dict(tarinfo), 'blob': blob})
+        with open(_manifest_path_of(paths), 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'members': members}, f)
+
+    def _results_from(self, paths: Paths) -> Results:
+        # Results published before deduplicating have a tarball instead
+        if os.path.exists(_manifest_path_of(paths)):
+            return DeduplicatedResults(paths)
+        return super()._results_from(paths)
+
+    def _write_blob(self, paths: Paths, contents) -> str:
+        blobs_directory = _blobs_directory_of(paths)
+        temporary_path = os.path.join(blobs_directory, '.tmp')
+        file_hash = hashlib.sha256()
+        with open(temporary_path, 'wb') as f:
+            while True:
+                chunk = contents.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                file_hash.update(chunk)
+                f.write(chunk)
+        blob = file_hash.hexdigest()
+        path = os.path.join(blobs_directory, blob)
+        if os.path.exists(path):
+            # The output has the same file twice
+            os.remove(temporary_path)
+        else:
+            os.rename(temporary_path, path)
+            self._share_blob(blob, path)
+        return blob
+
+    def _share_blob(self, blob: str, path: str):
+        """Replaces the blob at `path` with the stored one, or stores it if
+           there isn't one"""
+        stored_path = self._stored_blob_path(blob)
+        os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+        while True:
+            if os.path.exists(stored_path):
+                linked_path = path + '.tmp'
+                try:
+                    os.link(stored_path, linked_path)
+                except FileNotFoundError:
+                    # Removed by the garbage collection in the meantime
+                    continue
+                os.replace(linked_path, path)
+                return
+            try:
+                os.link(path, stored_path)
+                return
+            except FileExistsError:
+                # Stored by another publication in the meantime
+                continue
+
+    def _stored_blob_path(self, blob: str) -> str:
+        return os.path.join(self.blobs_directory, blob[:2], blob)
+
+    def collect_garbage(self) -> None:
+        # Every so often, in one worker only
+        if not self.redis.set(
+                f'{__name__}.{self.__class__.__name__}:collected', 1,
+                nx=True, ex=self.garbage_collection_interval_seconds):
+            return
+        blobs, size = self.remove_unused_blobs()
+        if blobs > 0:
+            log.info(f'Removed {blobs} unused blobs ({size} bytes)')
+
+    def remove_unused_blobs(self) -> Tuple[int, int]:
+        """Removes the blobs that no execution links to.
+
+           :returns: the number of blobs removed, and their size"""
+        blobs = 0
+        size = 0
+        if not os.path.isdir(self.blobs_directory):
+            return blobs, size
+        for prefix in os.listdir(self.blobs_directory):
+            prefix_directory = os.path.join(self.blobs_directory, prefix)
+            for blob in os.listdir(prefix_directory):
+                path = os.path.join(prefix_directory, blob)
+                stat = os.stat(path)
+                # If a publication links to it right now, it keeps its link,
+                # and stores the blob again next time
+                if stat.st_nlink == 1:
+                    os.remove(path)
+                    blobs += 1
+                    size += stat.st_size
+        return blobs, size
+
+
+class DeduplicatedResults(LocalResults):
+    def get_output_files_tarball(self) -> Iterator[bytes]:
+        return tar_members.ending_tarball(
+            self._members_of_tarball(lambda name: True))
+
+    def get_output_files_members(
+            self, paths: Collection[str], globs: Collection[str]) \
+            -> Iterator[bytes]:
+        return tar_members.ending_tarball(self._members_of_tarball(
+            lambda name: tar_members.is_selected(name, paths, globs)))
+
+    def _members_of_tarball(self, is_selected: Callable[[str], bool]) \
+            -> Iterator[bytes]:
+        with open(_manifest_path_of(self.paths)) as f:
+            members = json.load(f)['members']
+        blobs_directory = _blobs_directory_of(self.paths)
+        for member in members:
+            if not is_selected(member['name']):
+                continue
+            tarinfo = _tarinfo_from_dict(member)
+            yield tarinfo.tobuf(_TAR_FORMAT, _TAR_ENCODING, _TAR_ERRORS)
+            if member['blob'] is not None:
+                yield from read_bytes(
+                    os.path.join(blobs_directory, member['blob']))
+                yield bytes(-tarinfo.size % tarfile.BLOCKSIZE)
+
+    def get_output_files_tarball_file(
+            self, encodings: Collection[str] = ()) -> Optional[ResultsFile]:
+        # There's no tarball
+        return None
+
+
+def _manifest_path_of(paths: Paths) -> str:
+    return os.path.join(paths.directory, 'output.manifest.json')
+
+
+def _blobs_directory_of(paths: Paths) -> str:
+    return os.path.join(paths.directory, 'blobs')
+
+
+def _tarinfo_to_dict(tarinfo: tarfile.TarInfo) -> dict:
+    return {
+        'name': tarinfo.name,
+        # Contents of files are in blobs, whatever the type of file was
+        'type': (tarfile.REGTYPE if tarinfo.isfile()
+                 else tarinfo.type).decode('ascii'),
+        'size': tarinfo.size if tarinfo.isfile() else 0,
+        'mode': tarinfo.mode,
+        'mtime': tarinfo.mtime,
+        'uid': tarinfo.uid,
+        'gid': tarinfo.gid,
+        'uname': tarinfo.uname,
+        'gname': tarinfo.gname,
+        'linkname': tarinfo.linkname,
+        'devmajor': tarinfo.devmajor,
+        'devminor': tarinfo.devminor,
+    }
+
+
+def _tarinfo_from_dict(member: dict) -> tarfile.TarInfo:
+    tarinfo = tarfile.TarInfo(member['name'])
+    for key in ['size', 'mode', 'mtime', 'uid', 'gid', 'uname', 'gname',
+                'linkname', 'devmajor', 'devminor']:
+        setattr(tarinfo, key, member[key])
+    tarinfo.type = member['type'].encode('ascii')
+    return tarinfo
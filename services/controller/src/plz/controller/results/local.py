@@ -1,32 +1,57 @@
+import collections
+import contextlib
 import json
+import logging
 import os
 import shutil
-from typing import Any, ContextManager, Iterator, Optional
+import tarfile
+import tempfile
+import threading
+from typing import Any, Callable, Collection, ContextManager, Dict, \
+    Iterator, List, Optional, Tuple
 
 from redis import StrictRedis
-from redis.lock import Lock
 
+from plz.controller import compression, tracing
+from plz.controller.api.iterator_reader import IteratorReader
 from plz.controller.arbitrary_object_json_encoder import dumps_arbitrary_json
 from plz.controller.db_storage import DBStorage
-from plz.controller.api.exceptions import AbortedExecutionException
-from plz.controller.execution_metadata import compile_metadata_for_storage
+from plz.controller.execution_metadata import MEASURES_FORMAT_VERSION, \
+    compile_metadata_for_storage, convert_measures_file_to_dict
+from plz.controller.results import streams, tar_members
 from plz.controller.results.results_base import InstanceStatus, \
     InstanceStatusFailure, InstanceStatusSuccess, Results, ResultsContext, \
-    ResultsStorage
+    ResultsFile, ResultsLock, ResultsStorage, Tombstone
+
+log = logging.getLogger(__name__)
 
 LOCK_TIMEOUT = 60  # 1 minute
 CHUNK_SIZE = 1024 * 1024  # 1 MB
+# Results are written here, and moved to their directory once complete
+STAGING_DIRECTORY = '.staging'
 
 
 class LocalResultsStorage(ResultsStorage):
     def __init__(self,
                  redis: StrictRedis,
                  db_storage: DBStorage,
-                 directory: str):
+                 directory: str,
+                 finished_results_cache_size: int = 1000,
+                 compression_encoding: Optional[str] = None):
+        """:param compression_encoding: how to compress logs and tarballs
+                                        when storing them (`gzip` or
+                                        `zstd`), if at all"""
         super().__init__(db_storage)
         self.redis = redis
         self.db_storage = db_storage
         self.directory = directory
+        if compression_encoding is not None:
+            # Fail now if it's not supported
+            compression.create_compressor(compression_encoding)
+        self.compression_encoding = compression_encoding
+        # Finished results never change, so we keep them (with their status
+        # and metadata once read) for the executions read most recently
+        self._finished_results = LRUCache(finished_results_cache_size)
 
     def publish(self,
                 execution_id: str,
@@ -36,126 +61,229 @@ class LocalResultsStorage(ResultsStorage):
                 measures_tarball: Iterator[bytes],
                 finish_timestamp: int):
         paths = Paths(self.directory, execution_id)
-        with self._lock(execution_id):
+        with self._lock(execution_id) as lock, \
+                tracing.span(execution_id, 'results.publish') as span:
             if os.path.exists(paths.finished_file):
                 return
 
-            _force_mk_empty_dir(paths.directory)
+            staging_paths = self._staging_paths(execution_id)
+            _force_mk_empty_dir(staging_paths.directory)
 
-            with open(paths.exit_status, 'w') as f:
+            with open(staging_paths.exit_status, 'w') as f:
                 print(exit_status, file=f)
 
-            write_bytes(paths.logs, logs)
-            write_bytes(paths.output, output_tarball)
-            write_bytes(paths.measures, measures_tarball)
+            _, stream_metrics = streams.collect_concurrently({
+                'logs': (lock.kept_alive(logs), lambda chunks: self._write(
+                    staging_paths.logs, chunks)),
+                'output': (lock.kept_alive(output_tarball),
+                           lambda chunks: self._write_output(
+                               staging_paths, chunks)),
+                'measures': (lock.kept_alive(measures_tarball),
+                             lambda chunks: self._write(
+                                 staging_paths.measures, chunks)),
+            })
+            span['attributes'].update(streams.span_attributes(stream_metrics))
+            try:
+                _materialize_measures(staging_paths)
+            except (tarfile.TarError, OSError):
+                # Then it's converted when read, and fails then
+                log.exception(
+                    f'Couldn\'t convert the measures of {execution_id}')
             metadata = compile_metadata_for_storage(
-                self.db_storage, execution_id, finish_timestamp)
-            with open(paths.metadata, 'w') as metadata_file:
+                self.db_storage, execution_id, finish_timestamp,
+                stream_metrics)
+            with open(staging_paths.metadata, 'w') as metadata_file:
                 json.dump(metadata, metadata_file)
-            with open(paths.finished_file, 'w') as _:  # noqa: F841 (unused)
-                pass
+            # Unless someone else took the lock meanwhile
+            lock.renew(force=True)
+            _move_into_place(staging_paths, paths)
             self.db_storage.add_finished_execution_id(
                 user=metadata['user'], project=metadata['project'],
-                execution_id=execution_id)
+                execution_id=execution_id,
+                finish_timestamp=finish_timestamp)
+        self.db_storage.add_execution_event(
+            execution_id, 'published',
+            {'exit_status': exit_status, 'finish_timestamp': finish_timestamp})
 
     def write_tombstone(self, execution_id: str, tombstone: object) -> None:
         paths = Paths(self.directory, execution_id)
         with self._lock(execution_id):
             if os.path.exists(paths.finished_file):
                 return
-            _force_mk_empty_dir(paths.directory)
+            staging_paths = self._staging_paths(execution_id)
+            _force_mk_empty_dir(staging_paths.directory)
             tombstone_json = dumps_arbitrary_json(tombstone)
-            with open(paths.tombstone_file, 'w') as tombstone_file:
+            with open(staging_paths.tombstone_file, 'w') as tombstone_file:
                 tombstone_file.write(tombstone_json)
-            with open(paths.finished_file, 'w') as _:  # noqa: F841 (unused)
-                pass
+            _move_into_place(staging_paths, paths)
+        self.db_storage.add_execution_event(execution_id, 'tombstoned')
 
     def get(self, execution_id: str) -> ContextManager[Optional[Results]]:
-        paths = Paths(self.directory, execution_id)
-        return LocalResultsContext(paths, self._lock(execution_id))
+        # Results appear all at once (see `_move_into_place`), and don't
+        # change after that, so there's no need to lock to read them
+        return LocalResultsContext(self._get_finished(execution_id))
 
     def _lock(self, execution_id: str):
         lock_name = f'lock:{__name__}.{self.__class__.__name__}:{execution_id}'
-        lock = self.redis.lock(lock_name, timeout=LOCK_TIMEOUT)
-        return lock
+        return ResultsLock(self.redis, lock_name, timeout=LOCK_TIMEOUT)
 
     def is_finished(self, execution_id: str):
+        return self._get_finished(execution_id) is not None
+
+    def _get_finished(self, execution_id: str) -> Optional[Results]:
+        results = self._finished_results.get(execution_id)
+        if results is not None:
+            return results
         paths = Paths(self.directory, execution_id)
-        return os.path.exists(paths.finished_file)
+        if not os.path.exists(paths.finished_file):
+            return None
+        if os.path.exists(paths.tombstone_file):
+            results = LocalTombstone(paths)
+        else:
+            results = self._results_from(paths)
+        self._finished_results.put(execution_id, results)
+        return results
+
+    def _write_output(self, paths: 'Paths', output_tarball: Iterator[bytes]):
+        # Indexed as it's written, so that members can be read on their own
+        with self._open_for_writing(paths.output) as write:
+            index = tar_members.index_members(
+                write_through(output_tarball, write))
+        if index is not None:
+            with open(paths.output_index, 'w') as f:
+                json.dump({'version': tar_members.INDEX_VERSION,
+                           'members': index}, f, separators=(',', ':'))
+
+    def _write(self, path: str, chunks: Iterator[bytes]):
+        with self._open_for_writing(path) as write:
+            for chunk in chunks:
+                write(chunk)
+
+    @contextlib.contextmanager
+    def _open_for_writing(self, path: str) \
+            -> Iterator[Callable[[bytes], Any]]:
+        """Yields a function writing to the file, compressing if needed"""
+        if self.compression_encoding is None:
+            with open(path, 'wb') as f:
+                yield f.write
+            return
+        compressor = compression.create_compressor(
+            self.compression_encoding, flush=False)
+        suffix = compression.FILE_SUFFIXES[self.compression_encoding]
+        with open(path + suffix, 'wb') as f:
+            yield lambda chunk: f.write(compressor.compress(chunk))
+            f.write(compressor.finish())
+
+    def _results_from(self, paths: 'Paths') -> Results:
+        return LocalResults(paths)
+
+    def _staging_paths(self, execution_id: str) -> 'Paths':
+        return Paths(os.path.join(self.directory, STAGING_DIRECTORY),
+                     execution_id)
 
 
 class LocalResultsContext(ResultsContext):
-    def __init__(self, paths: 'Paths', lock: Lock):
-        self.paths = paths
-        self.lock = lock
+    def __init__(self, results: Optional[Results]):
+        self.results = results
 
     def __enter__(self):
-        self.lock.acquire()
-        if os.path.exists(self.paths.finished_file):
-            if os.path.exists(self.paths.tombstone_file):
-                return LocalTombstone(self.paths)
-            else:
-                return LocalResults(self.paths)
-        else:
-            return None
+        return self.results
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.lock.release()
+        pass
 
 
 class LocalResults(Results):
     def __init__(self, paths: 'Paths'):
         self.paths = paths
+        # Read once, as they don't change
+        self._status: Optional[InstanceStatus] = None
+        self._stored_metadata: Optional[dict] = None
+        self._measures: Optional[dict] = None
+        self._output_index: Optional[List[dict]] = None
 
     def get_status(self) -> InstanceStatus:
-        with open(self.paths.exit_status) as f:
-            status = int(f.read())
-        if status == 0:
-            return InstanceStatusSuccess()
-        else:
-            return InstanceStatusFailure(status)
+        if self._status is None:
+            with open(self.paths.exit_status) as f:
+                status = int(f.read())
+            if status == 0:
+                self._status = InstanceStatusSuccess()
+            else:
+                self._status = InstanceStatusFailure(status)
+        return self._status
 
     def get_logs(self, since: Optional[int] = None, stdout: bool = True,
                  stderr: bool = True) -> Iterator[bytes]:
-        return read_bytes(self.paths.logs)
+        return _read_stored(self.paths.logs)
 
     def get_output_files_tarball(self) -> Iterator[bytes]:
-        return read_bytes(self.paths.output)
+        return _read_stored(self.paths.output)
+
+    def get_output_files_members(
+            self, paths: Collection[str], globs: Collection[str]) \
+            -> Iterator[bytes]:
+        index = self._get_output_index()
+        if index is None:
+            return super().get_output_files_members(paths, globs)
+        ranges = [tar_members.member_range(member) for member in index
+                  if tar_members.is_selected(member['name'], paths, globs)]
+        stored_path, encoding = _stored_file(self.paths.output)
+        if encoding is None:
+            members = tar_members.read_ranges(stored_path, ranges, CHUNK_SIZE)
+        else:
+            members = tar_members.ranges_of_stream(
+                _read_stored(self.paths.output), ranges)
+        return tar_members.ending_tarball(members)
 
     def get_measures_files_tarball(self) -> Iterator[bytes]:
-        return read_bytes(self.paths.measures)
+        return _read_stored(self.paths.measures)
 
     def get_stored_metadata(self) -> dict:
-        with open(self.paths.metadata, 'r') as metadata_file:
-            return json.load(metadata_file)
-
-
-class LocalTombstone(Results):
+        if self._stored_metadata is None:
+            with open(self.paths.metadata, 'r') as metadata_file:
+                self._stored_metadata = json.load(metadata_file)
+        # A copy, as callers add to it
+        return dict(self._stored_metadata)
+
+    def get_measures(self) -> dict:
+        if self._measures is None:
+            self._measures = _read_materialized_measures(self.paths)
+        if self._measures is None:
+            # Published before measures were materialized, or materialized
+            # by another version
+            self._measures = _materialize_measures(self.paths)
+        return self._measures
+
+    def _get_output_index(self) -> Optional[List[dict]]:
+        if self._output_index is None:
+            try:
+                with open(self.paths.output_index) as f:
+                    index = json.load(f)
+            except FileNotFoundError:
+                # Published before indexing, or the output isn't a tarball
+                return None
+            if index['version'] != tar_members.INDEX_VERSION:
+                return None
+            self._output_index = index['members']
+        return self._output_index
+
+    def get_logs_file(self, encodings: Collection[str] = ()) \
+            -> Optional[ResultsFile]:
+        return _results_file(self.paths.logs, encodings)
+
+    def get_output_files_tarball_file(
+            self, encodings: Collection[str] = ()) -> Optional[ResultsFile]:
+        return _results_file(self.paths.output, encodings)
+
+
+class LocalTombstone(Tombstone):
     def __init__(self, paths: 'Paths'):
+        super().__init__()
         self.paths = paths
 
-    def _raise_aborted(self) -> Any:
+    def _read_tombstone(self) -> object:
         with open(self.paths.tombstone_file, 'r') as tombstone:
-            tombstone_object = json.load(tombstone)
-        raise AbortedExecutionException(tombstone_object)
-
-    def get_status(self) -> InstanceStatus:
-        return self._raise_aborted()
-
-    def get_logs(self, since: Optional[int] = None, stdout: bool = True,
-                 stderr: bool = True) -> Iterator[bytes]:
-        # In the future we might, for instance, store partial logs from the
-        # workers. For now, a tombstone just raises exceptions
-        return self._raise_aborted()
-
-    def get_output_files_tarball(self) -> Iterator[bytes]:
-        return self._raise_aborted()
-
-    def get_measures_files_tarball(self) -> Iterator[bytes]:
-        return self._raise_aborted()
-
-    def get_stored_metadata(self) -> dict:
-        return self._raise_aborted()
+            return json.load(tombstone)
 
 
 class Paths:
@@ -169,7 +297,12 @@ class Paths:
         self.exit_status = os.path.join(self.directory, 'status')
         self.logs = os.path.join(self.directory, 'logs')
         self.output = os.path.join(self.directory, 'output.tar')
+        # Where each member of the output tarball is
+        self.output_index = os.path.join(self.directory, 'output.index.json')
         self.measures = os.path.join(self.directory, 'measures.tar')
+        # The measures from the tarball, as a dict
+        self.materialized_measures = os.path.join(
+            self.directory, 'measures.json')
         self.metadata = os.path.join(self.directory, 'metadata.json')
 
 
@@ -182,10 +315,110 @@ def read_bytes(path: str) -> Iterator[bytes]:
             yield chunk
 
 
-def write_bytes(path: str, chunks: Iterator[bytes]):
-    with open(path, 'wb') as f:
-        for chunk in chunks:
-            f.write(chunk)
+def write_through(chunks: Iterator[bytes], write: Callable[[bytes], Any]) \
+        -> Iterator[bytes]:
+    for chunk in chunks:
+        write(chunk)
+        yield chunk
+
+
+def _stored_file(path: str) -> Tuple[str, Optional[str]]:
+    """The file with the contents of `path` (maybe compressed), and the
+       encoding it's compressed with"""
+    for encoding, suffix in compression.FILE_SUFFIXES.items():
+        if os.path.exists(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+def _read_stored(path: str) -> Iterator[bytes]:
+    stored_path, encoding = _stored_file(path)
+    if encoding is None:
+        return read_bytes(stored_path)
+    return compression.decompress_chunks(read_bytes(stored_path), encoding)
+
+
+def _results_file(path: str, encodings: Collection[str]) \
+        -> Optional[ResultsFile]:
+    stored_path, encoding = _stored_file(path)
+    if encoding is not None and encoding not in encodings:
+        # It has to be decompressed
+        return None
+    return ResultsFile(os.path.abspath(stored_path), encoding)
+
+
+def _materialize_measures(paths: Paths) -> dict:
+    """Converts the measures tarball to a dict once and for all, and stores
+       it next to the tarball"""
+    measures = convert_measures_file_to_dict(
+        IteratorReader(_read_stored(paths.measures)))
+    try:
+        _write_atomically(
+            paths.materialized_measures,
+            json.dumps({'version': MEASURES_FORMAT_VERSION,
+                        'measures': measures}, separators=(',', ':')))
+    except OSError:
+        # Measures can still be read from the tarball
+        log.exception(f'Couldn\'t store the measures of {paths.directory}')
+    return measures
+
+
+def _write_atomically(path: str, content: str):
+    # Written with another name and then renamed, so that readers never see
+    # part of it
+    fd, temporary_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix='.tmp.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.replace(temporary_path, path)
+    except OSError:
+        os.remove(temporary_path)
+        raise
+
+
+def _read_materialized_measures(paths: Paths) -> Optional[dict]:
+    try:
+        with open(paths.materialized_measures) as f:
+            materialized_measures = json.load(f)
+    except FileNotFoundError:
+        return None
+    if materialized_measures.get('version') != MEASURES_FORMAT_VERSION:
+        return None
+    return materialized_measures['measures']
+
+
+def _move_into_place(staging_paths: Paths, paths: Paths):
+    """Moves complete results from the staging directory to theirs. Readers
+       see the results, with the finished file, all at once"""
+    with open(staging_paths.finished_file, 'w') as _:  # noqa: F841 (unused)
+        pass
+    # Left by publishing that didn't finish, when results were written in
+    # place
+    if os.path.exists(paths.directory):
+        shutil.rmtree(paths.directory)
+    os.rename(staging_paths.directory, paths.directory)
+
+
+class LRUCache:
+    def __init__(self, size: int):
+        self.size = size
+        self.entries: Dict[str, Any] = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
 
 
 def _force_mk_empty_dir(directory: str):
@@ -1,11 +1,23 @@
+import collections
 import logging
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import ContextManager, Iterator, Optional
+from typing import Any, Collection, ContextManager, Iterator, Optional
 
+from redis import StrictRedis
+
+from plz.controller.api.exceptions import AbortedExecutionException
 from plz.controller.db_storage import DBStorage
+from plz.controller.execution_metadata import convert_measures_to_dict
+from plz.controller.results import tar_members
 
 log = logging.getLogger(__name__)
 
+# A local file with results, and the content encoding it's compressed with
+# (or None)
+ResultsFile = collections.namedtuple('ResultsFile', ['path', 'encoding'])
+
 
 class ResultsStorage(ABC):
     def __init__(self, db_storage: DBStorage):
@@ -33,6 +45,11 @@ class ResultsStorage(ABC):
     def is_finished(self, execution_id: str):
         pass
 
+    def collect_garbage(self) -> None:
+        """Removes what results no longer use, if the storage keeps anything
+           apart from the results of each execution"""
+        pass
+
 
 class Results(ABC):
     @abstractmethod
@@ -48,6 +65,15 @@ class Results(ABC):
     def get_output_files_tarball(self) -> Iterator[bytes]:
         pass
 
+    def get_output_files_members(
+            self, paths: Collection[str], globs: Collection[str]) \
+            -> Iterator[bytes]:
+        """A tarball with the members of the output in `paths` (or in them,
+           for directories), or matching `globs`. Paths are relative to the
+           output directory"""
+        return tar_members.ending_tarball(tar_members.select_from_stream(
+            self.get_output_files_tarball(), paths, globs))
+
     @abstractmethod
     def get_measures_files_tarball(self) -> Iterator[bytes]:
         pass
@@ -56,6 +82,74 @@ class Results(ABC):
     def get_stored_metadata(self) -> dict:
         pass
 
+    def get_measures(self) -> dict:
+        """The measures as a dict (see `convert_measures_to_dict`). Callers
+           must not modify it"""
+        return convert_measures_to_dict(self.get_measures_files_tarball())
+
+    def get_logs_file(self, encodings: Collection[str] = ()) \
+            -> Optional[ResultsFile]:
+        """Local file with all the logs, if there's one, stored as they are
+           or compressed with one of `encodings`. The server can send it
+           without reading it in Python"""
+        return None
+
+    def get_output_files_tarball_file(
+            self, encodings: Collection[str] = ()) -> Optional[ResultsFile]:
+        """Same as `get_logs_file`, for the output tarball"""
+        return None
+
+
+class Tombstone(Results):
+    """Results of an execution that was aborted, which raise
+       `AbortedExecutionException` with the tombstone object"""
+
+    def __init__(self):
+        self._tombstone_object = None
+
+    @abstractmethod
+    def _read_tombstone(self) -> object:
+        pass
+
+    def _raise_aborted(self) -> Any:
+        if self._tombstone_object is None:
+            self._tombstone_object = self._read_tombstone()
+        raise AbortedExecutionException(self._tombstone_object)
+
+    def get_status(self) -> 'InstanceStatus':
+        return self._raise_aborted()
+
+    def get_logs(self, since: Optional[int] = None, stdout: bool = True,
+                 stderr: bool = True) -> Iterator[bytes]:
+        # In the future we might, for instance, store partial logs from the
+        # workers. For now, a tombstone just raises exceptions
+        return self._raise_aborted()
+
+    def get_output_files_tarball(self) -> Iterator[bytes]:
+        return self._raise_aborted()
+
+    def get_output_files_members(
+            self, paths: Collection[str], globs: Collection[str]) \
+            -> Iterator[bytes]:
+        return self._raise_aborted()
+
+    def get_measures_files_tarball(self) -> Iterator[bytes]:
+        return self._raise_aborted()
+
+    def get_measures(self) -> dict:
+        return self._raise_aborted()
+
+    def get_stored_metadata(self) -> dict:
+        return self._raise_aborted()
+
+    def get_logs_file(self, encodings: Collection[str] = ()) \
+            -> Optional[ResultsFile]:
+        return self._raise_aborted()
+
+    def get_output_files_tarball_file(
+            self, encodings: Collection[str] = ()) -> Optional[ResultsFile]:
+        return self._raise_aborted()
+
 
 class InstanceStatus(ABC):
     def __init__(self,
@@ -94,5 +188,43 @@ class InstanceStatusFailure(InstanceStatus):
 ResultsContext = ContextManager[Optional[Results]]
 
 
+class ResultsLock(ContextManager):
+    """Lock of the results of an execution, while they're written.
+
+       Publishing can take longer than the timeout of the lock, so it's
+       renewed as chunks go through `kept_alive`. If the lock was lost
+       anyway (as no chunks arrived for the whole timeout), renewing fails,
+       so that publishing stops instead of writing over whoever took it"""
+
+    def __init__(self, redis: StrictRedis, name: str, timeout: int):
+        # Not local to the thread, as chunks are read in other threads
+        self.lock = redis.lock(name, timeout=timeout, thread_local=False)
+        self.timeout = timeout
+        self._renewed_at = None
+        self._renewing = threading.Lock()
+
+    def __enter__(self):
+        self.lock.acquire()
+        self._renewed_at = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.lock.release()
+
+    def renew(self, force: bool = False):
+        """:param force: renew even if it was renewed recently"""
+        with self._renewing:
+            if not force and \
+                    time.time() - self._renewed_at < self.timeout / 4:
+                return
+            self.lock.reacquire()
+            self._renewed_at = time.time()
+
+    def kept_alive(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            self.renew()
+            yield chunk
+
+
 class CouldNotGetOutputException(Exception):
     pass
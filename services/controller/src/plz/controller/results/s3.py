@@ -0,0 +1,433 @@
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import json
+import logging
+import tarfile
+import threading
+from typing import Any, Callable, Collection, ContextManager, Iterator, \
+    List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+from redis import StrictRedis
+
+from plz.controller import tracing
+from plz.controller.api.iterator_reader import IteratorReader
+from plz.controller.arbitrary_object_json_encoder import dumps_arbitrary_json
+from plz.controller.db_storage import DBStorage
+from plz.controller.execution_metadata import MEASURES_FORMAT_VERSION, \
+    compile_metadata_for_storage, convert_measures_file_to_dict
+from plz.controller.results import streams, tar_members
+from plz.controller.results.local import LOCK_TIMEOUT, LRUCache, \
+    LocalResultsContext, Paths, write_through
+from plz.controller.results.results_base import InstanceStatus, \
+    InstanceStatusFailure, InstanceStatusSuccess, Results, ResultsLock, \
+    ResultsStorage, Tombstone
+
+log = logging.getLogger(__name__)
+
+# S3 doesn't take smaller parts in multipart uploads, except for the last
+MIN_PART_SIZE = 5 * 1024 * 1024  # 5 MB
+DEFAULT_PART_SIZE = 8 * 1024 * 1024  # 8 MB
+
+_MISSING_OBJECT_ERROR_CODES = {'404', 'NoSuchKey', 'NotFound'}
+
+
+class S3ResultsStorage(ResultsStorage):
+    """Results in an S3 bucket, with the same objects as the files of
+       `LocalResultsStorage`, under `<prefix>/<execution_id>/`.
+
+       Logs and tarballs are uploaded as they arrive, in parts uploaded
+       concurrently, and read with concurrent ranged requests, so that
+       transfers aren't limited by the latency of each request. At most
+       `max_concurrency` parts per transfer are in memory.
+
+       As in `LocalResultsStorage`, the `.finished` object is uploaded last,
+       so that results without it are ignored (and overwritten when
+       publishing again)."""
+
+    def __init__(self,
+                 redis: StrictRedis,
+                 db_storage: DBStorage,
+                 client,
+                 bucket: str,
+                 prefix: str = '',
+                 part_size: int = DEFAULT_PART_SIZE,
+                 max_concurrency: int = 8,
+                 finished_results_cache_size: int = 1000):
+        """:param client: a boto3 S3 client, allowing for `max_concurrency`
+                          connections per transfer"""
+        super().__init__(db_storage)
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(
+                f'Parts must have at least {MIN_PART_SIZE} bytes')
+        self.redis = redis
+        self.db_storage = db_storage
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self._transfers = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix='s3-results')
+        # Finished results never change, as in `LocalResultsStorage`
+        self._finished_results = LRUCache(finished_results_cache_size)
+
+    def publish(self,
+                execution_id: str,
+                exit_status: int,
+                logs: Iterator[bytes],
+                output_tarball: Iterator[bytes],
+                measures_tarball: Iterator[bytes],
+                finish_timestamp: int):
+        keys = Paths(self.prefix, execution_id)
+        with self._lock(execution_id) as lock, \
+                tracing.span(execution_id, 'results.publish') as span:
+            if self._exists(keys.finished_file):
+                return
+
+            self._put(keys.exit_status, f'{exit_status}\n'.encode('ascii'))
+            collected, stream_metrics = streams.collect_concurrently({
+                'logs': (lock.kept_alive(logs), lambda chunks: self._upload(
+                    keys.logs, chunks)),
+                'output': (lock.kept_alive(output_tarball),
+                           lambda chunks: self._upload(
+                               keys.output, chunks,
+                               tar_members.index_members)),
+                'measures': (lock.kept_alive(measures_tarball),
+                             lambda chunks: self._upload(
+                                 keys.measures, chunks, functools.partial(
+                                     _convert_measures, execution_id))),
+            })
+            span['attributes'].update(streams.span_attributes(stream_metrics))
+            index = collected['output']
+            # Objects left by publishing that didn't finish are overwritten,
+            # but these might not be
+            if index is not None:
+                self._put_json(keys.output_index, {
+                    'version': tar_members.INDEX_VERSION, 'members': index})
+            else:
+                self._delete(keys.output_index)
+            measures = collected['measures']
+            if measures is not None:
+                self._put_json(keys.materialized_measures, {
+                    'version': MEASURES_FORMAT_VERSION, 'measures': measures})
+            else:
+                self._delete(keys.materialized_measures)
+            metadata = compile_metadata_for_storage(
+                self.db_storage, execution_id, finish_timestamp,
+                stream_metrics)
+            self._put_json(keys.metadata, metadata)
+            self._delete(keys.tombstone_file)
+            # Unless someone else took the lock meanwhile
+            lock.renew(force=True)
+            self._put(keys.finished_file, b'')
+            self.db_storage.add_finished_execution_id(
+                user=metadata['user'], project=metadata['project'],
+                execution_id=execution_id,
+                finish_timestamp=finish_timestamp)
+        self.db_storage.add_execution_event(
+            execution_id, 'published',
+            {'exit_status': exit_status, 'finish_timestamp': finish_timestamp})
+
+    def write_tombstone(self, execution_id: str, tombstone: object) -> None:
+        keys = Paths(self.prefix, execution_id)
+        with self._lock(execution_id):
+            if self._exists(keys.finished_file):
+                return
+            self._put(keys.tombstone_file,
+                      dumps_arbitrary_json(tombstone).encode('utf-8'))
+            self._put(keys.finished_file, b'')
+        self.db_storage.add_execution_event(execution_id, 'tombstoned')
+
+    def get(self, execution_id: str) -> ContextManager[Optional[Results]]:
+        # As with local results, they don't change once finished
+        return LocalResultsContext(self._get_finished(execution_id))
+
+    def is_finished(self, execution_id: str):
+        return self._get_finished(execution_id) is not None
+
+    def _get_finished(self, execution_id: str) -> Optional[Results]:
+        results = self._finished_results.get(execution_id)
+        if results is not None:
+            return results
+        keys = Paths(self.prefix, execution_id)
+        if not self._exists(keys.finished_file):
+            return None
+        tombstone = self._get_json(keys.tombstone_file)
+        if tombstone is not None:
+            results = S3Tombstone(tombstone)
+        else:
+            results = S3Results(self, keys)
+        self._finished_results.put(execution_id, results)
+        return results
+
+    def _lock(self, execution_id: str):
+        lock_name = f'lock:{__name__}.{self.__class__.__name__}:{execution_id}'
+        return ResultsLock(self.redis, lock_name, timeout=LOCK_TIMEOUT)
+
+    def _exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if _is_missing(e):
+                return False
+            raise
+        return True
+
+    def _put(self, key: str, body: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body)
+
+    def _put_json(self, key: str, obj: Any):
+        self._put(key, json.dumps(obj, separators=(',', ':')).encode('utf-8'))
+
+    def _delete(self, key: str):
+        # Doesn't fail if there's no such object
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        """The whole object, for small ones, or None if there isn't one"""
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if _is_missing(e):
+                return None
+            raise
+        return response['Body'].read()
+
+    def _get_json(self, key: str) -> Optional[Any]:
+        content = self._get(key)
+        if content is None:
+            return None
+        return json.loads(content.decode('utf-8'))
+
+    def _upload(self, key: str, chunks: Iterator[bytes],
+                read: Optional[Callable[[Iterator[bytes]], Any]] = None) \
+            -> Any:
+        """Uploads the chunks to the object, as they're passed to `read`
+           (if given, or as they come otherwise).
+
+           :returns: what `read` returned"""
+        with self._uploading(key) as write:
+            if read is not None:
+                return read(write_through(chunks, write))
+            for chunk in chunks:
+                write(chunk)
+
+    @contextlib.contextmanager
+    def _uploading(self, key: str) -> Iterator[Callable[[bytes], None]]:
+        """Yields a function uploading chunks to the object, which is
+           complete once the context exits"""
+        upload = _Upload(self, key)
+        try:
+            yield upload.write
+            # The function might have failed inside a parser that went on
+            upload.raise_if_failed()
+            upload.complete()
+        except BaseException:
+            upload.abort()
+            raise
+
+    def _read(self, key: str) -> Iterator[bytes]:
+        size = self.client.head_object(
+            Bucket=self.bucket, Key=key)['ContentLength']
+        return self._read_ranges(key, [(0, size)])
+
+    def _read_ranges(self, key: str, ranges: List[Tuple[int, int]]) \
+            -> Iterator[bytes]:
+        """Reads the ranges (start inclusive, end exclusive) of the object,
+           in parts read concurrently but yielded in order"""
+        parts = iter([
+            (part_start, min(part_start + self.part_size, end))
+            for start, end in ranges
+            for part_start in range(start, end, self.part_size)])
+        pending = collections.deque()
+        try:
+            for _ in range(self.max_concurrency):
+                self._read_next_part(key, parts, pending)
+            while pending:
+                part = pending.popleft().result()
+                self._read_next_part(key, parts, pending)
+                yield part
+        finally:
+            # When the reader stops early
+            for future in pending:
+                future.cancel()
+
+    def _read_next_part(self, key: str, parts: Iterator[Tuple[int, int]],
+                        pending: collections.deque):
+        part = next(parts, None)
+        if part is not None:
+            pending.append(self._transfers.submit(self._get_range, key, *part))
+
+    def _get_range(self, key: str, start: int, end: int) -> bytes:
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=key, Range=f'bytes={start}-{end - 1}')
+        return response['Body'].read()
+
+
+class S3Results(Results):
+    def __init__(self, storage: S3ResultsStorage, keys: Paths):
+        self.storage = storage
+        self.keys = keys
+        # Read once, as they don't change
+        self._status: Optional[InstanceStatus] = None
+        self._stored_metadata: Optional[dict] = None
+        self._measures: Optional[dict] = None
+        self._output_index: Optional[List[dict]] = None
+
+    def get_status(self) -> InstanceStatus:
+        if self._status is None:
+            status = int(self.storage._get(self.keys.exit_status))
+            if status == 0:
+                self._status = InstanceStatusSuccess()
+            else:
+                self._status = InstanceStatusFailure(status)
+        return self._status
+
+    def get_logs(self, since: Optional[int] = None, stdout: bool = True,
+                 stderr: bool = True) -> Iterator[bytes]:
+        return self.storage._read(self.keys.logs)
+
+    def get_output_files_tarball(self) -> Iterator[bytes]:
+        return self.storage._read(self.keys.output)
+
+    def get_output_files_members(
+            self, paths: Collection[str], globs: Collection[str]) \
+            -> Iterator[bytes]:
+        if self._output_index is None:
+            index = self.storage._get_json(self.keys.output_index)
+            if index is None or \
+                    index['version'] != tar_members.INDEX_VERSION:
+                return super().get_output_files_members(paths, globs)
+            self._output_index = index['members']
+        ranges = [tar_members.member_range(member)
+                  for member in self._output_index
+                  if tar_members.is_selected(member['name'], paths, globs)]
+        return tar_members.ending_tarball(
+            self.storage._read_ranges(self.keys.output, ranges))
+
+    def get_measures_files_tarball(self) -> Iterator[bytes]:
+        return self.storage._read(self.keys.measures)
+
+    def get_stored_metadata(self) -> dict:
+        if self._stored_metadata is None:
+            self._stored_metadata = self.storage._get_json(self.keys.metadata)
+        # A copy, as callers add to it
+        return dict(self._stored_metadata)
+
+    def get_measures(self) -> dict:
+        if self._measures is None:
+            materialized_measures = self.storage._get_json(
+                self.keys.materialized_measures)
+            if materialized_measures is not None and \
+                    materialized_measures['version'] == \
+                    MEASURES_FORMAT_VERSION:
+                self._measures = materialized_measures['measures']
+            else:
+                # Converted by another version, or not at all
+                self._measures = super().get_measures()
+        return self._measures
+
+
+class S3Tombstone(Tombstone):
+    def __init__(self, tombstone_object: object):
+        super().__init__()
+        self._tombstone_object = tombstone_object
+
+    def _read_tombstone(self) -> object:
+        return self._tombstone_object
+
+
+class _Upload:
+    """An object uploaded as chunks arrive, in parts of `part_size` uploaded
+       concurrently. Objects smaller than a part are uploaded at once"""
+
+    def __init__(self, storage: S3ResultsStorage, key: str):
+        self.storage = storage
+        self.key = key
+        self.buffer = bytearray()
+        self.upload_id: Optional[str] = None
+        self.parts: List[concurrent.futures.Future] = []
+        # Parts being uploaded, or waiting for it, are in memory
+        self.parts_in_memory = threading.BoundedSemaphore(
+            storage.max_concurrency)
+
+    def write(self, chunk: bytes):
+        self.buffer += chunk
+        while len(self.buffer) >= self.storage.part_size:
+            # Copied once, without copying the slice first
+            with memoryview(self.buffer) as view:
+                part = bytes(view[:self.storage.part_size])
+            del self.buffer[:self.storage.part_size]
+            self._upload_part(part)
+
+    def _upload_part(self, part: bytes):
+        self.raise_if_failed()
+        if self.upload_id is None:
+            self.upload_id = self.storage.client.create_multipart_upload(
+                Bucket=self.storage.bucket, Key=self.key)['UploadId']
+        self.parts_in_memory.acquire()
+        self.parts.append(self.storage._transfers.submit(
+            self._send_part, len(self.parts) + 1, part))
+
+    def _send_part(self, part_number: int, part: bytes) -> dict:
+        try:
+            response = self.storage.client.upload_part(
+                Bucket=self.storage.bucket, Key=self.key,
+                UploadId=self.upload_id, PartNumber=part_number, Body=part)
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        finally:
+            self.parts_in_memory.release()
+
+    def raise_if_failed(self):
+        for part in self.parts:
+            if part.done() and part.exception() is not None:
+                raise part.exception()
+
+    def complete(self):
+        if self.upload_id is None:
+            self.storage._put(self.key, bytes(self.buffer))
+            return
+        if self.buffer:
+            self._upload_part(bytes(self.buffer))
+        self.storage.client.complete_multipart_upload(
+            Bucket=self.storage.bucket, Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={'Parts': [part.result() for part in self.parts]})
+
+    def abort(self):
+        if self.upload_id is None:
+            return
+        for part in self.parts:
+            part.cancel()
+        concurrent.futures.wait(self.parts)
+        try:
+            self.storage.client.abort_multipart_upload(
+                Bucket=self.storage.bucket, Key=self.key,
+                UploadId=self.upload_id)
+        except ClientError:
+            # The bucket should abort incomplete uploads after a while
+            log.exception(f'Couldn\'t abort the upload of {self.key}')
+
+
+def _convert_measures(execution_id: str, measures_tarball: Iterator[bytes]) \
+        -> Optional[dict]:
+    """The measures as a dict, converted as the tarball is uploaded. Consumes
+       all the chunks, even if they can't be converted"""
+    measures = None
+    try:
+        measures = convert_measures_file_to_dict(
+            IteratorReader(measures_tarball))
+    except tarfile.TarError:
+        # Then it's converted when read, and fails then
+        log.exception(f'Couldn\'t convert the measures of {execution_id}')
+    for _ in measures_tarball:
+        pass
+    return measures
+
+
+def _is_missing(error: ClientError) -> bool:
+    return error.response.get('Error', {}).get('Code') in \
+        _MISSING_OBJECT_ERROR_CODES
@@ -0,0 +1,155 @@
+import concurrent.futures
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+# Chunks fetched ahead of the writer, for each stream. Chunks from docker are
+# up to 2 MB
+BUFFER_CHUNKS = 8
+# How often threads waiting on a buffer check whether they should stop
+_POLL_SECONDS = 0.1
+
+# Consumes the chunks of a stream (writing them somewhere), and returns
+# anything it gets out of them
+Collector = Callable[[Iterator[bytes]], Any]
+
+
+class StreamCancelledException(Exception):
+    pass
+
+
+def collect_concurrently(
+        streams: Dict[str, Tuple[Iterator[bytes], Collector]],
+        buffer_chunks: int = BUFFER_CHUNKS) \
+        -> Tuple[Dict[str, Any], Dict[str, dict]]:
+    """Fetches the streams and runs their collectors, all at the same time.
+
+       Publishing reads logs, output and measures from the worker, each in
+       its own request. Collected one after another, the time of each adds
+       up. Each stream is fetched in a thread, into a buffer of
+       `buffer_chunks` that its collector reads from in another thread, so
+       that neither waits for the other unless the buffer is full or empty.
+
+       If a stream fails, the others are cancelled, and the exception is
+       raised once all threads are done.
+
+       :param streams: the chunks and the collector of each stream, by name
+       :returns: what each collector returned, and metrics of each stream
+                 (`bytes` fetched, `fetch_seconds` until the last one was
+                 fetched and `seconds` until it was collected)"""
+    buffered = {name: _BufferedStream(chunks, buffer_chunks)
+                for name, (chunks, _) in streams.items()}
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=2 * len(streams),
+            thread_name_prefix='streams') as pool:
+        for stream in buffered.values():
+            pool.submit(stream.fetch)
+        futures = {name: pool.submit(buffered[name].collect, collector)
+                   for name, (_, collector) in streams.items()}
+        for future in concurrent.futures.as_completed(futures.values()):
+            if future.exception() is not None:
+                for stream in buffered.values():
+                    stream.stop()
+    exceptions = [future.exception() for future in futures.values()
+                  if future.exception() is not None]
+    # The failure, rather than the cancellations it caused
+    for exception in exceptions:
+        if not isinstance(exception, StreamCancelledException):
+            raise exception
+    if exceptions:
+        raise exceptions[0]
+    return ({name: future.result() for name, future in futures.items()},
+            {name: stream.metrics() for name, stream in buffered.items()})
+
+
+def span_attributes(stream_metrics: Dict[str, dict]) -> Dict[str, Any]:
+    """Metrics of the streams of a publication, as attributes of its span"""
+    return {f'{name}.{metric}': value
+            for name, metrics in stream_metrics.items()
+            for metric, value in metrics.items()}
+
+
+class _BufferedStream:
+    _END = object()
+
+    def __init__(self, chunks: Iterator[bytes], buffer_chunks: int):
+        self.chunks = chunks
+        self.buffer = queue.Queue(buffer_chunks)
+        self.stopped = threading.Event()
+        self.bytes = 0
+        self.started_at = time.time()
+        self.fetched_at = None
+        self.collected_at = None
+
+    def fetch(self):
+        try:
+            for chunk in self.chunks:
+                self.bytes += len(chunk)
+                if not self._put(chunk):
+                    break
+            else:
+                self.fetched_at = time.time()
+                self._put(self._END)
+        except Exception as e:
+            self._put(e)
+        finally:
+            # So that, if the collector stopped early, the connection is
+            # released
+            if hasattr(self.chunks, 'close'):
+                self.chunks.close()
+
+    def collect(self, collector: Collector) -> Any:
+        chunks = self._read()
+        try:
+            result = collector(chunks)
+        finally:
+            chunks.close()
+            # Even if it didn't read any, so that the fetcher stops
+            self.stop()
+        self.collected_at = time.time()
+        return result
+
+    def stop(self):
+        self.stopped.set()
+
+    def metrics(self) -> dict:
+        return {
+            'bytes': self.bytes,
+            'fetch_seconds': _seconds_between(
+                self.started_at, self.fetched_at),
+            'seconds': _seconds_between(self.started_at, self.collected_at),
+        }
+
+    def _put(self, item: Any) -> bool:
+        """:returns: whether it was put, rather than stopped"""
+        while not self.stopped.is_set():
+            try:
+                self.buffer.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self) -> Iterator[bytes]:
+        try:
+            while True:
+                try:
+                    item = self.buffer.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    if self.stopped.is_set():
+                        raise StreamCancelledException()
+                    continue
+                if item is self._END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Whether it's read to the end or not, the fetcher can stop
+            self.stop()
+
+
+def _seconds_between(start: float, end: Optional[float]) \
+        -> Optional[float]:
+    return None if end is None else round(end - start, 3)
@@ -0,0 +1,136 @@
+import fnmatch
+import os
+import tarfile
+from typing import Collection, Iterator, List, Optional, Tuple
+
+from plz.controller.api.iterator_reader import IteratorReader
+from plz.controller.api.tarball_paths import path_in_tarball
+
+# Selecting members of output tarballs, so that clients can retrieve some
+# files of the output without the rest.
+#
+# Paths are relative to the output directory, that is, without the first
+# segment of the names of the members (as the CLI extracts them).
+
+# Version of the index of the members of a tarball
+INDEX_VERSION = 1
+
+# Types of members followed by their contents
+_TYPES_WITH_DATA = {
+    t.decode('ascii')
+    for t in [tarfile.REGTYPE, tarfile.AREGTYPE, tarfile.CONTTYPE]}
+
+
+def is_selected(name: str, paths: Collection[str],
+                globs: Collection[str]) -> bool:
+    """Whether the member is one of `paths` (or in one of them, if it's a
+       directory), or matches one of `globs`"""
+    path = path_in_tarball(name)
+    if path is None:
+        return False
+    for selected_path in paths:
+        selected_path = selected_path.strip(os.sep)
+        if path == selected_path or path.startswith(selected_path + os.sep):
+            return True
+    return any(fnmatch.fnmatchcase(path, glob) for glob in globs)
+
+
+def index_members(chunks: Iterator[bytes]) -> Optional[List[dict]]:
+    """Where each member of the tarball is. Consumes all the chunks, even
+       if they aren't a tarball, in which case it returns None"""
+    index = []
+    try:
+        tar = tarfile.open(fileobj=IteratorReader(chunks), mode='r|')
+        for tarinfo in tar:
+            index.append({
+                'name': tarinfo.name,
+                # Of the first header of the member, which might be an
+                # extended header with a long name
+                'offset': tarinfo.offset,
+                'offset_data': tarinfo.offset_data,
+                'size': tarinfo.size,
+                'mode': tarinfo.mode,
+                'type': tarinfo.type.decode('ascii'),
+            })
+    except tarfile.TarError:
+        index = None
+    # The end of the tarball
+    for _ in chunks:
+        pass
+    return index
+
+
+def member_range(member: dict) -> Tuple[int, int]:
+    """Start and end of the headers and data of the member in the tarball"""
+    data_size = member['size'] if member['type'] in _TYPES_WITH_DATA else 0
+    return (member['offset'],
+            member['offset_data'] + _padded(data_size, tarfile.BLOCKSIZE))
+
+
+def read_ranges(path: str, ranges: List[Tuple[int, int]],
+                chunk_size: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        for start, end in ranges:
+            f.seek(start)
+            while start < end:
+                chunk = f.read(min(chunk_size, end - start))
+                if not chunk:
+                    raise tarfile.ReadError(f'{path} ends before {end}')
+                start += len(chunk)
+                yield chunk
+
+
+def ranges_of_stream(chunks: Iterator[bytes],
+                     ranges: List[Tuple[int, int]]) -> Iterator[bytes]:
+    """The bytes in `ranges` (sorted, and not overlapping), of a stream we
+       can't seek, like a decompressed file"""
+    ranges = iter(ranges)
+    current_range = next(ranges, None)
+    position = 0
+    for chunk in chunks:
+        chunk_end = position + len(chunk)
+        while current_range is not None and current_range[0] < chunk_end:
+            start, end = current_range
+            yield chunk[max(start, position) - position:
+                        min(end, chunk_end) - position]
+            if end > chunk_end:
+                break
+            current_range = next(ranges, None)
+        if current_range is None:
+            return
+        position = chunk_end
+
+
+def select_from_stream(chunks: Iterator[bytes], paths: Collection[str],
+                       globs: Collection[str]) -> Iterator[bytes]:
+    """The selected members of a tarball without an index, which we read
+       until the end"""
+    tar = tarfile.open(fileobj=IteratorReader(chunks), mode='r|*')
+    for tarinfo in tar:
+        if not is_selected(tarinfo.name, paths, globs):
+            continue
+        yield tarinfo.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+        if tarinfo.isfile():
+            contents = tar.extractfile(tarinfo)
+            while True:
+                chunk = contents.read(tarfile.RECORDSIZE)
+                if not chunk:
+                    break
+                yield chunk
+            yield bytes(_padded(tarinfo.size, tarfile.BLOCKSIZE)
+                        - tarinfo.size)
+
+
+def ending_tarball(members: Iterator[bytes]) -> Iterator[bytes]:
+    """The members, and the end of a tarball after them"""
+    size = 0
+    for chunk in members:
+        size += len(chunk)
+        yield chunk
+    end = bytes(2 * tarfile.BLOCKSIZE)
+    size += len(end)
+    yield end + bytes(_padded(size, tarfile.RECORDSIZE) - size)
+
+
+def _padded(size: int, block_size: int) -> int:
+    return size + -size % block_size
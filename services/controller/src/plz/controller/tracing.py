@@ -0,0 +1,169 @@
+import contextlib
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Iterator, List, Optional
+
+import requests
+
+from plz.controller.db_storage import DBStorage
+
+# Spans time the phases of executions (building the snapshot, getting an
+# instance, creating the volume, publishing...), so that we can tell where
+# a slow run spent its time.
+#
+# Spans are recorded per trace: the execution ID, or the snapshot ID for the
+# spans of building a snapshot (which happens before there's an execution).
+# They are kept in the DB storage, next to the start metadata, and
+# optionally exported to an OpenTelemetry collector (OTLP over HTTP).
+
+log = logging.getLogger(__name__)
+
+_OTLP_BATCH_SIZE = 100
+_OTLP_FLUSH_PERIOD_SECONDS = 1
+_OTLP_TIMEOUT_SECONDS = 5
+_OTLP_SPAN_KIND_INTERNAL = 1
+_OTLP_STATUS_CODE_ERROR = 2
+
+_get_db_storage: Optional[Callable[[], DBStorage]] = None
+_exporter: Optional['OTLPExporter'] = None
+# Open spans, so that spans know their parent. With gevent, this is per
+# greenlet
+_local = threading.local()
+
+
+def configure(get_db_storage: Callable[[], DBStorage],
+              otlp_endpoint: Optional[str] = None):
+    """Until called, spans are not recorded. The DB storage is got when
+       storing the first span, as it's built on first use"""
+    global _get_db_storage, _exporter
+    _get_db_storage = get_db_storage
+    if otlp_endpoint is not None:
+        _exporter = OTLPExporter(otlp_endpoint)
+
+
+@contextlib.contextmanager
+def span(trace_id: str, name: str, **attributes) -> Iterator[dict]:
+    """Records the time spent in the block as a span of the trace. Yields
+       the span, so that the block can add attributes"""
+    if _get_db_storage is None or not trace_id:
+        yield {'attributes': attributes}
+        return
+    open_spans: List[dict] = _open_spans()
+    parent = open_spans[-1] if open_spans else None
+    current_span = {
+        'id': os.urandom(8).hex(),
+        'parent_id': parent['id'] if parent is not None and
+        parent['trace_id'] == trace_id else None,
+        'trace_id': trace_id,
+        'name': name,
+        'start': time.time(),
+        'attributes': attributes,
+    }
+    open_spans.append(current_span)
+    try:
+        yield current_span
+    except Exception as e:
+        current_span['error'] = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        current_span['duration'] = time.time() - current_span['start']
+        # Not necessarily the last one, as the block can be a generator
+        open_spans.remove(current_span)
+        _record(current_span)
+
+
+def _open_spans() -> List[dict]:
+    if not hasattr(_local, 'open_spans'):
+        _local.open_spans = []
+    return _local.open_spans
+
+
+def _record(finished_span: dict):
+    trace_id = finished_span.pop('trace_id')
+    try:
+        _get_db_storage().add_execution_span(trace_id, finished_span)
+    except Exception:
+        # Spans are informative only, don't stop the execution because of
+        # them
+        log.exception(f'Couldn\'t store span {finished_span}')
+    if _exporter is not None:
+        _exporter.export(trace_id, finished_span)
+
+
+class OTLPExporter:
+    """Sends spans to an OpenTelemetry collector, with the JSON encoding of
+       OTLP over HTTP. Spans are sent in batches by a background thread, so
+       that executions don't wait for the collector"""
+
+    def __init__(self, endpoint: str):
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self.spans = queue.Queue()
+        threading.Thread(target=self._send_batches, daemon=True).start()
+
+    def export(self, trace_id: str, finished_span: dict):
+        self.spans.put(to_otlp_span(trace_id, finished_span))
+
+    def _send_batches(self):
+        while True:
+            batch = [self.spans.get()]
+            deadline = time.time() + _OTLP_FLUSH_PERIOD_SECONDS
+            while len(batch) < _OTLP_BATCH_SIZE:
+                try:
+                    batch.append(self.spans.get(
+                        timeout=max(deadline - time.time(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                response = requests.post(
+                    self.url, json=otlp_request(batch),
+                    timeout=_OTLP_TIMEOUT_SECONDS)
+                response.raise_for_status()
+            except requests.RequestException:
+                log.exception(f'Couldn\'t export {len(batch)} spans')
+
+
+def otlp_trace_id(trace_id: str) -> str:
+    """OTLP trace IDs are 16 bytes, in hex. Execution IDs are UUIDs already,
+       other IDs (like snapshot IDs) are hashed"""
+    hex_id = trace_id.replace('-', '')
+    if len(hex_id) == 32 and all(c in '0123456789abcdef' for c in hex_id):
+        return hex_id
+    return hashlib.md5(trace_id.encode('utf-8')).hexdigest()
+
+
+def to_otlp_span(trace_id: str, finished_span: dict) -> dict:
+    start_nanos = int(finished_span['start'] * 1e9)
+    end_nanos = start_nanos + int(finished_span['duration'] * 1e9)
+    attributes = {'plz.trace_id': trace_id, **finished_span['attributes']}
+    otlp_span = {
+        'traceId': otlp_trace_id(trace_id),
+        'spanId': finished_span['id'],
+        'name': finished_span['name'],
+        'kind': _OTLP_SPAN_KIND_INTERNAL,
+        # 64-bit integers are strings in the JSON encoding
+        'startTimeUnixNano': str(start_nanos),
+        'endTimeUnixNano': str(end_nanos),
+        'attributes': [{'key': k, 'value': {'stringValue': str(v)}}
+                       for k, v in attributes.items()],
+    }
+    if finished_span['parent_id'] is not None:
+        otlp_span['parentSpanId'] = finished_span['parent_id']
+    if 'error' in finished_span:
+        otlp_span['status'] = {'code': _OTLP_STATUS_CODE_ERROR,
+                               'message': finished_span['error']}
+    return otlp_span
+
+
+def otlp_request(otlp_spans: List[dict]) -> dict:
+    return {'resourceSpans': [{
+        'resource': {'attributes': [
+            {'key': 'service.name', 'value': {'stringValue': 'plz'}}]},
+        'scopeSpans': [{
+            'scope': {'name': __name__},
+            'spans': otlp_spans,
+        }],
+    }]}
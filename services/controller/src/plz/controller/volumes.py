@@ -11,6 +11,8 @@ from docker.models.containers import Container
 from docker.models.volumes import Volume
 from docker.types import Mount
 
+from plz.controller import docker_hosts, metrics
+
 
 class VolumeObject(ABC):
     @abstractmethod
@@ -76,12 +78,13 @@ class Volumes:
 
     @staticmethod
     def for_host(docker_url):
-        docker_client = docker.DockerClient(base_url=docker_url)
+        docker_client = docker_hosts.docker_client(docker_url)
         return Volumes(docker_client)
 
     def __init__(self, docker_client: docker.DockerClient):
         self.docker_client = docker_client
 
+    @metrics.docker_call
     def create(self, name: str, objects: List[VolumeObject]) -> Volume:
         root = '/output'
         volume = self.docker_client.volumes.create(name)
@@ -99,6 +102,7 @@ class Volumes:
             container.kill()
         return volume
 
+    @metrics.docker_call
     def remove(self, name: str):
         try:
             volume = self.docker_client.volumes.get(name)
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import docker.errors
+import requests
+
+from plz.controller import docker_hosts
+
+
+class DockerHostsTest(unittest.TestCase):
+    def setUp(self):
+        docker_hosts.configure(
+            connect_timeout_seconds=1, read_timeout_seconds=0.2,
+            failures_to_open=3, open_seconds=0.5)
+        self.daemon = _Daemon(('127.0.0.1', 0), _DaemonRequestHandler)
+        self.daemon.hangs = True
+        threading.Thread(target=self.daemon.serve_forever, daemon=True) \
+            .start()
+        self.client = docker_hosts.docker_client(
+            f'tcp://127.0.0.1:{self.daemon.server_port}')
+        self.base_url = self.client.api.base_url
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.daemon.server_close()
+
+    def test_calls_time_out_and_then_fail_right_away(self):
+        for _ in range(3):
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                self.client.containers.get('some-container')
+        self.assertEqual(docker_hosts.circuit_state(self.base_url),
+                         {'state': 'open', 'failures': 3})
+
+        start = time.monotonic()
+        with self.assertRaises(docker_hosts.CircuitOpenError):
+            self.client.containers.get('some-container')
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_calls_go_through_once_the_daemon_is_back(self):
+        for _ in range(3):
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                self.client.containers.get('some-container')
+        self.daemon.hangs = False
+        time.sleep(0.5)
+
+        self.assertEqual(
+            docker_hosts.circuit_state(self.base_url)['state'], 'half-open')
+        with self.assertRaises(docker.errors.NotFound):
+            self.client.containers.get('some-container')
+        self.assertEqual(docker_hosts.circuit_state(self.base_url),
+                         {'state': 'closed', 'failures': 0})
+
+
+class _Daemon(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    hangs = False
+
+
+class _DaemonRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # Newer versions of docker-py ask for the version of the API when
+        # creating the client
+        if self.path.endswith('/version'):
+            self._respond(200, {'ApiVersion': '1.35'})
+        elif self.server.hangs:
+            time.sleep(2)
+        else:
+            self._respond(404, {'message': 'No such container'})
+
+    def _respond(self, status: int, body: dict):
+        encoded_body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded_body)))
+        self.end_headers()
+        self.wfile.write(encoded_body)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,31 @@
+import io
+import tarfile
+import unittest
+
+from plz.controller.execution_metadata import convert_measures_to_dict
+
+
+class ConvertMeasuresToDictTest(unittest.TestCase):
+    def test_converts_a_stream_of_chunks(self):
+        tarball = io.BytesIO()
+        with tarfile.open(fileobj=tarball, mode='w:gz') as tar:
+            _add_file(tar, 'measures/summary/accuracy', b'0.9')
+            _add_file(tar, 'measures/weights', b'\xff')
+            link = tarfile.TarInfo('measures/best')
+            link.type = tarfile.LNKTYPE
+            link.linkname = 'measures/summary/accuracy'
+            tar.addfile(link)
+        content = tarball.getvalue()
+        chunks = (content[i:i + 100] for i in range(0, len(content), 100))
+
+        self.assertEqual(convert_measures_to_dict(chunks), {
+            'summary': {'accuracy': 0.9},
+            'weights': {'base64_bytes': '/w==\n'},
+            'best': 0.9,
+        })
+
+
+def _add_file(tar: tarfile.TarFile, name: str, content: bytes):
+    tarinfo = tarfile.TarInfo(name)
+    tarinfo.size = len(content)
+    tar.addfile(tarinfo, io.BytesIO(content))
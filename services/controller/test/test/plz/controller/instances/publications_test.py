@@ -0,0 +1,134 @@
+import threading
+import unittest
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+from plz.controller.instances import publications
+from plz.controller.instances.publications import Publications
+
+
+class StandInRedis:
+    def __init__(self):
+        self.values: Dict[str, bytes] = {}
+
+    def set(self, name: str, value, nx: bool = False,
+            ex: Optional[int] = None) -> Optional[bool]:
+        if nx and name in self.values:
+            return None
+        self.values[name] = str(value).encode('utf-8')
+        return True
+
+    def get(self, name: str) -> Optional[bytes]:
+        return self.values.get(name)
+
+    def delete(self, name: str):
+        self.values.pop(name, None)
+
+    def expire(self, name: str, seconds: int):
+        pass
+
+
+class PublicationsTest(unittest.TestCase):
+    def setUp(self):
+        self.states: List[dict] = []
+        self.db_storage = mock.Mock()
+        self.db_storage.store_publication_state.side_effect = \
+            lambda execution_id, state, expire_seconds: \
+            self.states.append(state)
+        self.db_storage.retrieve_publication_states.side_effect = \
+            lambda execution_ids: \
+            {'some-id': self.states[-1]} if self.states else {}
+        self.results_storage = mock.Mock()
+        self.results_storage.db_storage = self.db_storage
+        self.results_storage.is_finished.return_value = False
+        self.publications = Publications(
+            StandInRedis(), self.results_storage, max_workers=2)
+
+    def start(self, publish: Callable[[Callable[[int], None]], None],
+              release: Callable[[], None] = lambda: None):
+        return self.publications.start('some-id', publish, release)
+
+    def events(self) -> List[str]:
+        return [call[0][1] for call
+                in self.db_storage.add_execution_event.call_args_list]
+
+    def test_publishes_and_releases_in_the_background(self):
+        released = threading.Event()
+
+        def publish(record_progress):
+            record_progress(100)
+            record_progress(23)
+
+        self.start(publish, release=released.set).result()
+
+        self.assertTrue(released.is_set())
+        self.assertEqual(
+            [state['state'] for state in self.states],
+            ['exited', 'publishing', 'published', 'cleaned'])
+        self.assertEqual(self.states[-1]['bytes'], 123)
+        self.assertEqual(self.events(), ['exited', 'instance_disposed'])
+
+    def test_starts_publications_once(self):
+        publishing = threading.Event()
+        published = threading.Event()
+
+        def publish(_):
+            publishing.set()
+            published.wait()
+
+        future = self.start(publish)
+        publishing.wait()
+        self.assertIsNone(self.start(publish))
+        published.set()
+        future.result()
+
+    def test_retries_publications_that_failed(self):
+        def fail(_):
+            raise OSError('Docker is gone')
+
+        self.start(fail).result()
+        self.assertEqual(self.states[-1]['state'], 'exited')
+        self.assertEqual(self.states[-1]['error'], 'OSError: Docker is gone')
+
+        publish = mock.Mock()
+        self.start(publish).result()
+        publish.assert_called_once()
+        self.assertEqual(self.states[-1]['state'], 'cleaned')
+        self.assertEqual(self.states[-1]['attempts'], 2)
+        # The execution exited once
+        self.assertEqual(self.events(), ['exited', 'instance_disposed'])
+
+    def test_releases_without_publishing_again(self):
+        self.results_storage.is_finished.return_value = True
+        publish = mock.Mock()
+        release = mock.Mock()
+
+        self.start(publish, release).result()
+
+        publish.assert_not_called()
+        release.assert_called_once()
+
+    @mock.patch.object(publications, '_WAIT_POLL_SECONDS', 0.01)
+    def test_waits_for_publications(self):
+        publishing = threading.Event()
+        published = threading.Event()
+        released = threading.Event()
+
+        def publish(_):
+            publishing.set()
+            published.wait()
+
+        future = self.start(publish, release=released.set)
+        publishing.wait()
+        waiting = threading.Thread(
+            target=self.publications.wait, args=('some-id',))
+        waiting.start()
+        waiting.join(0.1)
+        self.assertTrue(waiting.is_alive())
+
+        published.set()
+        waiting.join()
+        self.assertTrue(released.is_set())
+        future.result()
+        # Without any publication
+        self.publications.wait('some-id')
@@ -0,0 +1,535 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+from typing import List, Tuple
+from unittest import mock
+
+import fakeredis
+import msgpack
+from prometheus_client import REGISTRY
+
+from plz.controller import compression, configuration, controller_impl, \
+    profiling
+from plz.controller.api import server_sent_events
+from plz.controller.api.framing import decode_frames
+from plz.controller.api.types import ACCEPT_COMPRESSED_HEADER, \
+    MSGPACK_MIMETYPE
+from plz.controller.controller_impl import ControllerImpl
+from plz.controller.instances.publications import Publications
+from plz.controller.redis_db_storage import RedisDBStorage
+from plz.controller.results.results_base import InstanceStatusRunning, \
+    ResultsFile
+
+# The app is built when importing the module, from the configuration, and
+# with a controller that would talk to redis and docker. Tests replace the
+# controller, see `make_controller`
+with mock.patch.dict(os.environ, {'CONFIGURATION': '{}'}), \
+        mock.patch.object(controller_impl, 'ControllerImpl'):
+    from plz.controller import main
+
+
+class EndpointTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(
+            main, 'controller', self.make_controller())
+        self.controller = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = main.app.test_client()
+
+    def make_controller(self):
+        """The controller behind the endpoints, by default a mock"""
+        return mock.Mock()
+
+    def make_controller_impl(self, **dependencies) -> ControllerImpl:
+        """A controller with these dependencies, instead of the ones in the
+           configuration"""
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        config = configuration.load_from_string(
+            f'data_dir = "{data_dir.name}"')
+        stand_ins = configuration.Dependencies(config)
+        stand_ins.built.update(dependencies)
+        with mock.patch.object(configuration, 'dependencies_from_config',
+                               return_value=stand_ins):
+            return ControllerImpl(config, logging.getLogger(__name__))
+
+
+class StatusesTest(EndpointTest):
+    def make_controller(self):
+        redis = fakeredis.FakeStrictRedis()
+        self.db_storage = RedisDBStorage(redis)
+        results_storage = mock.MagicMock()
+        results_storage.db_storage = self.db_storage
+        # There are no finished executions
+        results_storage.get.return_value.__enter__.return_value = None
+        instances = {'running-id': mock.Mock()}
+        instances['running-id'].get_status.return_value = \
+            InstanceStatusRunning()
+        instance_provider = mock.Mock()
+        instance_provider.instance_for.side_effect = instances.get
+        instance_provider.instances_for.side_effect = lambda ids: {
+            e: instances[e] for e in ids if e in instances}
+        instance_provider.publications = Publications(redis, results_storage)
+        return self.make_controller_impl(
+            redis=redis, db_storage=self.db_storage,
+            results_storage=results_storage,
+            instance_provider=instance_provider)
+
+    def test_returns_the_same_statuses_as_for_each_execution(self):
+        self.db_storage.store_publication_state(
+            'running-id', {'state': 'publishing', 'bytes': 123})
+
+        response = self.client.post(
+            '/executions/status', json={'execution_ids': ['running-id']})
+
+        self.assertEqual(response.status_code, 200)
+        status = self.client.get('/executions/running-id/status').get_json()
+        self.assertEqual(status['publication']['bytes'], 123)
+        self.assertEqual(response.get_json(),
+                         {'statuses': {'running-id': status}})
+
+    def test_returns_errors_for_unknown_executions(self):
+        response = self.client.post(
+            '/executions/status',
+            json={'execution_ids': ['running-id', 'unknown-id']})
+
+        statuses = response.get_json()['statuses']
+        self.assertTrue(statuses['running-id']['running'])
+        self.assertEqual(
+            statuses['unknown-id'],
+            {'exception_type': 'ExecutionNotFoundException',
+             'execution_id': 'unknown-id'})
+
+    def test_rejects_bad_requests(self):
+        for body in [None, [], {}, {'execution_ids': 'running-id'},
+                     {'execution_ids': [1]}]:
+            response = self.client.post('/executions/status', json=body)
+            self.assertEqual(response.status_code, 400, body)
+        response = self.client.post('/executions/status', data='{')
+        self.assertEqual(response.status_code, 400)
+
+
+class StandInEventStorage:
+    """Execution events, as stored in a redis stream"""
+
+    def __init__(self, events: List[Tuple[str, dict]]):
+        self.events = events
+
+    def get_last_execution_event_id(self) -> str:
+        return self.events[-1][0] if self.events else '0-0'
+
+    def retrieve_execution_events(
+            self, after_event_id: str, count: int,
+            block_milliseconds: int) -> List[Tuple[str, dict]]:
+        return [(event_id, event) for event_id, event in self.events
+                if _stream_id(event_id) > _stream_id(after_event_id)][:count]
+
+
+class ExecutionEventsTest(EndpointTest):
+    def make_controller(self):
+        self.db_storage = StandInEventStorage([
+            (f'{i}-0', {'execution_id': execution_id, 'type': event_type})
+            for i, (execution_id, event_type) in enumerate([
+                ('a', 'started'), ('b', 'started'), ('a', 'exited')],
+                start=1)])
+        return self.make_controller_impl(db_storage=self.db_storage)
+
+    def events(self, path: str, **kwargs) -> List[dict]:
+        """The events until there are no more, and the stream is kept
+           alive"""
+        response = self.client.get(path, buffered=False, **kwargs)
+        self.assertEqual(response.mimetype, server_sent_events.MIMETYPE)
+        # Proxies mustn't hold events back
+        self.assertEqual(response.headers['X-Accel-Buffering'], 'no')
+        text = ''
+        for chunk in response.response:
+            text += chunk.decode('utf-8')
+            if text.endswith(server_sent_events.KEEP_ALIVE):
+                break
+        response.close()
+        return list(server_sent_events.decode_events(
+            iter(text.split('\n'))))
+
+    def test_sends_new_events_only(self):
+        self.assertEqual(self.events('/executions/events'), [])
+
+    def test_resumes_after_the_last_event_id(self):
+        events = self.events(
+            '/executions/events', headers={'Last-Event-ID': '1-0'})
+
+        self.assertEqual([event['id'] for event in events], ['2-0', '3-0'])
+        self.assertEqual(events[0],
+                         {'id': '2-0', 'execution_id': 'b',
+                          'type': 'started'})
+
+    def test_resumes_after_the_last_event_id_parameter(self):
+        events = self.events('/executions/events?last_event_id=2-0')
+
+        self.assertEqual([event['id'] for event in events], ['3-0'])
+
+    def test_sends_events_of_some_executions(self):
+        events = self.events(
+            '/executions/events?execution_id=a',
+            headers={'Last-Event-ID': '0-0'})
+
+        self.assertEqual([event['id'] for event in events], ['1-0', '3-0'])
+
+
+class MultiplexedLogsTest(EndpointTest):
+    def test_streams_the_logs_of_the_executions(self):
+        self.controller.get_multiplexed_logs.return_value = iter([
+            ({'execution_id': 'a', 'stream': 'logs', 'offset': 0}, b'one\n'),
+            ({'execution_id': 'a', 'stream': 'end', 'offset': 4}, b''),
+        ])
+
+        response = self.client.post(
+            '/executions/logs',
+            json={'execution_ids': ['a'], 'offsets': {'a': 0}})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(header['stream'], payload) for header, payload
+             in decode_frames(iter([response.get_data()]))],
+            [('logs', b'one\n'), ('end', b'')])
+        self.controller.get_multiplexed_logs.assert_called_once_with(
+            ['a'], since=None, offsets={'a': 0})
+
+    def test_rejects_bad_requests(self):
+        for body in [None, [], {}, {'execution_ids': 'a'},
+                     {'execution_ids': [1]},
+                     {'execution_ids': ['a'], 'offsets': ['a']},
+                     {'execution_ids': ['a'], 'offsets': {'a': '1'}},
+                     {'execution_ids': ['a'], 'since': 'yesterday'}]:
+            response = self.client.post('/executions/logs', json=body)
+            self.assertEqual(response.status_code, 400, body)
+        response = self.client.post('/executions/logs', data='{')
+        self.assertEqual(response.status_code, 400)
+        self.controller.get_multiplexed_logs.assert_not_called()
+
+
+class ContentNegotiationTest(EndpointTest):
+    executions = [{'execution_id': 'some-id', 'running': True,
+                   'instance_type': 't2.micro', 'max_idle_seconds': 60,
+                   'idle_since_timestamp': None}]
+
+    def test_answers_in_json_by_default(self):
+        self.controller.list_executions.return_value = self.executions
+
+        for accept in [None, '*/*', f'application/json, {MSGPACK_MIMETYPE}',
+                       f'application/json, {MSGPACK_MIMETYPE};q=0.5']:
+            headers = {'Accept': accept} if accept is not None else {}
+            response = self.client.get('/executions/list', headers=headers)
+
+            self.assertEqual(response.mimetype, 'application/json', accept)
+            self.assertEqual(response.get_json(),
+                             {'executions': self.executions})
+            self.assertEqual(response.headers['Vary'], 'Accept')
+
+    def test_answers_in_msgpack_if_preferred(self):
+        self.controller.list_executions.return_value = self.executions
+        self.controller.describe_execution_entrypoint.return_value = \
+            {'start_metadata': {'command': ['ls']}}
+
+        for accept in [MSGPACK_MIMETYPE,
+                       f'{MSGPACK_MIMETYPE}, application/json;q=0.5']:
+            response = self.client.get(
+                '/executions/list', headers={'Accept': accept})
+            self.assertEqual(response.mimetype, MSGPACK_MIMETYPE, accept)
+            self.assertEqual(msgpack.unpackb(response.get_data(), raw=False),
+                             {'executions': self.executions})
+        response = self.client.get(
+            '/executions/describe/some-id',
+            headers={'Accept': MSGPACK_MIMETYPE})
+        self.assertEqual(msgpack.unpackb(response.get_data(), raw=False),
+                         {'start_metadata': {'command': ['ls']}})
+
+    def test_streams_the_history_as_msgpack_pairs(self):
+        entries = [('b', {'finish_timestamp': 20}),
+                   ('a', {'finish_timestamp': 10})]
+        self.controller.get_history_entries.return_value = iter(entries)
+
+        response = self.client.get(
+            '/executions/some-user/some-project/history?limit=2',
+            headers={'Accept': MSGPACK_MIMETYPE})
+
+        self.assertEqual(response.mimetype, MSGPACK_MIMETYPE)
+        unpacker = msgpack.Unpacker(raw=False)
+        unpacker.feed(response.get_data())
+        self.assertEqual([tuple(entry) for entry in unpacker], entries)
+        self.assertEqual(
+            self.controller.get_history_entries.call_args[1]['limit'], 2)
+
+
+class CompressionTest(EndpointTest):
+    executions = [{'execution_id': f'id-{i}', 'running': False}
+                  for i in range(100)]
+
+    def setUp(self):
+        super().setUp()
+        self.controller.list_executions.return_value = self.executions
+
+    def get(self, path: str, encoding: str, opt_in: bool = True):
+        headers = {'Accept-Encoding': encoding}
+        if opt_in:
+            headers[ACCEPT_COMPRESSED_HEADER] = '1'
+        return self.client.get(path, headers=headers)
+
+    def test_compresses_for_clients_opting_in(self):
+        for encoding in compression.available_encodings():
+            response = self.get('/executions/list', encoding)
+
+            self.assertEqual(response.headers['Content-Encoding'], encoding)
+            self.assertIn('Accept-Encoding', response.vary)
+            body = b''.join(compression.decompress_chunks(
+                iter([response.get_data()]), encoding))
+            self.assertEqual(json.loads(body),
+                             {'executions': self.executions})
+
+    def test_sends_plain_responses_to_other_clients(self):
+        response = self.get('/executions/list', 'gzip', opt_in=False)
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_json(),
+                         {'executions': self.executions})
+
+    def test_sends_plain_responses_when_disabled(self):
+        with mock.patch.object(main, 'compression_enabled', False):
+            response = self.get('/executions/list', 'gzip')
+
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_sends_small_responses_as_they_are(self):
+        self.controller.list_executions.return_value = []
+
+        response = self.get('/executions/list', 'gzip')
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_json(), {'executions': []})
+
+    def test_compresses_streams_as_they_are_produced(self):
+        self.controller.get_logs_file_or_logs.return_value = \
+            iter([b'first line\n', b'second line\n'])
+
+        response = self.get('/executions/some-id/logs', 'gzip')
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        chunks = list(response.response)
+        # The first line can be decompressed before the second one arrives
+        self.assertEqual(
+            next(compression.decompress_chunks(iter(chunks[:1]), 'gzip')),
+            b'first line\n')
+        self.assertEqual(
+            b''.join(compression.decompress_chunks(iter(chunks), 'gzip')),
+            b'first line\nsecond line\n')
+
+
+def _stream_id(event_id: str) -> Tuple[int, int]:
+    milliseconds, sequence = event_id.split('-')
+    return int(milliseconds), int(sequence)
+
+
+class ResultsFilesTest(EndpointTest):
+    content = bytes(range(256)) * 16
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, 'some-id', 'output.tar')
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+        self.controller.get_output_files_file_or_tarball.return_value = \
+            ResultsFile(self.path, None)
+
+    def get(self, headers: dict = None):
+        response = self.client.get(
+            '/executions/some-id/output/files', headers=headers or {})
+        self.addCleanup(response.close)
+        return response
+
+    def test_sends_the_file(self):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), self.content)
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertIsNotNone(response.headers.get('ETag'))
+
+    def test_sends_ranges_of_the_same_file(self):
+        etag = self.get().headers['ETag']
+
+        response = self.get({'Range': 'bytes=1000-', 'If-Range': etag})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.get_data(), self.content[1000:])
+        self.assertEqual(response.headers['Content-Range'],
+                         f'bytes 1000-{len(self.content) - 1}'
+                         f'/{len(self.content)}')
+
+    def test_sends_the_whole_file_if_it_changed(self):
+        response = self.get({'Range': 'bytes=1000-',
+                             'If-Range': '"another-etag"'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), self.content)
+
+    def test_rejects_ranges_past_the_end(self):
+        response = self.get({'Range': f'bytes={len(self.content)}-'})
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'],
+                         f'bytes */{len(self.content)}')
+
+    def test_sends_files_stored_compressed_as_they_are(self):
+        self.controller.get_output_files_file_or_tarball.return_value = \
+            ResultsFile(self.path, 'gzip')
+
+        response = self.get({'Accept-Encoding': 'gzip',
+                             ACCEPT_COMPRESSED_HEADER: '1'})
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.get_data(), self.content)
+        self.assertIn(
+            'gzip',
+            self.controller.get_output_files_file_or_tarball.call_args[0][1])
+
+    def test_streams_the_output_of_running_executions(self):
+        self.controller.get_output_files_file_or_tarball.return_value = \
+            iter([self.content[:100], self.content[100:]])
+
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), self.content)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_leaves_the_file_to_the_web_server_with_x_sendfile(self):
+        with mock.patch.object(main, 'results_file_serving', 'x-sendfile'), \
+                mock.patch.dict(main.app.config, {'USE_X_SENDFILE': True}):
+            response = self.get()
+
+        self.assertEqual(response.headers['X-Sendfile'], self.path)
+        self.assertEqual(response.get_data(), b'')
+
+    def test_leaves_the_file_to_nginx_with_x_accel_redirect(self):
+        config = configuration.load_from_string(
+            f'results.directory = "{self.directory}"')
+        with mock.patch.object(main, 'results_file_serving',
+                               'x-accel-redirect'), \
+                mock.patch.object(main, 'config', config):
+            response = self.get({'Accept-Encoding': 'gzip',
+                                 ACCEPT_COMPRESSED_HEADER: '1'})
+
+        self.assertEqual(response.headers['X-Accel-Redirect'],
+                         '/results/some-id/output.tar')
+        self.assertEqual(response.get_data(), b'')
+        # nginx wouldn't say that the file is compressed
+        self.assertEqual(
+            self.controller.get_output_files_file_or_tarball.call_args[0][1],
+            [])
+
+
+class MetricsTest(EndpointTest):
+    def sample(self, name: str, **labels) -> float:
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def requests(self, route: str, status: int) -> float:
+        return self.sample('plz_http_request_duration_seconds_count',
+                           route=route, method='GET', status=str(status))
+
+    def test_times_requests_by_route(self):
+        self.controller.get_status.return_value = {'running': True}
+        route = '/executions/<execution_id>/status'
+        before = self.requests(route, 200)
+
+        self.client.get('/executions/some-id/status')
+        self.client.get('/executions/another-id/status')
+
+        self.assertEqual(self.requests(route, 200), before + 2)
+        metrics = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn(
+            'plz_http_request_duration_seconds_count{method="GET",'
+            'route="/executions/<execution_id>/status",status="200"}',
+            metrics)
+
+    def test_times_unknown_routes_together(self):
+        before = self.requests('unmatched', 404)
+
+        self.client.get('/some/path')
+        self.client.get('/another/path')
+
+        self.assertEqual(self.requests('unmatched', 404), before + 2)
+
+    def test_counts_streams_until_they_are_closed(self):
+        self.controller.get_logs_file_or_logs.return_value = \
+            iter([b'some logs'])
+        route = '/executions/<execution_id>/logs'
+        before = self.sample('plz_http_active_streams', route=route)
+
+        response = self.client.get(
+            '/executions/some-id/logs', buffered=False)
+        self.assertEqual(
+            self.sample('plz_http_active_streams', route=route), before + 1)
+        response.close()
+
+        self.assertEqual(
+            self.sample('plz_http_active_streams', route=route), before)
+
+
+class ProfilingTest(EndpointTest):
+    paths = ['/admin/profile?seconds=1',
+             '/admin/profile?seconds=1&format=pstats',
+             '/admin/memory?seconds=1']
+
+    def setUp(self):
+        super().setUp()
+        for name, profile in [('collapsed_stacks', 'stacks'),
+                              ('cprofile_stats', b'stats'),
+                              ('memory_growth', 'allocations')]:
+            patcher = mock.patch.object(
+                profiling, name, return_value=profile)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def access(self, enabled: bool, token: str = None):
+        return mock.patch.object(
+            main, 'profiling_access',
+            configuration.ProfilingAccess(enabled=enabled, token=token))
+
+    def test_endpoints_are_not_found_unless_enabled(self):
+        with self.access(enabled=False, token='secret'):
+            for path in self.paths:
+                response = self.client.get(
+                    path, headers={'Authorization': 'Bearer secret'})
+                self.assertEqual(response.status_code, 404, path)
+
+    def test_endpoints_need_the_token(self):
+        with self.access(enabled=True, token='secret'):
+            for path in self.paths:
+                for headers in [{}, {'Authorization': 'Bearer another'},
+                                {'Authorization': 'secret'}]:
+                    response = self.client.get(path, headers=headers)
+                    self.assertEqual(response.status_code, 401, path)
+                    self.assertEqual(
+                        response.headers['WWW-Authenticate'], 'Bearer')
+                response = self.client.get(
+                    path, headers={'Authorization': 'Bearer secret'})
+                self.assertEqual(response.status_code, 200, path)
+
+    def test_endpoints_are_open_without_a_token(self):
+        with self.access(enabled=True):
+            response = self.client.get('/admin/profile?seconds=1')
+
+        self.assertEqual(response.get_data(as_text=True), 'stacks')
+
+    def test_rejects_bad_durations(self):
+        with self.access(enabled=True):
+            for seconds in [0, -1, profiling.MAX_SECONDS + 1]:
+                response = self.client.get(
+                    f'/admin/profile?seconds={seconds}')
+                self.assertEqual(response.status_code, 400, seconds)
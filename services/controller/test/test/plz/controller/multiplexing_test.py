@@ -0,0 +1,50 @@
+import threading
+import unittest
+
+from plz.controller.multiplexing import EndOfStream, multiplex
+
+
+class IdleStream:
+    """Like the logs of a container that doesn't log anything, until it's
+       closed from another thread"""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.closed.wait()
+        raise StopIteration()
+
+    def close(self):
+        self.closed.set()
+
+
+class MultiplexTest(unittest.TestCase):
+    def test_yields_the_values_of_each_stream(self):
+        def fail():
+            raise OSError('Docker is gone')
+
+        values = {'a': [], 'b': []}
+        for key, value in multiplex({'a': lambda: iter([1, 2]), 'b': fail}):
+            values[key].append(value)
+
+        self.assertEqual(values['a'][:2], [1, 2])
+        self.assertIsInstance(values['a'][2], EndOfStream)
+        self.assertEqual(len(values['a']), 3)
+        self.assertEqual(
+            [type(value) for value in values['b']], [OSError])
+
+    def test_closes_the_streams_when_the_consumer_is_gone(self):
+        idle = IdleStream()
+        values = multiplex({
+            'idle': lambda: idle,
+            'finite': lambda: iter([1]),
+        })
+
+        self.assertEqual(next(values), ('finite', 1))
+        values.close()
+
+        self.assertTrue(idle.closed.wait(5))
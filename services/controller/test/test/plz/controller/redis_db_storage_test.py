@@ -0,0 +1,97 @@
+import unittest
+from unittest import mock
+
+import fakeredis
+
+from plz.controller import redis_db_storage
+from plz.controller.redis_db_storage import RedisDBStorage
+
+
+class RedisDBStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeStrictRedis()
+        self.db_storage = RedisDBStorage(self.redis)
+
+    def add(self, execution_id: str, finish_timestamp: int):
+        self.db_storage.add_finished_execution_id(
+            'some-user', 'some-project', execution_id, finish_timestamp)
+
+    def page(self, **kwargs):
+        return self.db_storage.retrieve_finished_execution_ids_page(
+            'some-user', 'some-project', **kwargs)
+
+    def test_lists_history_newest_first(self):
+        self.add('a', 10)
+        self.add('b', 30)
+        self.add('c', 20)
+
+        self.assertEqual(self.page(), ['b', 'c', 'a'])
+        self.assertEqual(self.page(limit=2), ['b', 'c'])
+        self.assertEqual(self.page(before=30), ['c', 'a'])
+        self.assertEqual(self.page(after=10), ['b', 'c'])
+
+    def test_pages_through_executions_finished_on_the_same_second(self):
+        # Like a sweep, or executions indexed without a finish timestamp
+        finish_timestamps = {'a': 20, 'b': 20, 'c': 20, 'd': 20, 'e': 20,
+                             'f': 30, 'g': 10}
+        for execution_id, finish_timestamp in finish_timestamps.items():
+            self.add(execution_id, finish_timestamp)
+
+        pages = [self.page(limit=2)]
+        while pages[-1]:
+            last = pages[-1][-1]
+            pages.append(self.page(
+                limit=2, before=finish_timestamps[last],
+                before_execution_id=last))
+
+        self.assertEqual(pages,
+                         [['f', 'e'], ['d', 'c'], ['b', 'a'], ['g'], []])
+
+    def test_pages_towards_newer_executions_finished_on_the_same_second(self):
+        finish_timestamps = {'a': 20, 'b': 20, 'c': 20, 'd': 20, 'e': 20,
+                             'f': 30, 'g': 10}
+        for execution_id, finish_timestamp in finish_timestamps.items():
+            self.add(execution_id, finish_timestamp)
+
+        pages = [self.page(limit=2, after=0)]
+        while pages[-1]:
+            first = pages[-1][0]
+            pages.append(self.page(
+                limit=2, after=finish_timestamps[first],
+                after_execution_id=first))
+
+        self.assertEqual(pages,
+                         [['a', 'g'], ['c', 'b'], ['e', 'd'], ['f'], []])
+
+    def test_pages_between_two_cursors(self):
+        for execution_id in ['a', 'b', 'c', 'd', 'e']:
+            self.add(execution_id, 20)
+
+        self.assertEqual(
+            self.page(limit=2, before=20, before_execution_id='e',
+                      after=20, after_execution_id='a'),
+            ['d', 'c'])
+        self.assertEqual(
+            self.page(limit=4, before=20, before_execution_id='d',
+                      after=20, after_execution_id='a'),
+            ['c', 'b'])
+
+    def test_lists_executions_after_one_finished_on_the_same_second(self):
+        for execution_id in ['a', 'b', 'c']:
+            self.add(execution_id, 20)
+        self.add('d', 30)
+
+        self.assertEqual(self.page(after=20, after_execution_id='b'),
+                         ['d', 'c'])
+        self.assertEqual(self.page(after=20), ['d'])
+
+    @mock.patch.object(redis_db_storage, '_MAX_SPANS_PER_TRACE', 2)
+    def test_keeps_the_most_recent_spans_for_a_while(self):
+        for name in ['build', 'pull', 'run']:
+            self.db_storage.add_execution_span('some-id', {'name': name})
+
+        self.assertEqual(
+            [span['name'] for span
+             in self.db_storage.retrieve_execution_spans('some-id')],
+            ['pull', 'run'])
+        self.assertGreater(self.redis.ttl('execution_spans#some-id'), 0)
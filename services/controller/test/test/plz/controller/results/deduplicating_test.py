@@ -0,0 +1,106 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from typing import Dict
+from unittest import mock
+
+from plz.controller.results.deduplicating import DeduplicatingResultsStorage
+from plz.controller.results.local import LocalResultsStorage
+from test.plz.controller.results.tarballs import output_tarball
+
+
+class DeduplicatingResultsStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.redis = mock.MagicMock()
+        self.db_storage = mock.Mock()
+        self.db_storage.retrieve_start_metadata.return_value = {
+            'user': 'some-user', 'project': 'some-project'}
+        self.storage = DeduplicatingResultsStorage(
+            self.redis, self.db_storage, self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def publish(self, execution_id: str, files: Dict[str, bytes]):
+        self.storage.publish(
+            execution_id, 0, logs=iter([]),
+            output_tarball=iter([output_tarball(files)]),
+            measures_tarball=iter([output_tarball({})]),
+            finish_timestamp=1540000000)
+
+    def read_output(self, execution_id: str) -> Dict[str, bytes]:
+        with self.storage.get(execution_id) as results:
+            self.assertIsNone(results.get_output_files_tarball_file())
+            tarball = b''.join(results.get_output_files_tarball())
+        files = {}
+        with tarfile.open(fileobj=io.BytesIO(tarball)) as tar:
+            for tarinfo in tar:
+                if tarinfo.isfile():
+                    files[tarinfo.name] = tar.extractfile(tarinfo).read()
+        return files
+
+    def test_stores_each_file_once(self):
+        checkpoint = os.urandom(100000)
+        self.publish('first', {'checkpoint': checkpoint, 'loss': b'0.5'})
+        self.publish('second', {'checkpoint': checkpoint, 'loss': b'0.4'})
+
+        blobs = [os.path.join(root, name) for root, _, names
+                 in os.walk(os.path.join(self.directory.name, '.blobs'))
+                 for name in names]
+        self.assertEqual(len(blobs), 3)
+        self.assertEqual(
+            sorted(os.stat(blob).st_nlink for blob in blobs), [2, 2, 3])
+        self.assertEqual(self.read_output('second'), {
+            'output/checkpoint': checkpoint, 'output/loss': b'0.4'})
+
+    def test_rebuilds_tarballs_tar_can_read(self):
+        files = {'a' * 200: b'long name', 'empty': b'', 'odd': b'x' * 513}
+        self.publish('some-id', files)
+
+        self.assertEqual(
+            self.read_output('some-id'),
+            {f'output/{name}': content for name, content in files.items()})
+
+    def test_removes_blobs_no_longer_used(self):
+        self.publish('first', {'shared': b'shared', 'own': b'first'})
+        self.publish('second', {'shared': b'shared', 'own': b'second'})
+
+        self.assertEqual(self.storage.remove_unused_blobs(), (0, 0))
+        shutil.rmtree(os.path.join(self.directory.name, 'first'))
+        self.assertEqual(self.storage.remove_unused_blobs(),
+                         (1, len(b'first')))
+        self.assertEqual(self.read_output('second'), {
+            'output/shared': b'shared', 'output/own': b'second'})
+
+    def test_collects_garbage_once_per_interval(self):
+        self.redis.set.side_effect = [True, None]
+        with mock.patch.object(self.storage, 'remove_unused_blobs',
+                               return_value=(0, 0)) as remove_unused_blobs:
+            self.storage.collect_garbage()
+            self.storage.collect_garbage()
+        self.assertEqual(remove_unused_blobs.call_count, 1)
+
+    def test_reads_results_published_before_deduplicating(self):
+        LocalResultsStorage(
+            self.redis, self.db_storage, self.directory.name).publish(
+            'some-id', 0, logs=iter([]), output_tarball=iter([b'tarball']),
+            measures_tarball=iter([output_tarball({})]),
+            finish_timestamp=1540000000)
+
+        with self.storage.get('some-id') as results:
+            self.assertEqual(b''.join(results.get_output_files_tarball()),
+                             b'tarball')
+
+    def test_reads_selected_output_files(self):
+        self.publish('some-id', {'checkpoint': b'weights', 'loss': b'0.5'})
+
+        with self.storage.get('some-id') as results:
+            tarball = b''.join(
+                results.get_output_files_members(['loss'], []))
+        with tarfile.open(fileobj=io.BytesIO(tarball)) as tar:
+            self.assertEqual(tar.getnames(), ['output/loss'])
+            self.assertEqual(tar.extractfile('output/loss').read(), b'0.5')
@@ -0,0 +1,236 @@
+import io
+import json
+import os
+import tarfile
+import tempfile
+import unittest
+from typing import Dict
+from unittest import mock
+
+from redis.exceptions import LockNotOwnedError
+
+from plz.controller.results import local
+from plz.controller.results.local import LocalResultsStorage
+from test.plz.controller.results.tarballs import measures_tarball, \
+    output_tarball
+
+
+class LocalResultsStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.redis = mock.MagicMock()
+        db_storage = mock.Mock()
+        db_storage.retrieve_start_metadata.return_value = {
+            'user': 'some-user', 'project': 'some-project'}
+        self.storage = LocalResultsStorage(
+            self.redis, db_storage, self.directory.name,
+            finished_results_cache_size=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def publish(self, execution_id: str, exit_status: int = 0):
+        self.storage.publish(
+            execution_id, exit_status, logs=iter([b'Some logs\n']),
+            output_tarball=iter([]), measures_tarball=iter([measures_tarball(
+                {'summary': b'{"accuracy": 0.9}', 'weights': b'\xff'})]),
+            finish_timestamp=1540000000)
+
+    def test_reads_finished_results_without_locking(self):
+        self.publish('some-id', exit_status=3)
+        self.redis.reset_mock()
+
+        with self.storage.get('some-id') as results:
+            self.assertEqual(results.get_status().exit_status, 3)
+            self.assertEqual(
+                results.get_stored_metadata()['finish_timestamp'],
+                1540000000)
+        self.redis.lock.assert_not_called()
+
+    def test_stores_metrics_of_each_stream(self):
+        self.publish('some-id')
+
+        with self.storage.get('some-id') as results:
+            stream_metrics = results.get_stored_metadata()['stream_metrics']
+        self.assertEqual(sorted(stream_metrics),
+                         ['logs', 'measures', 'output'])
+        self.assertEqual(stream_metrics['logs']['bytes'], len(b'Some logs\n'))
+        self.assertEqual(stream_metrics['output']['bytes'], 0)
+        self.assertGreaterEqual(stream_metrics['measures']['seconds'],
+                                stream_metrics['measures']['fetch_seconds'])
+
+    def test_results_appear_once_complete(self):
+        with self.storage.get('some-id') as results:
+            self.assertIsNone(results)
+        # Left by a publication that didn't finish
+        os.makedirs(os.path.join(self.directory.name, 'some-id'))
+        with self.storage.get('some-id') as results:
+            self.assertIsNone(results)
+
+        self.publish('some-id')
+
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.directory.name, 'some-id'))),
+            ['.finished', 'logs', 'measures.json', 'measures.tar',
+             'metadata.json', 'output.tar', 'status'])
+        self.assertTrue(self.storage.is_finished('some-id'))
+
+    @mock.patch.object(local, 'LOCK_TIMEOUT', 0)
+    def test_renews_the_lock_while_publishing(self):
+        lock = self.redis.lock.return_value
+
+        self.publish('some-id')
+
+        self.assertEqual(self.redis.lock.call_args[1]['thread_local'], False)
+        # For each chunk, and before moving the results into place
+        self.assertEqual(lock.reacquire.call_count, 3)
+        lock.release.assert_called_once()
+
+    def test_doesnt_finish_publishing_after_losing_the_lock(self):
+        self.redis.lock.return_value.reacquire.side_effect = \
+            LockNotOwnedError('Cannot reacquire a lock that\'s no longer '
+                              'owned')
+
+        with self.assertRaises(LockNotOwnedError):
+            self.publish('some-id')
+
+        self.assertFalse(self.storage.is_finished('some-id'))
+
+    def test_reads_cached_results_without_io(self):
+        self.publish('some-id')
+        with self.storage.get('some-id') as results:
+            results.get_status()
+            results.get_stored_metadata()
+
+        with mock.patch('builtins.open') as mock_open, \
+                mock.patch('os.path.exists') as mock_exists:
+            with self.storage.get('some-id') as results:
+                self.assertTrue(results.get_status().success)
+                metadata = results.get_stored_metadata()
+            mock_open.assert_not_called()
+            mock_exists.assert_not_called()
+
+        # Callers add to the metadata, that shouldn't change the cache
+        metadata['measures'] = {}
+        with self.storage.get('some-id') as results:
+            self.assertNotIn('measures', results.get_stored_metadata())
+
+    def test_forgets_the_least_recently_read_results(self):
+        for execution_id in ['a', 'b', 'c']:
+            self.publish(execution_id)
+            with self.storage.get(execution_id) as results:
+                results.get_status()
+
+        with mock.patch('os.path.exists', return_value=True) as mock_exists:
+            self.storage.get('c')
+            mock_exists.assert_not_called()
+            self.storage.get('a')
+            mock_exists.assert_called()
+
+    def test_reads_measures_converted_when_publishing(self):
+        self.publish('some-id')
+
+        with mock.patch.object(local, 'convert_measures_file_to_dict') \
+                as mock_convert:
+            with self.storage.get('some-id') as results:
+                measures = results.get_measures()
+            mock_convert.assert_not_called()
+        self.assertEqual(measures, {
+            'summary': {'accuracy': 0.9},
+            'weights': {'base64_bytes': '/w==\n'},
+        })
+
+    def test_converts_measures_again_for_another_version(self):
+        self.publish('some-id')
+        measures_path = os.path.join(
+            self.directory.name, 'some-id', 'measures.json')
+        with open(measures_path, 'w') as f:
+            json.dump({'version': 0, 'measures': {'stale': True}}, f)
+
+        with self.storage.get('some-id') as results:
+            self.assertEqual(results.get_measures()['summary'],
+                             {'accuracy': 0.9})
+        with open(measures_path) as f:
+            self.assertEqual(json.load(f)['version'],
+                             local.MEASURES_FORMAT_VERSION)
+
+    def test_stores_logs_and_tarballs_compressed(self):
+        for encoding, suffix in [('gzip', '.gz'), ('zstd', '.zst')]:
+            self.storage.compression_encoding = encoding
+            self.publish(encoding)
+
+            directory = os.path.join(self.directory.name, encoding)
+            self.assertEqual(
+                sorted(os.listdir(directory)),
+                ['.finished', f'logs{suffix}', 'measures.json',
+                 f'measures.tar{suffix}', 'metadata.json',
+                 f'output.tar{suffix}', 'status'])
+            with self.storage.get(encoding) as results:
+                self.assertEqual(b''.join(results.get_logs()),
+                                 b'Some logs\n')
+                self.assertEqual(results.get_measures()['summary'],
+                                 {'accuracy': 0.9})
+                self.assertIsNone(results.get_logs_file(['identity']))
+                logs_file = results.get_logs_file([encoding])
+            self.assertEqual(logs_file.encoding, encoding)
+            self.assertTrue(logs_file.path.endswith(f'logs{suffix}'))
+
+    def test_sends_uncompressed_files_whatever_the_encodings(self):
+        self.publish('some-id')
+
+        with self.storage.get('some-id') as results:
+            logs_file = results.get_logs_file()
+        self.assertIsNone(logs_file.encoding)
+        with open(logs_file.path, 'rb') as f:
+            self.assertEqual(f.read(), b'Some logs\n')
+
+    def publish_output(self, execution_id: str, files: Dict[str, bytes]):
+        self.storage.publish(
+            execution_id, 0, logs=iter([]),
+            output_tarball=iter([output_tarball(files)]),
+            measures_tarball=iter([measures_tarball({})]),
+            finish_timestamp=1540000000)
+
+    def read_members(self, execution_id: str, paths, globs) \
+            -> Dict[str, bytes]:
+        with self.storage.get(execution_id) as results:
+            tarball = b''.join(
+                results.get_output_files_members(paths, globs))
+        files = {}
+        with tarfile.open(fileobj=io.BytesIO(tarball)) as tar:
+            for tarinfo in tar:
+                files[tarinfo.name] = \
+                    tar.extractfile(tarinfo).read() if tarinfo.isfile() \
+                    else None
+        return files
+
+    def test_reads_selected_output_files_from_the_index(self):
+        files = {'checkpoints/1.pt': os.urandom(1000),
+                 'checkpoints/2.pt': os.urandom(3000),
+                 'a' * 200: b'long name', 'loss.csv': b'0.5\n'}
+        for encoding in [None, 'gzip', 'zstd']:
+            self.storage.compression_encoding = encoding
+            execution_id = encoding or 'uncompressed'
+            self.publish_output(execution_id, files)
+
+            with mock.patch.object(local.tar_members, 'select_from_stream') \
+                    as mock_select:
+                self.assertEqual(
+                    self.read_members(
+                        execution_id, ['checkpoints'], ['a*', '*.txt']),
+                    {'output/checkpoints': None,
+                     'output/checkpoints/1.pt': files['checkpoints/1.pt'],
+                     'output/checkpoints/2.pt': files['checkpoints/2.pt'],
+                     f'output/{"a" * 200}': b'long name'})
+                self.assertEqual(
+                    self.read_members(execution_id, ['loss.csv'], []),
+                    {'output/loss.csv': b'0.5\n'})
+            mock_select.assert_not_called()
+
+    def test_selects_output_files_without_an_index(self):
+        self.publish_output('some-id', {'loss.csv': b'0.5\n', 'b': b'b'})
+        os.remove(os.path.join(
+            self.directory.name, 'some-id', 'output.index.json'))
+
+        self.assertEqual(self.read_members('some-id', [], ['*.csv']),
+                         {'output/loss.csv': b'0.5\n'})
@@ -0,0 +1,172 @@
+import io
+import os
+import re
+import tarfile
+import threading
+import unittest
+from typing import Dict, List, Optional
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from plz.controller.api.exceptions import AbortedExecutionException
+from plz.controller.results import S3ResultsStorage
+from plz.controller.results.s3 import MIN_PART_SIZE
+from test.plz.controller.results.tarballs import tarball
+
+_PART_SIZE = MIN_PART_SIZE
+
+
+class StandInS3Client:
+    """Keeps objects in memory, with the calls of the boto3 client that
+       results use, and the same constraints on multipart uploads"""
+
+    def __init__(self):
+        self.objects: Dict[str, bytes] = {}
+        self.uploads: Dict[str, Dict[int, bytes]] = {}
+        self.calls: List[str] = []
+        self.fail_upload_part = False
+        self.lock = threading.Lock()
+
+    def _record(self, name: str):
+        with self.lock:
+            self.calls.append(name)
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        self._record('head_object')
+        return {'ContentLength': len(self._object(Key, '404'))}
+
+    def get_object(self, Bucket: str, Key: str,
+                   Range: Optional[str] = None) -> dict:
+        self._record('get_object')
+        content = self._object(Key, 'NoSuchKey')
+        if Range is not None:
+            start, end = re.fullmatch(r'bytes=(\d+)-(\d+)', Range).groups()
+            content = content[int(start):int(end) + 1]
+        return {'Body': io.BytesIO(content), 'ContentLength': len(content)}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes):
+        self._record('put_object')
+        self.objects[Key] = Body
+
+    def delete_object(self, Bucket: str, Key: str):
+        self._record('delete_object')
+        self.objects.pop(Key, None)
+
+    def create_multipart_upload(self, Bucket: str, Key: str) -> dict:
+        self._record('create_multipart_upload')
+        upload_id = f'upload-{len(self.uploads)}'
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str,
+                    PartNumber: int, Body: bytes) -> dict:
+        self._record('upload_part')
+        if self.fail_upload_part:
+            raise ClientError({'Error': {'Code': 'InternalError'}},
+                              'UploadPart')
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str,
+                                  MultipartUpload: dict):
+        self._record('complete_multipart_upload')
+        parts = self.uploads.pop(UploadId)
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        assert numbers == sorted(parts), 'Parts must be in order'
+        assert all(len(parts[n]) >= MIN_PART_SIZE for n in numbers[:-1]), \
+            'Parts must be at least 5 MB, except for the last'
+        self.objects[Key] = b''.join(parts[n] for n in numbers)
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str):
+        self._record('abort_multipart_upload')
+        del self.uploads[UploadId]
+
+    def _object(self, key: str, missing_code: str) -> bytes:
+        if key not in self.objects:
+            raise ClientError({'Error': {'Code': missing_code}}, 'GetObject')
+        return self.objects[key]
+
+
+class S3ResultsStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.client = StandInS3Client()
+        db_storage = mock.Mock()
+        db_storage.retrieve_start_metadata.return_value = {
+            'user': 'some-user', 'project': 'some-project'}
+        self.storage = S3ResultsStorage(
+            mock.MagicMock(), db_storage, self.client, 'some-bucket',
+            prefix='results', part_size=_PART_SIZE, max_concurrency=3)
+
+    def publish(self, execution_id: str, output: bytes):
+        self.storage.publish(
+            execution_id, 0, logs=iter([b'Some logs\n']),
+            output_tarball=_chunks(output),
+            measures_tarball=iter([tarball(
+                'measures', {'summary': b'{"accuracy": 0.9}'})]),
+            finish_timestamp=1540000000)
+
+    def test_uploads_large_files_in_parts(self):
+        output = tarball('output', {
+            'checkpoint': os.urandom(2 * _PART_SIZE + 1000),
+            'loss.csv': b'0.5\n'})
+        self.publish('some-id', output)
+
+        self.assertEqual(self.client.calls.count('upload_part'), 3)
+        self.assertEqual(self.client.uploads, {})
+        with self.storage.get('some-id') as results:
+            self.assertTrue(results.get_status().success)
+            self.assertEqual(b''.join(results.get_logs()), b'Some logs\n')
+            self.assertEqual(b''.join(results.get_output_files_tarball()),
+                             output)
+            self.assertEqual(results.get_measures(),
+                             {'summary': {'accuracy': 0.9}})
+            self.assertEqual(results.get_stored_metadata()['user'],
+                             'some-user')
+            selected = b''.join(
+                results.get_output_files_members(['loss.csv'], []))
+        with tarfile.open(fileobj=io.BytesIO(selected)) as tar:
+            self.assertEqual(tar.getnames(), ['output/loss.csv'])
+            self.assertEqual(tar.extractfile('output/loss.csv').read(),
+                             b'0.5\n')
+
+    def test_results_appear_once_complete(self):
+        self.assertFalse(self.storage.is_finished('some-id'))
+        self.client.fail_upload_part = True
+        with self.assertRaises(ClientError):
+            self.publish('some-id', os.urandom(2 * _PART_SIZE))
+        self.assertEqual(self.client.calls[-1], 'abort_multipart_upload')
+        self.assertFalse(self.storage.is_finished('some-id'))
+
+        self.client.fail_upload_part = False
+        self.publish('some-id', b'not a tarball')
+        self.assertTrue(self.storage.is_finished('some-id'))
+        self.assertNotIn('results/some-id/output.index.json',
+                         self.client.objects)
+
+    def test_reads_finished_results_once(self):
+        self.publish('some-id', b'')
+        with self.storage.get('some-id') as results:
+            results.get_status()
+            results.get_measures()
+
+        self.client.calls.clear()
+        with self.storage.get('some-id') as results:
+            results.get_status()
+            results.get_measures()
+        self.assertEqual(self.client.calls, [])
+
+    def test_tombstones_raise(self):
+        self.storage.write_tombstone('some-id', {'reason': 'Killed'})
+        # Published later, by a worker that didn't know
+        self.publish('some-id', b'')
+
+        with self.storage.get('some-id') as results:
+            with self.assertRaises(AbortedExecutionException) as cm:
+                results.get_logs()
+        self.assertEqual(cm.exception.tombstone, {'reason': 'Killed'})
+
+
+def _chunks(content: bytes):
+    for i in range(0, len(content), 1024 * 1024):
+        yield content[i:i + 1024 * 1024]
@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+from typing import Iterator, List
+
+from plz.controller.results import streams
+
+
+class CollectConcurrentlyTest(unittest.TestCase):
+    def test_collects_streams_at_the_same_time(self):
+        # Each stream waits for the others to start, so this would time out
+        # if they were collected one after another
+        barrier = threading.Barrier(3, timeout=5)
+
+        def chunks(name: str) -> Iterator[bytes]:
+            barrier.wait()
+            yield name.encode('ascii')
+            yield b'!'
+
+        collected, metrics = streams.collect_concurrently({
+            name: (chunks(name), b''.join)
+            for name in ('logs', 'output', 'measures')})
+
+        self.assertEqual(collected, {
+            'logs': b'logs!', 'output': b'output!', 'measures': b'measures!'})
+        self.assertEqual(metrics['output']['bytes'], len(b'output!'))
+        self.assertGreaterEqual(metrics['output']['seconds'],
+                                metrics['output']['fetch_seconds'])
+
+    def test_fetches_a_bounded_number_of_chunks_ahead(self):
+        fetched: List[int] = []
+        collecting = threading.Event()
+
+        def chunks() -> Iterator[bytes]:
+            for i in range(100):
+                fetched.append(i)
+                yield b'x'
+
+        def collect(chunks: Iterator[bytes]) -> int:
+            collecting.wait(timeout=5)
+            return sum(len(chunk) for chunk in chunks)
+
+        def check_and_collect(chunks: Iterator[bytes]) -> int:
+            # Give the fetcher time to fill the buffer, and more if it could
+            time.sleep(0.3)
+            # The buffer, and the chunk waiting to be put in it
+            self.assertLessEqual(len(fetched), 4 + 1)
+            collecting.set()
+            return 0
+
+        collected, _ = streams.collect_concurrently(
+            {'output': (chunks(), collect),
+             'logs': (iter([]), check_and_collect)},
+            buffer_chunks=4)
+
+        self.assertEqual(collected['output'], 100)
+
+    def test_cancels_the_other_streams_when_one_fails(self):
+        def failing() -> Iterator[bytes]:
+            yield b'x'
+            raise ConnectionError('Worker is gone')
+
+        def endless() -> Iterator[bytes]:
+            while True:
+                yield b'x'
+
+        def collect(chunks: Iterator[bytes]):
+            for _ in chunks:
+                pass
+
+        with self.assertRaises(ConnectionError):
+            streams.collect_concurrently({
+                'logs': (failing(), collect),
+                'output': (endless(), collect)})
+
+    def test_stops_fetching_once_the_collector_is_done(self):
+        closed = threading.Event()
+
+        def chunks() -> Iterator[bytes]:
+            try:
+                while True:
+                    yield b'x'
+            finally:
+                closed.set()
+
+        def first(chunks: Iterator[bytes]) -> bytes:
+            return next(chunks)
+
+        collected, _ = streams.collect_concurrently(
+            {'output': (chunks(), first)})
+
+        self.assertEqual(collected['output'], b'x')
+        self.assertTrue(closed.is_set())
+
+    def test_raises_when_the_collector_fails(self):
+        def fail(chunks: Iterator[bytes]):
+            raise OSError('No space left on device')
+
+        with self.assertRaises(OSError):
+            streams.collect_concurrently(
+                {'output': (iter([b'x'] * 100), fail)}, buffer_chunks=1)
@@ -0,0 +1,31 @@
+import io
+import os
+import tarfile
+from typing import Dict
+
+
+def tarball(directory: str, files: Dict[str, bytes]) -> bytes:
+    """A tarball with the files in the directory, as workers send them"""
+    tarball_bytes = io.BytesIO()
+    with tarfile.open(fileobj=tarball_bytes, mode='w') as tar:
+        # With the directories, as workers tar them up
+        directories = {directory, *(
+            os.path.join(directory, os.path.dirname(name))
+            for name in files if os.path.dirname(name))}
+        for name in sorted(directories):
+            tarinfo = tarfile.TarInfo(name)
+            tarinfo.type = tarfile.DIRTYPE
+            tar.addfile(tarinfo)
+        for name, content in files.items():
+            tarinfo = tarfile.TarInfo(f'{directory}/{name}')
+            tarinfo.size = len(content)
+            tar.addfile(tarinfo, io.BytesIO(content))
+    return tarball_bytes.getvalue()
+
+
+def output_tarball(files: Dict[str, bytes]) -> bytes:
+    return tarball('output', files)
+
+
+def measures_tarball(files: Dict[str, bytes]) -> bytes:
+    return tarball('measures', files)
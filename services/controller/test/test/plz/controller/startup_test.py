@@ -0,0 +1,103 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+_SRC_DIRECTORY = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', '..', 'src'))
+
+# Each gunicorn worker imports the controller when it starts, so importing
+# it shouldn't take much longer than importing the libraries it uses. Both
+# are timed on the same machine, so that a slow or busy one doesn't fail
+_LIBRARIES = ['boto3', 'docker', 'flask', 'msgpack', 'prometheus_client',
+              'pyhocon', 'redis', 'requests']
+IMPORT_TIME_FACTOR = 2
+# For what the controller does on top of the libraries
+IMPORT_TIME_SLACK_SECONDS = 1
+# Each import is timed a few times, and the fastest is taken
+_IMPORT_TIMINGS = 3
+
+# AWS and docker are unreachable (redis is, unless it runs locally)
+_CONFIGURATION = '''
+redis_host = "127.0.0.1"
+instances {
+  provider = aws-ec2
+  region = eu-west-1
+  group_name = test
+}
+images {
+  provider = aws-ecr
+  region = eu-west-1
+  repository = plz/builds
+  docker_host = "tcp://127.0.0.1:1"
+}
+assumptions.ecr_login_validity_in_minutes = 60
+'''
+
+
+class StartupTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        configuration = _CONFIGURATION + f'''
+            data_dir = "{self.directory.name}/data"
+            results.directory = "{self.directory.name}/results"
+        '''
+        self.environment = {
+            **os.environ,
+            'CONFIGURATION': configuration,
+            'PYTHONPATH': os.pathsep.join([_SRC_DIRECTORY, *sys.path]),
+            # Requests to AWS fail to connect, without retrying
+            'AWS_ACCESS_KEY_ID': 'unused',
+            'AWS_SECRET_ACCESS_KEY': 'unused',
+            'AWS_MAX_ATTEMPTS': '1',
+            'HTTPS_PROXY': 'http://127.0.0.1:1',
+        }
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_python(self, code: str) -> str:
+        return subprocess.run(
+            [sys.executable, '-c', code], env=self.environment,
+            stdout=subprocess.PIPE, check=True, timeout=120,
+        ).stdout.decode('utf-8')
+
+    def time_python(self, code: str) -> float:
+        seconds = []
+        for _ in range(_IMPORT_TIMINGS):
+            start = time.monotonic()
+            self.run_python(code)
+            seconds.append(time.monotonic() - start)
+        return min(seconds)
+
+    def test_imports_within_budget_when_services_are_unreachable(self):
+        libraries_seconds = self.time_python(
+            'import ' + ', '.join(_LIBRARIES))
+        controller_seconds = self.time_python('import plz.controller.main')
+        self.assertLess(
+            controller_seconds,
+            IMPORT_TIME_FACTOR * libraries_seconds +
+            IMPORT_TIME_SLACK_SECONDS,
+            f'Importing the libraries took {libraries_seconds:.2f}s')
+
+    def test_is_up_but_not_ready_when_services_are_unreachable(self):
+        output = self.run_python('\n'.join([
+            'import json',
+            'from plz.controller.main import app',
+            'client = app.test_client()',
+            'ready = client.get("/ready")',
+            'print(json.dumps([client.get("/ping").status_code,',
+            '                  ready.status_code, ready.get_json()]))',
+        ]))
+        ping_code, ready_code, readiness = json.loads(
+            output.splitlines()[-1])
+        self.assertEqual(ping_code, 200)
+        self.assertEqual(ready_code, 503)
+        self.assertFalse(readiness['ready'])
+        for name in ['images', 'instance_provider']:
+            self.assertFalse(readiness['dependencies'][name]['ready'])
+            self.assertIn('error', readiness['dependencies'][name])
+        self.assertTrue(readiness['dependencies']['results_storage']['ready'])